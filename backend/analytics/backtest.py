@@ -0,0 +1,147 @@
+# Concentrated-liquidity position backtester (comments in English).
+#
+# Replays a pool's hourly price (sqrtPriceX96, active liquidity) and approx fees for many
+# candidate ranges at once. Per range and hour the position earns
+#     fees_h * L / (L + pool_liquidity_h)   while tick_lower <= tick_h < tick_upper
+# and its token amounts follow the usual v3 formulas for the hour's sqrt price. Prices are
+# hourly snapshots, so intra-hour excursions out of range are not seen.
+#
+# Units: sqrt prices and liquidity are raw (token1 wei per token0 wei); fees are the pool's
+# approx_fee_token0/1, the swapped amounts times the fee tier (backend/db/fees.py), in token units;
+# capital, values and PnL are in token1 units.
+
+import math
+from typing import Dict, Optional, Sequence, Tuple
+import numpy as np
+
+MIN_TICK, MAX_TICK = -887272, 887272
+Q96 = 2.0 ** 96
+# Ranges x hours evaluated per chunk; bounds the temporary arrays (~8 bytes each)
+CHUNK_CELLS = 2_000_000
+
+class HourSeries:
+    """Dense hourly series: one entry per hour from `start`, prices forward-filled, missing fees = 0."""
+    __slots__ = ("start", "sqrt_p", "liquidity", "fee0", "fee1")
+
+    def __init__(self, start: int, sqrt_p: np.ndarray, liquidity: np.ndarray, fee0: np.ndarray, fee1: np.ndarray):
+        self.start, self.sqrt_p, self.liquidity, self.fee0, self.fee1 = start, sqrt_p, liquidity, fee0, fee1
+
+    def __len__(self):
+        return len(self.sqrt_p)
+
+def _floats(vals: Sequence[Optional[float]]) -> np.ndarray:
+    return np.array([np.nan if v is None else v for v in vals], dtype=np.float64)
+
+def densify(hours: Sequence[int], sqrt_price_x96: Sequence[Optional[float]], liquidity: Sequence[Optional[float]],
+            fee0: Sequence[Optional[float]], fee1: Sequence[Optional[float]]) -> Optional[HourSeries]:
+    """
+    Sparse rows (hour id ascending; None where a table had no row) onto a dense hourly grid.
+    Hours before the first known price are dropped. Returns None without any price.
+    """
+    h = np.asarray(hours, dtype=np.int64)
+    sp = _floats(sqrt_price_x96) / Q96
+    sp[sp <= 0] = np.nan
+    if not len(h) or np.isnan(sp).all():
+        return None
+    first = h[np.argmax(~np.isnan(sp))]
+    keep = h >= first
+    h = h[keep] - first
+    n = int(h[-1]) + 1
+
+    def grid(v: np.ndarray, fill_forward: bool) -> np.ndarray:
+        out = np.full(n, np.nan)
+        out[h] = v[keep]
+        if fill_forward:
+            idx = np.where(np.isnan(out), 0, np.arange(n))
+            np.maximum.accumulate(idx, out=idx)
+            out = out[idx]
+        return np.nan_to_num(out, nan=0.0)
+
+    return HourSeries(int(first), grid(sp, True), grid(_floats(liquidity), True),
+                      grid(_floats(fee0), False), grid(_floats(fee1), False))
+
+def tick_at(sqrt_p: np.ndarray) -> np.ndarray:
+    return np.floor(np.log(sqrt_p) * 2 / math.log(1.0001)).astype(np.int64)
+
+def sqrt_at(ticks: np.ndarray) -> np.ndarray:
+    return np.power(1.0001, np.asarray(ticks, dtype=np.float64) / 2)
+
+def align_ranges(lower: Sequence[int], upper: Sequence[int], tick_spacing: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Snap ranges outward to multiples of tick_spacing, at least one spacing wide, within the tick bounds."""
+    ts = int(tick_spacing)
+    lo = np.floor_divide(np.asarray(lower, dtype=np.int64), ts) * ts
+    hi = -np.floor_divide(-np.asarray(upper, dtype=np.int64), ts) * ts
+    lo = np.clip(lo, -(MAX_TICK // ts) * ts, (MAX_TICK // ts - 1) * ts)
+    hi = np.clip(np.maximum(hi, lo + ts), lo + ts, (MAX_TICK // ts) * ts)
+    return lo, hi
+
+def ranges_around(tick: int, widths_pct: Sequence[float], skews: Sequence[float], tick_spacing: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ranges centred on `tick`: width w spans price * (1 +/- w%) in log space, skew in [-1, 1]
+    shifts the centre by that fraction of the half-width (positive = above the price).
+    """
+    w = np.asarray(widths_pct, dtype=np.float64)
+    s = np.asarray(skews, dtype=np.float64)
+    half = np.log1p(w / 100.0) / math.log(1.0001)
+    half, s = np.meshgrid(half, s, indexing="ij")
+    centre = tick + s * half
+    return align_ranges(np.floor(centre - half).ravel(), np.ceil(centre + half).ravel(), tick_spacing)
+
+def amounts(s: np.ndarray, sa: np.ndarray, sb: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Token amounts (raw) per unit of liquidity at sqrt price s for ranges [sa, sb)."""
+    sc = np.clip(s, sa, sb)
+    return (sb - sc) / (sc * sb), sc - sa
+
+def backtest(series: HourSeries, lower: np.ndarray, upper: np.ndarray, dec0: int, dec1: int,
+             capital: float = 1.0, chunk_cells: int = CHUNK_CELLS) -> Dict[str, np.ndarray]:
+    """
+    Evaluate ranges (aligned ticks) over the whole series for a position worth `capital` token1
+    at the first hour. Returns per-range arrays.
+    """
+    T = len(series)
+    R = len(lower)
+    sa, sb = sqrt_at(lower), sqrt_at(upper)
+    s0, s1 = series.sqrt_p[0], series.sqrt_p[-1]
+    scale1 = 10.0 ** dec1
+    to_human = 10.0 ** (dec0 - dec1)
+
+    # Liquidity bought with the capital at the start price, and the amounts it holds then / at the end
+    x0, y0 = amounts(s0, sa, sb)
+    L = capital * scale1 / (x0 * s0 * s0 + y0)
+    x1, y1 = amounts(s1, sa, sb)
+    value_end = L * (x1 * s1 * s1 + y1) / scale1
+    hold_end = L * (x0 * s1 * s1 + y0) / scale1
+
+    # Fee share and time in range need the full ranges x hours grid; do it in row chunks
+    ticks = tick_at(series.sqrt_p)
+    pool_l = series.liquidity
+    fees0 = np.empty(R)
+    fees1 = np.empty(R)
+    in_range = np.empty(R)
+    step = max(1, chunk_cells // max(T, 1))
+    for i in range(0, R, step):
+        j = min(R, i + step)
+        mask = (ticks[None, :] >= lower[i:j, None]) & (ticks[None, :] < upper[i:j, None])
+        l = L[i:j, None]
+        share = np.where(mask, l / (l + pool_l[None, :]), 0.0)
+        fees0[i:j] = share @ series.fee0
+        fees1[i:j] = share @ series.fee1
+        in_range[i:j] = mask.mean(axis=1)
+
+    price_end = s1 * s1 * to_human
+    fees_value = fees0 * price_end + fees1
+    years = T / 8760.0
+    return {
+        "tick_lower": lower, "tick_upper": upper,
+        "fees_token0": fees0, "fees_token1": fees1, "fees_value": fees_value,
+        "in_range": in_range,
+        "il": value_end / hold_end - 1.0,
+        "value": value_end,
+        "pnl": value_end + fees_value - capital,
+        "pnl_vs_hold": value_end + fees_value - hold_end,
+        "fee_apr": fees_value / capital / years if years > 0 else np.zeros(R),
+    }
+
+def price_of(sqrt_p: float, dec0: int, dec1: int) -> float:
+    """Human price (token1 per token0) of a raw sqrt price."""
+    return sqrt_p * sqrt_p * 10.0 ** (dec0 - dec1)
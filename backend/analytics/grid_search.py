@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# Range-strategy grid search across all pools of a pair (comments in English).
+#
+# A strategy is (range width, re-centering rule) applied to one pool, so fee tiers are searched
+# by running the grid on every v3/v4 pool of the pair. Rules:
+#   static   - never re-center
+#   exit:H   - re-center on the current price after H consecutive hours out of range
+#   every:H  - re-center every H hours
+# Re-centering swaps about half the position through the pool: it costs fee_tier/2 of the
+# position value plus --extra-cost-bps (fee tier unit: backend/db/fees.py). Fees are valued in
+# token1 at the hour they are earned.
+#
+# Series of all pools are packed into one shared-memory block; a process pool (spawn) runs one
+# pool per task against read-only views of it, so a sweep uses every core.
+#
+#   python -m backend.analytics.grid_search --pair 0xA0b8.../0xC02a... --lookback-hours 8760
+#   python -m backend.analytics.grid_search --all --workers 16 --out grid.json
+
+import os, sys, json, time, asyncio, argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from backend.analytics.backtest import HourSeries, amounts, align_ranges, sqrt_at, tick_at
+from backend.db.fees import fee_fraction
+
+ROOT = Path("/Users/axel/Dev/open-source/uniswap-lp-analytics")
+
+DEFAULT_WIDTHS = (1, 2, 3, 5, 7.5, 10, 15, 20, 30, 50, 100)
+DEFAULT_RULES = ("static", "exit:1", "exit:6", "exit:24", "every:24", "every:168")
+FIELDS = ("sqrt_p", "liquidity", "fee0", "fee1")
+
+def parse_rule(rule: str) -> Tuple[int, int]:
+    """Rule string -> (exit_after hours, period hours); 0 disables either."""
+    kind, _, n = rule.partition(":")
+    if kind == "static" and not n:
+        return 0, 0
+    if kind in ("exit", "every") and n.isdigit() and int(n) > 0:
+        return (int(n), 0) if kind == "exit" else (0, int(n))
+    raise ValueError(f"Invalid rule: {rule!r} (static, exit:H, every:H)")
+
+def simulate(series: HourSeries, widths_pct: Sequence[float], rules: Sequence[str], tick_spacing: int,
+             dec0: int, dec1: int, fee_tier: int, capital: float = 1.0, extra_cost_bps: float = 0.0) -> Dict[str, np.ndarray]:
+    """
+    All width x rule strategies for one pool, stepped hour by hour and vectorized across strategies
+    (re-centering makes the path strategy-dependent, so hours can't be vectorized).
+    """
+    w = np.repeat(np.asarray(widths_pct, dtype=np.float64), len(rules))
+    parsed = [parse_rule(r) for r in rules] * len(widths_pct)
+    exit_after = np.array([p[0] for p in parsed], dtype=np.int64)
+    period = np.array([p[1] for p in parsed], dtype=np.int64)
+    half = np.log1p(w / 100.0) / np.log(1.0001)
+    S, T = len(w), len(series)
+
+    sp = series.sqrt_p
+    ticks = tick_at(sp)
+    price_h = sp * sp * 10.0 ** (dec0 - dec1)
+    fee_value = series.fee0 * price_h + series.fee1
+    pool_l = series.liquidity
+    scale1 = 10.0 ** dec1
+    keep = 1.0 - fee_fraction(fee_tier) / 2 - extra_cost_bps / 10000.0
+
+    def value_per_l(s, lo, hi):
+        x, y = amounts(s, sqrt_at(lo), sqrt_at(hi))
+        return x * s * s + y
+
+    lo, hi = align_ranges(np.floor(ticks[0] - half), np.ceil(ticks[0] + half), tick_spacing)
+    L = capital * scale1 / value_per_l(sp[0], lo, hi)
+    x_hold, y_hold = amounts(sp[0], sqrt_at(lo), sqrt_at(hi))
+    x_hold, y_hold = x_hold * L, y_hold * L
+
+    fees = np.zeros(S)
+    in_hours = np.zeros(S, dtype=np.int64)
+    out_run = np.zeros(S, dtype=np.int64)
+    last_rb = np.zeros(S, dtype=np.int64)
+    n_rb = np.zeros(S, dtype=np.int64)
+    can_exit, can_period = exit_after > 0, period > 0
+    for t in range(T):
+        tick = ticks[t]
+        inr = (tick >= lo) & (tick < hi)
+        if fee_value[t]:
+            fees += np.where(inr, L / (L + pool_l[t]), 0.0) * fee_value[t]
+        in_hours += inr
+        out_run = np.where(inr, 0, out_run + 1)
+        rb = (can_exit & (out_run >= exit_after)) | (can_period & (t - last_rb >= period))
+        if rb.any():
+            s = sp[t]
+            value = L[rb] * value_per_l(s, lo[rb], hi[rb]) * keep
+            lo[rb], hi[rb] = align_ranges(np.floor(tick - half[rb]), np.ceil(tick + half[rb]), tick_spacing)
+            L[rb] = value / value_per_l(s, lo[rb], hi[rb])
+            out_run[rb] = 0
+            last_rb[rb] = t
+            n_rb[rb] += 1
+
+    s1 = sp[-1]
+    value_end = L * value_per_l(s1, lo, hi) / scale1
+    hold_end = (x_hold * s1 * s1 + y_hold) / scale1
+    years = T / 8760.0
+    return {
+        "width_pct": w, "fees_value": fees, "value": value_end,
+        "pnl": value_end + fees - capital, "pnl_vs_hold": value_end + fees - hold_end,
+        "in_range": in_hours / max(T, 1), "rebalances": n_rb,
+        "fee_apr": fees / capital / years if years > 0 else np.zeros(S),
+    }
+
+# ---------- shared memory + process pool ----------
+def pack(series: Sequence[HourSeries]) -> Tuple[shared_memory.SharedMemory, List[Tuple[int, int]]]:
+    """Copy every series into one shared block laid out as FIELDS x total hours; returns (block, offsets)."""
+    total = sum(len(s) for s in series)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(FIELDS) * total * 8))
+    buf = np.ndarray((len(FIELDS), total), dtype=np.float64, buffer=shm.buf)
+    offsets = []
+    off = 0
+    for s in series:
+        n = len(s)
+        for k, f in enumerate(FIELDS):
+            buf[k, off:off + n] = getattr(s, f)
+        offsets.append((off, n))
+        off += n
+    return shm, offsets
+
+def _pool_task(shm_name: str, total: int, off: int, n: int, start: int, widths, rules, tick_spacing, dec0, dec1,
+               fee_tier, capital, extra_cost_bps) -> Dict[str, List]:
+    # Spawned workers share the parent's resource tracker; the parent unlinks the block
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        buf = np.ndarray((len(FIELDS), total), dtype=np.float64, buffer=shm.buf)
+        res = simulate(HourSeries(start, *(buf[k, off:off + n] for k in range(len(FIELDS)))),
+                       widths, rules, tick_spacing, dec0, dec1, fee_tier, capital, extra_cost_bps)
+        del buf  # views must be gone before close()
+        return {k: v.tolist() for k, v in res.items()}
+    finally:
+        shm.close()
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def executor(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """Process pool shared by API requests (spawned once, one worker per core by default)."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=mp.get_context("spawn"))
+    return _executor
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+async def run_grid(pools: Sequence[Dict[str, Any]], series: Dict[str, HourSeries], widths: Sequence[float],
+                   rules: Sequence[str], capital: float = 1.0, extra_cost_bps: float = 0.0,
+                   pool_exec: Optional[ProcessPoolExecutor] = None) -> List[Dict[str, Any]]:
+    """
+    pools: {"id", "fee_tier_bps", "tick_spacing", "dec0", "dec1", ...}; pools without a series are skipped.
+    Returns one row per (pool, width, rule), unsorted.
+    """
+    todo = [p for p in pools if p["id"] in series]
+    if not todo:
+        return []
+    shm, offsets = pack([series[p["id"]] for p in todo])
+    total = sum(n for _, n in offsets)
+    loop = asyncio.get_running_loop()
+    ex = pool_exec or executor()
+    try:
+        futs = [loop.run_in_executor(ex, _pool_task, shm.name, total, off, n, series[p["id"]].start, list(widths), list(rules),
+                                     p["tick_spacing"], p["dec0"], p["dec1"], p["fee_tier_bps"], capital, extra_cost_bps)
+                for p, (off, n) in zip(todo, offsets)]
+        results = await asyncio.gather(*futs)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    rows = []
+    for p, res in zip(todo, results):
+        for k in range(len(res["width_pct"])):
+            rows.append({
+                "pool_id": p["id"], "version": p.get("version"), "fee_tier_bps": p["fee_tier_bps"],
+                "width_pct": res["width_pct"][k], "rule": rules[k % len(rules)],
+                **{f: res[f][k] for f in ("fees_value", "value", "pnl", "pnl_vs_hold", "in_range", "rebalances", "fee_apr")},
+            })
+    return rows
+
+def rank(rows: List[Dict[str, Any]], sort_by: str = "pnl", top: Optional[int] = None) -> List[Dict[str, Any]]:
+    out = sorted(rows, key=lambda r: -r[sort_by])
+    return out[:top] if top else out
+
+# ---------- batch job ----------
+async def _load(engine, pair: Optional[Tuple[str, str]], versions: Sequence[int], th: int, until: int):
+    from sqlalchemy import text
+    from backend.analytics.series import SQL_POOLS_SERIES, series_by_pool, series_params, with_cold
+    from backend.ingestion.backfill_price_hour import SQL_SELECT_POOLS_BY_PAIR_ADDRS
+    from backend.db.pairs import pair_key
+
+    async with engine.connect() as conn:
+        if pair:
+            ids: List[str] = []
+            for v in versions:
+                rows = (await conn.execute(SQL_SELECT_POOLS_BY_PAIR_ADDRS, {"version": v, "pair_key": pair_key(*pair)})).all()
+                ids.extend(r[0] for r in rows)
+            cond, params = "p.id = any(:ids)", {"ids": ids}
+        else:
+            cond, params = "p.version = any(:versions)", {"versions": list(versions)}
+        pools = [dict(r) for r in (await conn.execute(text(f"""
+          select p.id, p.version, p.token0_id, p.token1_id, p.fee_tier_bps, p.tick_spacing,
+                 t0.decimals as dec0, t1.decimals as dec1, t0.symbol as sym0, t1.symbol as sym1
+          from pools p join tokens t0 on t0.id = p.token0_id join tokens t1 on t1.id = p.token1_id
+          where {cond}
+        """), params)).mappings().all()]
+        series: Dict[str, HourSeries] = {}
+        ids = [p["id"] for p in pools]
+        for i in range(0, len(ids), 200):
+            rows = (await conn.execute(SQL_POOLS_SERIES, series_params(ids[i:i + 200], th, until))).mappings().all()
+            series.update(series_by_pool(with_cold(rows, ids[i:i + 200], th, until)))
+    return pools, series
+
+async def main():
+    from dotenv import load_dotenv
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    ap = argparse.ArgumentParser(description="Grid-search LP range strategies across pools")
+    ap.add_argument("--pair", default=None, help="tokenA/tokenB addresses (all pools of the pair)")
+    ap.add_argument("--all", action="store_true", help="Every pool; strategies are ranked per pair")
+    ap.add_argument("--versions", default="3,4")
+    ap.add_argument("--lookback-hours", type=int, default=24 * 90)
+    ap.add_argument("--widths", default=",".join(str(w) for w in DEFAULT_WIDTHS), help="Range widths in +/- percent")
+    ap.add_argument("--rules", default=",".join(DEFAULT_RULES))
+    ap.add_argument("--capital", type=float, default=1.0, help="Position value in token1")
+    ap.add_argument("--extra-cost-bps", type=float, default=0.0, help="Re-centering cost on top of half the fee tier")
+    ap.add_argument("--sort-by", default="pnl", choices=["pnl", "pnl_vs_hold", "fees_value", "fee_apr", "in_range"])
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--workers", type=int, default=None, help="Processes (default: all cores)")
+    ap.add_argument("--out", default=None, help="Write ranked strategies as JSON")
+    args = ap.parse_args()
+    if bool(args.pair) == bool(args.all):
+        print("ERROR: pass exactly one of --pair or --all", file=sys.stderr); sys.exit(2)
+
+    load_dotenv(ROOT / ".env", override=True)
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        print("ERROR: DATABASE_URL is not set", file=sys.stderr); sys.exit(2)
+    widths = [float(x) for x in args.widths.split(",") if x]
+    rules = [r for r in args.rules.split(",") if r]
+    for r in rules:
+        parse_rule(r)
+    pair = None
+    if args.pair:
+        a, _, b = args.pair.lower().partition("/")
+        pair = (a, b)
+
+    until = int(time.time() // 3600)
+    engine = create_async_engine(db_url, future=True)
+    t0 = time.perf_counter()
+    pools, series = await _load(engine, pair, [int(v) for v in args.versions.split(",")], until - args.lookback_hours, until)
+    await engine.dispose()
+    print(f"loaded {len(series)}/{len(pools)} pools with price history in {time.perf_counter() - t0:.1f}s")
+
+    t1 = time.perf_counter()
+    ex = ProcessPoolExecutor(max_workers=args.workers or os.cpu_count(), mp_context=mp.get_context("spawn"))
+    try:
+        rows = await run_grid(pools, series, widths, rules, args.capital, args.extra_cost_bps, ex)
+    finally:
+        ex.shutdown()
+    print(f"{len(rows)} strategies in {time.perf_counter() - t1:.1f}s on {ex._max_workers} processes")
+
+    by_pool = {p["id"]: p for p in pools}
+    groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for r in rows:
+        p = by_pool[r["pool_id"]]
+        groups.setdefault((p["token0_id"], p["token1_id"]), []).append(r)
+    out = []
+    for (t0_id, t1_id), grp in groups.items():
+        p = by_pool[grp[0]["pool_id"]]
+        best = rank(grp, args.sort_by, args.top)
+        out.append({"token0": t0_id, "token1": t1_id, "pair": f"{p['sym0']}/{p['sym1']}", "strategies": best})
+        print(f"\n{p['sym0']}/{p['sym1']}  ({len(grp)} strategies)")
+        for r in best:
+            print(f"  v{r['version']} fee={fee_fraction(r['fee_tier_bps']) * 100:.2f}% width=+/-{r['width_pct']:g}% {r['rule']:<10} "
+                  f"pnl={r['pnl']:.4f} vs_hold={r['pnl_vs_hold']:.4f} fees={r['fees_value']:.4f} "
+                  f"in_range={r['in_range']:.2f} rebalances={r['rebalances']}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(out, indent=2), encoding="utf-8")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+# Hourly price + fee series per pool for the analytics code (comments in English).
+# pool_price_hour and pool_hour_data are full-joined on the hour: prices exist for hours with a
+# price snapshot, fees for hours with swaps. Hours below a table's archive cutoff come from the
+# cold tier (backend/db/archive.py): bind series_params() and pass the rows through with_cold().
+
+from typing import Any, Dict, List, Sequence
+from sqlalchemy import text, bindparam, Integer, String
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from backend.analytics.backtest import HourSeries, densify
+from backend.db import archive
+
+SQL_POOLS_SERIES = text("""
+  select coalesce(p.pool_id, d.pool_id) as pool_id, coalesce(p.h, d.h) as h,
+         p.sqrt_price_x96, p.liquidity, d.fee0, d.fee1
+  from (
+    select pool_id, hour_start_unix as h, sqrt_price_x96::float8 as sqrt_price_x96, liquidity::float8 as liquidity
+    from pool_price_hour
+    where pool_id = any(:pool_ids) and hour_start_unix >= :th_price and hour_start_unix <= :until
+  ) p
+  full join (
+    select pool_id, hour_start_unix as h, approx_fee_token0::float8 as fee0, approx_fee_token1::float8 as fee1
+    from pool_hour_data
+    where pool_id = any(:pool_ids) and hour_start_unix >= :th_fee and hour_start_unix <= :until
+  ) d on d.pool_id = p.pool_id and d.h = p.h
+  order by 1, 2
+""").bindparams(bindparam("pool_ids", type_=ARRAY(String)), bindparam("th_price", type_=Integer),
+              bindparam("th_fee", type_=Integer), bindparam("until", type_=Integer))
+
+def series_params(pool_ids: Sequence[str], th: int, until: int) -> Dict[str, Any]:
+    """SQL_POOLS_SERIES binds for hours th..until still in Postgres (each table from its archive cutoff)."""
+    return {"pool_ids": list(pool_ids), "until": until,
+            "th_price": max(th, archive.cutoff("pool_price_hour") or th),
+            "th_fee": max(th, archive.cutoff("pool_hour_data") or th)}
+
+def with_cold(rows: Sequence[Any], pool_ids: Sequence[str], th: int, until: int) -> Sequence[Any]:
+    """Rows of SQL_POOLS_SERIES (bound by series_params) plus the archived hours of th..until, same order."""
+    out: Dict[tuple, Dict[str, Any]] = {}
+    cut = archive.cutoff("pool_price_hour")
+    if cut is not None and th < cut:
+        t = archive.read("pool_price_hour", pool_ids, th, min(until, cut - 1), ["pool_id", "hour_start_unix", "sqrt_price_x96", "liquidity"])
+        for pid, h, sp, liq in zip(*(c.to_pylist() for c in t.columns)):
+            out[(pid, h)] = {"pool_id": pid, "h": h, "sqrt_price_x96": sp, "liquidity": liq, "fee0": None, "fee1": None}
+    cut = archive.cutoff("pool_hour_data")
+    if cut is not None and th < cut:
+        t = archive.read("pool_hour_data", pool_ids, th, min(until, cut - 1), ["pool_id", "hour_start_unix", "approx_fee_token0", "approx_fee_token1"])
+        for pid, h, f0, f1 in zip(*(c.to_pylist() for c in t.columns)):
+            r = out.setdefault((pid, h), {"pool_id": pid, "h": h, "sqrt_price_x96": None, "liquidity": None})
+            r["fee0"], r["fee1"] = f0, f1
+    if not out:
+        return rows
+    # The tables' cutoffs may differ: an hour can be cold in one and hot in the other
+    for r in rows:
+        c = out.get((r["pool_id"], r["h"]))
+        if c is None:
+            out[(r["pool_id"], r["h"])] = r
+        else:
+            c.update({k: v for k, v in r.items() if v is not None})
+    return [out[k] for k in sorted(out)]
+
+def series_by_pool(rows: Sequence[Any]) -> Dict[str, HourSeries]:
+    """Rows of SQL_POOLS_SERIES (ordered by pool, hour) -> dense series; pools without prices are left out."""
+    out: Dict[str, HourSeries] = {}
+    n = len(rows)
+    i = 0
+    while i < n:
+        pid = rows[i]["pool_id"]
+        j = i
+        while j < n and rows[j]["pool_id"] == pid:
+            j += 1
+        chunk: List[Any] = rows[i:j]
+        s = densify([r["h"] for r in chunk], [r["sqrt_price_x96"] for r in chunk], [r["liquidity"] for r in chunk],
+                    [r["fee0"] for r in chunk], [r["fee1"] for r in chunk])
+        if s is not None:
+            out[pid] = s
+        i = j
+    return out
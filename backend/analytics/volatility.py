@@ -0,0 +1,129 @@
+# Realized volatility and cross-pool correlation over hourly log returns (comments in English).
+#
+# ReturnsStore keeps one aligned matrix of hourly log prices (tracked pools x hours) ending at
+# `end`: the observed snapshots plus a forward-filled copy. New hours shift the matrix left and
+# late or corrected hours are patched in place, so an update only touches the rows it loaded.
+# Statistics are computed per window on first use and cached until the next update:
+#   vol  = std(returns) * sqrt(8760)                         annualised
+#   cov  = (R - mean)(R - mean)^T / (n - 1) * 8760           annualised, float32
+#   corr = cov / (vol vol^T)
+# Returns are of price0 (token1 per token0), so a pool's sign depends on its token order.
+# A pool enters a window only if it has a price at the window's first hour.
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import text, bindparam, Integer, String
+from sqlalchemy.dialects.postgresql import ARRAY
+
+# name -> hours
+WINDOWS = {"1d": 24, "7d": 168, "30d": 720}
+# Hours loaded before the longest window so its first hour has a forward-filled price
+FILL_HOURS = 24 * 7
+
+SQL_TRACKED_POOLS = text("""
+  select pool_id
+  from pool_price_hour
+  where hour_start_unix >= :th and hour_start_unix <= :until and price0 > 0
+  group by pool_id
+  order by count(*) desc, pool_id
+  limit :limit
+""").bindparams(bindparam("th", type_=Integer), bindparam("until", type_=Integer), bindparam("limit", type_=Integer))
+
+SQL_PRICES = text("""
+  select pool_id, hour_start_unix as h, price0::float8 as price
+  from pool_price_hour
+  where pool_id = any(:pool_ids) and hour_start_unix >= :th and hour_start_unix <= :until and price0 > 0
+  order by 1, 2
+""").bindparams(bindparam("pool_ids", type_=ARRAY(String)), bindparam("th", type_=Integer), bindparam("until", type_=Integer))
+
+def _ffill(x: np.ndarray) -> np.ndarray:
+    """Forward-fill NaNs along axis 1 (leading NaNs stay)."""
+    idx = np.where(np.isnan(x), 0, np.arange(x.shape[1])[None, :])
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return x[np.arange(x.shape[0])[:, None], idx]
+
+class WindowStats:
+    __slots__ = ("pool_ids", "pos", "hours", "vol", "cov", "corr")
+
+    def __init__(self, pool_ids: List[str], hours: int, vol: np.ndarray, cov: np.ndarray):
+        self.pool_ids, self.hours, self.vol, self.cov = pool_ids, hours, vol, cov
+        self.pos = {pid: i for i, pid in enumerate(pool_ids)}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.corr = (cov / np.outer(vol, vol)).astype(np.float32)
+
+    def slice(self, kind: str, pool_ids: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+        """Sub-matrix for the ids this window has, in request order."""
+        ids = [pid for pid in pool_ids if pid in self.pos]
+        ix = np.array([self.pos[pid] for pid in ids], dtype=np.int64)
+        m = self.corr if kind == "corr" else self.cov
+        return ids, m[np.ix_(ix, ix)]
+
+class ReturnsStore:
+    def __init__(self, hours: int = max(WINDOWS.values()), fill_hours: int = FILL_HOURS):
+        self.width = hours + 1 + fill_hours
+        self.pool_ids: List[str] = []
+        self.pos: Dict[str, int] = {}
+        self.end: Optional[int] = None
+        self.version = 0
+        self._obs = np.empty((0, self.width))
+        self._logp = self._obs
+        self._stats: Dict[str, WindowStats] = {}
+
+    @property
+    def start(self) -> int:
+        return self.end - self.width + 1
+
+    def _put(self, rows: Sequence[Any]):
+        if not rows:
+            return
+        r = np.array([self.pos[x["pool_id"]] for x in rows], dtype=np.int64)
+        c = np.array([x["h"] for x in rows], dtype=np.int64) - self.start
+        ok = (c >= 0) & (c < self.width)
+        self._obs[r[ok], c[ok]] = np.log([x["price"] for x, k in zip(rows, ok) if k])
+
+    def _commit(self):
+        self._logp = _ffill(self._obs)
+        self._stats = {}
+        self.version += 1
+
+    def load(self, pool_ids: Sequence[str], rows: Sequence[Any], end: int):
+        """Replace the tracked set; rows = SQL_PRICES over [start, end]."""
+        self.pool_ids = list(pool_ids)
+        self.pos = {pid: i for i, pid in enumerate(self.pool_ids)}
+        self.end = end
+        self._obs = np.full((len(self.pool_ids), self.width), np.nan)
+        self._put(rows)
+        self._commit()
+
+    def update(self, rows: Sequence[Any], lo: int, end: int):
+        """Advance to `end` and rewrite hours lo..end from rows (SQL_PRICES over that range)."""
+        shift = end - self.end
+        if shift > 0:
+            if shift >= self.width:
+                self._obs[:] = np.nan
+            else:
+                self._obs[:, :-shift] = self._obs[:, shift:]
+                self._obs[:, -shift:] = np.nan
+            self.end = end
+        c = max(lo - self.start, 0)
+        if c < self.width:
+            self._obs[:, c:] = np.nan
+        self._put(rows)
+        self._commit()
+
+    def stats(self, window: str) -> WindowStats:
+        st = self._stats.get(window)
+        if st is None:
+            # May run in a worker thread: work on the current arrays, cache only if still current
+            version, logp, pool_ids = self.version, self._logp, self.pool_ids
+            h = WINDOWS[window]
+            lp = logp[:, -(h + 1):]
+            keep = np.flatnonzero(~np.isnan(lp[:, 0]))
+            r = np.diff(lp[keep], axis=1)
+            r -= r.mean(axis=1, keepdims=True)
+            cov = (r @ r.T) * (8760.0 / max(h - 1, 1))
+            vol = np.sqrt(np.diag(cov))
+            st = WindowStats([pool_ids[k] for k in keep], h, vol, cov.astype(np.float32))
+            if version == self.version:
+                self._stats[window] = st
+        return st
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# Rolling fee APR / TVL for every pool, as one batch (comments in English).
+#
+# All pools are laid on a common hourly grid (pools x hours) ending at --end-hour and every
+# metric is an array operation over that matrix; windows are suffix sums of it. Per hour:
+#   tvl    = 2 * L * sqrt(P) / 10^dec1   value of the active liquidity as a full-range position
+#   fees   = fee0 * P + fee1             approx fees valued at the hour's price
+# so fees / tvl is what a full-range LP earned that hour. A position of +/- w% around the price
+# earns 1 / (1 - 1/sqrt(1 + w)) times the full-range APR while in range.
+# There are no USD prices yet: tvl and fees are in token1 units of each pool, fee_tvl and fee_apr
+# are unit-free and comparable across pools.
+#
+#   python -m backend.analytics.yields                  # all pools, windows 1d/7d/30d
+#   python -m backend.analytics.yields --end-hour 497000 --dry-run
+
+import os, sys, time, asyncio, argparse
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+import numpy as np
+
+from backend.analytics.backtest import HourSeries
+
+ROOT = Path("/Users/axel/Dev/open-source/uniswap-lp-analytics")
+
+# name -> hours
+WINDOWS = {"1d": 24, "7d": 168, "30d": 720}
+# Hours loaded before the longest window so its first hours have a forward-filled price
+FILL_HOURS = 24 * 7
+CHUNK_POOLS = 500
+METRICS = ("hours", "tvl_token1", "avg_tvl_token1", "fees_token1", "fee_tvl", "fee_apr")
+
+def grid(series: Sequence[HourSeries], start: int, T: int) -> Dict[str, np.ndarray]:
+    """Pools x hours matrices for [start, start + T); price/liquidity carried past a series' end, NaN before it."""
+    P = len(series)
+    out = {k: np.full((P, T), np.nan) for k in ("sqrt_p", "liquidity")}
+    out.update({k: np.zeros((P, T)) for k in ("fee0", "fee1")})
+    for k, s in enumerate(series):
+        a = max(s.start, start)
+        b = min(s.start + len(s), start + T)
+        if b <= a:
+            if s.start + len(s) <= start:
+                out["sqrt_p"][k] = s.sqrt_p[-1]
+                out["liquidity"][k] = s.liquidity[-1]
+            continue
+        src = slice(a - s.start, b - s.start)
+        dst = slice(a - start, b - start)
+        for f in ("sqrt_p", "liquidity", "fee0", "fee1"):
+            out[f][k, dst] = getattr(s, f)[src]
+        out["sqrt_p"][k, b - start:] = s.sqrt_p[b - s.start - 1]
+        out["liquidity"][k, b - start:] = s.liquidity[b - s.start - 1]
+    return out
+
+def compute(m: Dict[str, np.ndarray], dec0: np.ndarray, dec1: np.ndarray, windows: Dict[str, int] = WINDOWS) -> Dict[str, Dict[str, np.ndarray]]:
+    """Per window, per pool metrics (METRICS) over the last `hours` columns of the grid."""
+    s, liq = m["sqrt_p"], m["liquidity"]
+    price = s * s * (10.0 ** (dec0 - dec1))[:, None]
+    tvl = 2.0 * liq * s / (10.0 ** dec1)[:, None]
+    live = np.isfinite(tvl) & (tvl > 0)
+    tvl = np.where(live, tvl, 0.0)
+    fees = np.where(live, m["fee0"] * np.nan_to_num(price) + m["fee1"], 0.0)
+    ratio = np.divide(fees, tvl, out=np.zeros_like(fees), where=live)
+
+    # Suffix sums: column j of a reversed cumsum covers the last j + 1 hours
+    def tail(x: np.ndarray) -> np.ndarray:
+        return np.cumsum(x[:, ::-1], axis=1)
+
+    n_c, tvl_c, fee_c, ratio_c = tail(live.astype(np.float64)), tail(tvl), tail(fees), tail(ratio)
+    last_tvl = tvl[:, -1]
+    out = {}
+    for name, h in windows.items():
+        j = min(h, tvl.shape[1]) - 1
+        n = n_c[:, j]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            avg_tvl = tvl_c[:, j] / n
+            out[name] = {
+                "hours": n, "tvl_token1": last_tvl, "avg_tvl_token1": avg_tvl, "fees_token1": fee_c[:, j],
+                "fee_tvl": fee_c[:, j] / avg_tvl, "fee_apr": ratio_c[:, j] / n * 8760.0,
+            }
+    return out
+
+def rows_for(pool_ids: Sequence[str], res: Dict[str, Dict[str, np.ndarray]], end_hour: int) -> List[Dict[str, Any]]:
+    """Table rows for pools with at least one live hour in the window."""
+    rows = []
+    for name, cols in res.items():
+        keep = np.flatnonzero(cols["hours"] > 0)
+        vals = {k: cols[k][keep].tolist() for k in METRICS}
+        vals["hours"] = [int(h) for h in vals["hours"]]
+        for n, k in enumerate(keep.tolist()):
+            rows.append({"pool_id": pool_ids[k], "window_hours": WINDOWS[name], "end_hour": end_hour,
+                         **{f: vals[f][n] for f in METRICS}})
+    return rows
+
+# ---------- batch job ----------
+SQL_UPSERT = """
+insert into pool_yield (pool_id, window_hours, end_hour, hours, tvl_token1, avg_tvl_token1, fees_token1, fee_tvl, fee_apr, updated_at)
+values (:pool_id, :window_hours, :end_hour, :hours, :tvl_token1, :avg_tvl_token1, :fees_token1, :fee_tvl, :fee_apr, now())
+on conflict (pool_id, window_hours) do update set
+  end_hour = excluded.end_hour, hours = excluded.hours, tvl_token1 = excluded.tvl_token1,
+  avg_tvl_token1 = excluded.avg_tvl_token1, fees_token1 = excluded.fees_token1,
+  fee_tvl = excluded.fee_tvl, fee_apr = excluded.fee_apr, updated_at = now()
+"""
+
+async def main():
+    from dotenv import load_dotenv
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from backend.analytics.series import SQL_POOLS_SERIES, series_by_pool, series_params, with_cold
+    from backend.db.notify import notify_changes
+    from backend.db.sync_state import record_run, utcnow
+
+    ap = argparse.ArgumentParser(description="Compute rolling fee APR / TVL for every pool into pool_yield")
+    ap.add_argument("--end-hour", type=int, default=None, help="Last hour id included (default: current hour)")
+    ap.add_argument("--chunk-pools", type=int, default=CHUNK_POOLS, help="Pools loaded per series query")
+    ap.add_argument("--dry-run", action="store_true", help="Compute and print the top pools, write nothing")
+    args = ap.parse_args()
+
+    load_dotenv(ROOT / ".env", override=True)
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        print("ERROR: DATABASE_URL is not set", file=sys.stderr); sys.exit(2)
+
+    end = int(args.end_hour if args.end_hour is not None else time.time() // 3600)
+    T = max(WINDOWS.values())
+    start = end - T + 1
+    engine = create_async_engine(db_url, future=True)
+    started = utcnow()
+    t0 = time.perf_counter()
+
+    async with engine.connect() as conn:
+        pools = (await conn.execute(text("""
+          select p.id, t0.decimals as dec0, t1.decimals as dec1
+          from pools p join tokens t0 on t0.id = p.token0_id join tokens t1 on t1.id = p.token1_id
+          order by p.id
+        """))).mappings().all()
+        ids: List[str] = []
+        series: List[HourSeries] = []
+        dec0: List[int] = []
+        dec1: List[int] = []
+        for i in range(0, len(pools), args.chunk_pools):
+            chunk = pools[i:i + args.chunk_pools]
+            chunk_ids = [p["id"] for p in chunk]
+            rows = (await conn.execute(SQL_POOLS_SERIES, series_params(chunk_ids, start - FILL_HOURS, end))).mappings().all()
+            by_pool = series_by_pool(with_cold(rows, chunk_ids, start - FILL_HOURS, end))
+            for p in chunk:
+                s = by_pool.get(p["id"])
+                if s is not None:
+                    ids.append(p["id"]); series.append(s); dec0.append(p["dec0"]); dec1.append(p["dec1"])
+    t1 = time.perf_counter()
+
+    res = compute(grid(series, start, T), np.array(dec0, dtype=np.float64), np.array(dec1, dtype=np.float64))
+    rows = rows_for(ids, res, end)
+    t2 = time.perf_counter()
+    print(f"{len(series)}/{len(pools)} pools with prices; loaded in {t1 - t0:.1f}s, computed {len(rows)} rows in {t2 - t1:.2f}s")
+
+    if args.dry_run:
+        for name in WINDOWS:
+            best = [r for r in rows if r["window_hours"] == WINDOWS[name]]
+            best.sort(key=lambda r: -r["fee_apr"])
+            print(f"\n{name}")
+            for r in best[:10]:
+                print(f"  {r['pool_id']} fee_apr={r['fee_apr']:.4f} fee_tvl={r['fee_tvl']:.6f} tvl={r['tvl_token1']:.4g} hours={r['hours']:.0f}")
+        await engine.dispose()
+        return
+
+    try:
+        async with engine.begin() as conn:
+            # Pools without a live hour drop out of the ranking
+            await conn.execute(text("delete from pool_yield where end_hour <> :end"), {"end": end})
+            if rows:
+                await conn.execute(text(SQL_UPSERT), rows)
+            await notify_changes(conn, "pool_yield", [], end, end)
+            await record_run(conn, "compute_pool_yield", started, pools=len(series), rows=len(rows))
+    except Exception as e:
+        async with engine.begin() as conn:
+            await record_run(conn, "compute_pool_yield", started, status="error", pools=len(series), error=repr(e))
+        raise
+    finally:
+        await engine.dispose()
+    print(f"Upserted {len(rows)} pool_yield rows in {time.perf_counter() - t2:.1f}s")
+
+if __name__ == "__main__":
+    asyncio.run(main())
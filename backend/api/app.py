@@ -1,12 +1,41 @@
-from typing import Optional, List, Literal, Dict, Any, Tuple
-import os, time, io, csv
-from fastapi import FastAPI, Query, HTTPException
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel, Field
+from typing import Optional, List, Literal, Dict, Any, Tuple, Annotated
+import os, re, time, io, csv, json, base64, asyncio, hashlib
+from itertools import islice
+from functools import lru_cache
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+from datetime import date, timedelta
+from fastapi import FastAPI, Query, HTTPException, Request
+from fastapi.dependencies.utils import request_params_to_args
+from fastapi.responses import StreamingResponse, Response, PlainTextResponse
+from pydantic import BaseModel, Field, field_validator
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy import text, bindparam, Integer, SmallInteger, String
+from sqlalchemy import text, bindparam, Integer, String, Numeric, Float
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.routing import Match
 from dotenv import load_dotenv
 from pathlib import Path
+import asyncpg
+import pyarrow as pa
+import pyarrow.parquet as pq
+import numpy as np
+
+from backend.db.notify import CHANNEL as NOTIFY_CHANNEL
+from backend.api.meta_index import MetaIndex, load_meta_index
+from backend.api import metrics
+from backend.api.metrics import timed_query
+from backend.api import profiler
+from backend.analytics import backtest as bt
+from backend.analytics import grid_search
+from backend.analytics.volatility import ReturnsStore, SQL_TRACKED_POOLS, SQL_PRICES
+from backend.analytics.series import SQL_POOLS_SERIES, series_by_pool, series_params, with_cold
+from backend.db.candles import RESOLUTIONS as CANDLE_RESOLUTIONS, bucket_of
+from backend.db import archive
+from backend.db.series_cache import SeriesCache
+from backend.db.sync_state import record_subgraph
+from backend.tools.check_v4_progress import read_v4_startblock, fetch_meta
 
 ROOT = Path("/Users/axel/Dev/open-source/uniswap-lp-analytics")
 load_dotenv(ROOT / ".env", override=True)
@@ -14,10 +43,29 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL is not set in .env")
 
-engine = create_async_engine(DATABASE_URL, future=True)
+class _TimedPool(AsyncAdaptedQueuePool):
+    # Records how long requests wait for a connection (pool_size / max_overflow pressure)
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.pool_checkout.observe(time.perf_counter() - t0)
+
+engine = create_async_engine(DATABASE_URL, future=True, poolclass=_TimedPool)
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
-app = FastAPI(title="Uniswap LP Analytics API", version="0.6.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await _reload_meta()
+    tasks = [asyncio.create_task(_watermark_loop()), asyncio.create_task(_listen_changes()),
+             asyncio.create_task(_meta_loop()), asyncio.create_task(_subgraph_loop()), asyncio.create_task(_returns_loop())]
+    yield
+    for t in tasks:
+        t.cancel()
+    grid_search.shutdown()
+
+app = FastAPI(title="Uniswap LP Analytics API", version="0.6.0", lifespan=lifespan)
 
 class TokenOut(BaseModel):
     address: str
@@ -37,34 +85,486 @@ class PoolOut(BaseModel):
 class Page(BaseModel):
     page: int = Field(..., ge=1)
     page_size: int = Field(..., ge=1, le=100)
-    total: int
+    total: Optional[int] = None
+    total_mode: Literal["exact", "estimate", "none"] = "exact"
+    has_more: bool = False
     items: List
+    next_cursor: Optional[str] = None
 
 class TTLCache:
-    def __init__(self, ttl_seconds: int, maxsize: int):
+    def __init__(self, ttl_seconds: int, maxsize: int, name: str = "cache"):
         self.ttl = ttl_seconds
         self.maxsize = maxsize
+        self.name = name
         self._store: Dict[Any, Tuple[float, Any]] = {}
 
     def get(self, key):
         rec = self._store.get(key)
         if not rec:
+            metrics.cache_requests.inc(self.name, "miss")
             return None
         exp, val = rec
         if exp < time.time():
             self._store.pop(key, None)
+            metrics.cache_requests.inc(self.name, "miss")
+            metrics.cache_evictions.inc(self.name, "expired")
             return None
+        metrics.cache_requests.inc(self.name, "hit")
         return val
 
     def set(self, key, val):
         if len(self._store) >= self.maxsize:
             self._store.pop(next(iter(self._store)))
+            metrics.cache_evictions.inc(self.name, "size")
         self._store[key] = (time.time() + self.ttl, val)
 
-cache_tokens = TTLCache(ttl_seconds=60, maxsize=200)
-cache_pools  = TTLCache(ttl_seconds=30, maxsize=500)
-cache_metrics= TTLCache(ttl_seconds=30, maxsize=200)
-cache_top    = TTLCache(ttl_seconds=15, maxsize=200)
+    def evict(self, pred) -> int:
+        keys = [k for k in self._store if pred(k)]
+        for k in keys:
+            self._store.pop(k, None)
+        if keys:
+            metrics.cache_evictions.inc(self.name, "invalidated", amount=len(keys))
+        return len(keys)
+
+    def clear(self):
+        if self._store:
+            metrics.cache_evictions.inc(self.name, "invalidated", amount=len(self._store))
+        self._store.clear()
+
+    def __len__(self):
+        return len(self._store)
+
+cache_tokens = TTLCache(ttl_seconds=60, maxsize=200, name="tokens")
+cache_pools  = TTLCache(ttl_seconds=30, maxsize=500, name="pools")
+cache_metrics= TTLCache(ttl_seconds=30, maxsize=200, name="metrics")
+cache_top    = TTLCache(ttl_seconds=15, maxsize=200, name="top")
+cache_agg    = TTLCache(ttl_seconds=30, maxsize=1000, name="agg")
+cache_candles = TTLCache(ttl_seconds=30, maxsize=1000, name="candles")
+# Memory-mapped hourly series of the cached pools (backend/db/series_cache.py), shared by all workers
+_pool_series = SeriesCache()
+# Keyed by the returns store version, so entries go stale on their own after an update
+cache_vol    = TTLCache(ttl_seconds=600, maxsize=200, name="vol")
+cache_totals = TTLCache(ttl_seconds=600, maxsize=1000, name="totals")
+WATERMARK_REFRESH_SECONDS = 5
+cache_watermark = TTLCache(ttl_seconds=3 * WATERMARK_REFRESH_SECONDS, maxsize=4, name="watermark")
+
+# ---------- named queries ----------
+# Every SQL statement goes through these so /metrics has per-query timing and row counts.
+async def _fetch_all(session: AsyncSession, name: str, sql, params: Optional[Dict[str, Any]] = None):
+    with timed_query(name) as q:
+        rows = (await session.execute(sql, params)).mappings().all()
+        q.rows(len(rows))
+    return rows
+
+async def _fetch_one(session: AsyncSession, name: str, sql, params: Optional[Dict[str, Any]] = None):
+    with timed_query(name) as q:
+        row = (await session.execute(sql, params)).mappings().one()
+        q.rows(1)
+    return row
+
+async def _fetch_scalar(session: AsyncSession, name: str, sql, params: Optional[Dict[str, Any]] = None):
+    with timed_query(name) as q:
+        val = (await session.execute(sql, params)).scalar_one()
+        q.rows(1)
+    return val
+
+# ---------- watermark & totals ----------
+TotalMode = Literal["exact", "estimate", "none"]
+
+async def _load_watermark(session: AsyncSession) -> Dict[str, int]:
+    row = await _fetch_one(session, "watermark", text("""
+      select
+        (select coalesce(max(date),0) from pool_day_data) as max_day,
+        (select coalesce(max(hour_start_unix),0) from pool_hour_data) as max_hour,
+        (select coalesce(sum(n_tup_ins + n_tup_upd + n_tup_del),0) from pg_stat_user_tables
+          where relname in ('tokens','pools')) as meta_changes,
+        (select coalesce(sum(n_tup_ins + n_tup_upd + n_tup_del),0) from pg_stat_user_tables
+          where relname in ('pool_day_data','pool_hour_data')) as agg_changes
+    """))
+    wm = {k: int(v) for k, v in row.items()}
+    cache_watermark.set("wm", wm)
+    return wm
+
+async def _watermark(session: Optional[AsyncSession] = None) -> Dict[str, int]:
+    """
+    Cheap change marker: latest ingested buckets plus pg_stat modification counters,
+    and the publish time of the last change notification heard (same on every worker).
+    """
+    wm = cache_watermark.get("wm")
+    if wm is None:
+        if session is not None:
+            wm = await _load_watermark(session)
+        else:
+            async with SessionLocal() as session:
+                wm = await _load_watermark(session)
+    return {**wm, "changed_at": _last_change_at}
+
+async def _watermark_loop():
+    # Keeps the watermark warm so conditional GETs never wait on the DB
+    while True:
+        try:
+            async with SessionLocal() as session:
+                await _load_watermark(session)
+        except Exception:
+            pass
+        await asyncio.sleep(WATERMARK_REFRESH_SECONDS)
+
+@lru_cache(maxsize=256)
+def _total_sql(kind: str, rows_sql: str, binds: Tuple):
+    if kind == "estimate":
+        return text(f"explain (format json) {rows_sql}").bindparams(*binds)
+    return text(f"select count(*) from ({rows_sql}) s").bindparams(*binds)
+
+async def _resolve_total(session: AsyncSession, mode: str, key: Tuple, rows_sql: str, binds: List, params: Dict[str, Any],
+                         query: str = "total") -> Optional[int]:
+    """
+    Total for a list endpoint, by strategy:
+      exact    - count(*) over rows_sql, cached per filter key and data watermark
+      estimate - planner row estimate for rows_sql (no execution)
+      none     - no total; callers rely on has_more
+    """
+    if mode == "none":
+        return None
+    if mode == "estimate":
+        plan = await _fetch_scalar(session, f"{query}_estimate", _total_sql("estimate", rows_sql, tuple(binds)), params)
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+    wm = await _watermark(session)
+    ckey = (key, wm["max_day"], wm["max_hour"], wm["meta_changes"], wm["agg_changes"], wm["changed_at"])
+    total = cache_totals.get(ckey)
+    if total is None:
+        total = await _fetch_scalar(session, f"{query}_count", _total_sql("count", rows_sql, tuple(binds)), params)
+        cache_totals.set(ckey, total)
+    return total
+
+# ---------- cursors ----------
+# Opaque keyset cursors: base64url(JSON) of the ordering they belong to and the
+# sort key of the last row served. A cursor is only valid for the same ordering.
+def _encode_cursor(sort: str, key: List[Any]) -> str:
+    raw = json.dumps({"s": sort, "k": key}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _cursor_int(v: Any) -> int:
+    # Bound as int4 (window thresholds) or compared to int4 columns
+    if isinstance(v, bool) or not isinstance(v, int) or not -2**31 <= v < 2**31:
+        raise ValueError(v)
+    return v
+
+def _cursor_str(v: Any) -> str:
+    if not isinstance(v, str):
+        raise ValueError(v)
+    return v
+
+def _cursor_decimal(v: Any) -> Decimal:
+    d = Decimal(_cursor_str(v))
+    if not d.is_finite():
+        raise ValueError(v)
+    return d
+
+def _cursor_float(v: Any) -> float:
+    if isinstance(v, bool) or not isinstance(v, (int, float)) or not np.isfinite(v):
+        raise ValueError(v)
+    return float(v)
+
+def _decode_cursor(cursor: str, sort: str, types: Tuple[Any, ...]) -> List[Any]:
+    """Key of a cursor for `sort`, each value converted by the matching entry of types."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        obj = json.loads(raw)
+        key = obj["k"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(obj, dict) or obj.get("s") != sort or not isinstance(key, list) or len(key) != len(types):
+        raise HTTPException(status_code=400, detail="Cursor does not match the requested ordering")
+    try:
+        return [conv(v) for conv, v in zip(types, key)]
+    except (ValueError, TypeError, ArithmeticError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _token_norm(token: Optional[str]) -> Optional[str]:
+    """Lowercased token address filter; 400 unless it looks like one."""
+    t = token.lower() if token else None
+    if t and (not t.startswith("0x") or len(t) != 42):
+        raise HTTPException(status_code=400, detail="Invalid token address")
+    return t
+
+# ---------- metadata index ----------
+# Pools and tokens live in memory (backend/api/meta_index.py): metadata filters, joins and
+# summary counts are answered from the index, SQL only touches the time-series tables.
+# Reloaded on pools/tokens notifications, on an unknown pool id, and by _meta_loop as a fallback.
+META_REFRESH_SECONDS = 30
+META_MISS_RELOAD_SECONDS = 5
+_meta: Optional[MetaIndex] = None
+_meta_changes = -1
+_meta_lock = asyncio.Lock()
+
+async def _reload_meta() -> MetaIndex:
+    global _meta, _meta_changes
+    async with _meta_lock:
+        async with SessionLocal() as session:
+            wm = await _load_watermark(session)
+            with timed_query("meta_index_load") as q:
+                _meta = await load_meta_index(session, time.time())
+                q.rows(len(_meta.pool_ids) + len(_meta.token_ids))
+        _meta_changes = wm["meta_changes"]
+    return _meta
+
+async def _meta_index() -> MetaIndex:
+    return _meta if _meta is not None else await _reload_meta()
+
+async def _meta_for(pool_ids: List[str]) -> MetaIndex:
+    """Index that knows every id in pool_ids if the DB does (reloads at most every META_MISS_RELOAD_SECONDS)."""
+    meta = await _meta_index()
+    if any(pid not in meta.pool_pos for pid in pool_ids) and time.time() - meta.loaded_at >= META_MISS_RELOAD_SECONDS:
+        meta = await _reload_meta()
+    return meta
+
+async def _meta_loop():
+    # Fallback for missed notifications: reload when pg_stat says pools/tokens changed
+    while True:
+        await asyncio.sleep(META_REFRESH_SECONDS)
+        try:
+            wm = await _watermark()
+            if wm["meta_changes"] != _meta_changes:
+                await _reload_meta()
+                for c in (cache_tokens, cache_pools, cache_metrics, cache_top, cache_agg):
+                    c.clear()
+        except Exception:
+            pass
+
+def _meta_pool_ids(meta: MetaIndex, version, token_norm, token_symbol, fee_min, fee_max) -> Optional[List[str]]:
+    """Pool ids passing the metadata filters, or None when no filter is set."""
+    if version is None and not token_norm and not token_symbol and fee_min is None and fee_max is None:
+        return None
+    return [meta.pool_ids[i] for i in meta.filter_pools(version, token_norm, token_symbol, fee_min, fee_max)]
+
+# ---------- change notifications (LISTEN) ----------
+# Ingestion publishes {"table", "pools", "lo", "hi", "at"} on NOTIFY_CHANNEL after each commit
+# (backend/db/notify.py). While the listener is connected, caches use LISTEN_CACHE_TTL_SECONDS and
+# rely on notifications for freshness; when it drops, TTLs fall back to their defaults.
+LISTEN_CACHE_TTL_SECONDS = int(os.getenv("LISTEN_CACHE_TTL_SECONDS", "3600"))
+LISTEN_RETRY_SECONDS = 5
+_ttl_caches = [cache_tokens, cache_pools, cache_metrics, cache_top, cache_agg, cache_candles]
+_default_ttls = [c.ttl for c in _ttl_caches]
+_last_change_at = 0
+
+def _set_listening(on: bool):
+    for c, ttl in zip(_ttl_caches, _default_ttls):
+        c.ttl = LISTEN_CACHE_TTL_SECONDS if on else ttl
+        if not on:
+            # Notifications may have been missed while disconnected
+            c.clear()
+
+def _key_has_pool(kp, pools: set) -> bool:
+    # Cache keys carry one pool id, or a tuple of them for multi-pool responses
+    return kp in pools if isinstance(kp, str) else not pools.isdisjoint(kp)
+
+def _on_change(conn, pid, channel, payload):
+    global _last_change_at
+    try:
+        msg = json.loads(payload)
+    except ValueError:
+        return
+    table = msg.get("table")
+    pools = set(msg.get("pools") or [])
+    hi = msg.get("hi")
+    _last_change_at = max(_last_change_at, int(msg.get("at") or 0))
+    cache_watermark.evict(lambda k: True)
+
+    if table in ("pools", "tokens"):
+        for c in (cache_tokens, cache_pools, cache_metrics, cache_top, cache_agg):
+            c.clear()
+        asyncio.get_running_loop().create_task(_on_meta_change())
+    elif table in ("pool_day_data", "pool_hour_data"):
+        # Keys: (name, agg_table, th, ...) for top lists, ("agg", agg_table, th, pool_id, ...) per pool.
+        # A window is affected when it starts at or before the newest changed bucket.
+        cache_top.evict(lambda k: k[1] == table and (hi is None or k[2] <= hi))
+        cache_agg.evict(lambda k: k[1] == table and (hi is None or k[2] <= hi) and (not pools or _key_has_pool(k[3], pools)))
+    elif table == "pool_yield":
+        cache_top.evict(lambda k: k[1] == table)
+    elif table == "pool_price_hour":
+        # Keys: ("candles", resolution, pool_id, since, until, ...)
+        cache_candles.evict(lambda k: (not pools or k[2] in pools) and (hi is None or k[3] <= hi))
+        cache_agg.evict(lambda k: k[0] == "pair_tiers" and (not pools or _key_has_pool(k[3], pools)))
+        _mark_returns(pools, msg.get("lo"))
+    elif table == "series_cache":
+        # Ingestion rewrote these pools' cache files after committing; drop responses built in between
+        cache_agg.evict(lambda k: k[1] == "pool_hour_data" and (not pools or _key_has_pool(k[3], pools)))
+        cache_candles.evict(lambda k: k[1] == "1h" and (not pools or k[2] in pools))
+    elif table == "archive":
+        # A month moved to Parquet: same rows, new place; readers switch before it leaves Postgres
+        archive.refresh()
+
+async def _on_meta_change():
+    try:
+        await _reload_meta()
+    except Exception:
+        return
+    # Anything cached while the reload was in flight was built from the old index
+    for c in (cache_tokens, cache_pools, cache_metrics, cache_top, cache_agg):
+        c.clear()
+
+async def _listen_changes():
+    dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(dsn)
+            await conn.add_listener(NOTIFY_CHANNEL, _on_change)
+            _set_listening(True)
+            while not conn.is_closed():
+                await asyncio.sleep(LISTEN_RETRY_SECONDS)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass
+        finally:
+            _set_listening(False)
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(LISTEN_RETRY_SECONDS)
+
+# ---------- profiling ----------
+# Opt-in per request: send "X-Profile: <PROFILE_TOKEN>"; the response carries X-Profile-Id and
+# the samples are served by /debug/profiles/{id} (backend/api/profiler.py). Added before the
+# @app.middleware ones so it is the innermost layer and shares the endpoint's task.
+app.add_middleware(profiler.ProfileMiddleware)
+
+def _require_profile_token(request: Request):
+    if not profiler.PROFILE_TOKEN:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not profiler.authorized(request.headers.get(profiler.HEADER)):
+        raise HTTPException(status_code=403, detail="Missing or invalid X-Profile token")
+
+@app.get("/debug/profiles", include_in_schema=False)
+async def list_profiles(request: Request):
+    _require_profile_token(request)
+    return [p.summary() for p in reversed(profiler.profiles)]
+
+@app.get("/debug/profiles/{profile_id}", include_in_schema=False)
+async def get_profile(request: Request, profile_id: str, format: Literal["collapsed", "tree", "json"] = Query("tree")):
+    _require_profile_token(request)
+    prof = profiler.get_profile(profile_id)
+    if prof is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "json":
+        return {**prof.summary(), "stacks": [{"stack": list(k), "samples": n} for k, n in prof.samples.most_common()]}
+    return PlainTextResponse(prof.collapsed() if format == "collapsed" else prof.tree())
+
+# ---------- conditional GET ----------
+CONDITIONAL_PREFIXES = ("/tokens", "/pools", "/metrics/summary", "/export/")
+
+def _etag_for(request: Request, wm: Dict[str, int]) -> str:
+    # Filter key = path + normalized query; the current hour is mixed in because
+    # lookback windows slide even when no new data lands.
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    raw = (f"{request.url.path}?{query}|{wm['max_day']}:{wm['max_hour']}:{wm['meta_changes']}:{wm['agg_changes']}"
+           f":{wm['changed_at']}|{int(time.time() // 3600)}")
+    return '"' + hashlib.sha1(raw.encode()).hexdigest()[:24] + '"'
+
+# ETag of the current request when its If-None-Match matched
+_not_modified: ContextVar[Optional[str]] = ContextVar("not_modified", default=None)
+
+def _not_modified_response() -> Optional[Response]:
+    etag = _not_modified.get()
+    return Response(status_code=304, headers={"ETag": etag}) if etag else None
+
+async def _fails_cheaply(request: Request) -> bool:
+    """
+    True when the route would answer 4xx, judged from memory: its query/path params don't validate,
+    the token filter or bucket is malformed, or the path names a pool the meta index doesn't know.
+    """
+    route, path_params = _match_route(request.scope)
+    dep = getattr(route, "dependant", None)
+    if dep is None:
+        return True
+    query, q_errors = request_params_to_args(dep.query_params, request.query_params)
+    path, p_errors = request_params_to_args(dep.path_params, path_params)
+    if q_errors or p_errors:
+        return True
+    try:
+        _token_norm(query.get("token"))
+        if query.get("bucket"):
+            _parse_bucket(query["bucket"])
+    except HTTPException:
+        return True
+    if "pool_id" in path:
+        meta = await _meta_for([path["pool_id"]])
+        return path["pool_id"] not in meta.pool_pos
+    return False
+
+@app.middleware("http")
+async def conditional_get(request: Request, call_next):
+    if request.method != "GET" or not request.url.path.startswith(CONDITIONAL_PREFIXES):
+        return await call_next(request)
+    try:
+        wm = await _watermark()
+    except Exception:
+        return await call_next(request)
+
+    etag = _etag_for(request, wm)
+    inm = request.headers.get("if-none-match")
+    tags = [t.strip() for t in inm.split(",")] if inm is not None else []
+    match = "*" in tags or etag in tags or f"W/{etag}" in tags
+    # No Last-Modified/If-Modified-Since: a timestamp cannot follow every input of the ETag.
+    # A match is answered without running the route unless the route would answer 4xx; then it
+    # runs, and if it succeeds after all, streamed exports answer 304 before running their query.
+    if match and not await _fails_cheaply(request):
+        return Response(status_code=304, headers={"ETag": etag})
+    token = _not_modified.set(etag if match else None)
+    try:
+        response = await call_next(request)
+    finally:
+        _not_modified.reset(token)
+    if response.status_code != 200:
+        return response
+    if match:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return response
+
+# ---------- metrics (Prometheus) ----------
+def _match_route(scope) -> Tuple[Any, Dict[str, Any]]:
+    """(route, path params) the router will pick for scope; (None, {}) when nothing matches."""
+    for r in app.router.routes:
+        m, child = r.matches(scope)
+        if m == Match.FULL:
+            return r, child.get("path_params", {})
+    return None, {}
+
+def _route_label(request: Request) -> str:
+    # Route template, not the raw path, to keep label cardinality bounded
+    route = request.scope.get("route") or _match_route(request.scope)[0]
+    return getattr(route, "path", "unmatched")
+
+# Registered after conditional_get so it is the outer middleware and also times 304s
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    acc = [0.0]
+    token = metrics.db_time.set(acc)
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.db_time.reset(token)
+        route = _route_label(request)
+        metrics.http_duration.observe(time.perf_counter() - t0, request.method, route, str(status))
+        metrics.http_db_duration.observe(acc[0], request.method, route)
+
+metrics.REGISTRY.register(metrics.Gauge(
+    "lp_cache_entries", "Entries currently held per TTLCache.", ("cache",),
+    lambda: {(c.name,): len(c) for c in (cache_tokens, cache_pools, cache_metrics, cache_top, cache_agg, cache_totals, cache_watermark)}))
+metrics.REGISTRY.register(metrics.Gauge(
+    "lp_db_pool_connections", "SQLAlchemy pool connections by state.", ("state",),
+    lambda: {("checked_out",): engine.pool.checkedout(), ("idle",): engine.pool.checkedin(), ("overflow",): max(engine.pool.overflow(), 0)}))
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.get("/health")
 async def health():
@@ -76,40 +576,34 @@ async def list_tokens(
     q: Optional[str] = Query(None),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque next_cursor from a previous page; replaces page"),
+    total_mode: TotalMode = Query("exact"),
 ):
-    key = ("tokens", q or "", page, page_size)
+    key = ("tokens", q or "", page, page_size, cursor or "", total_mode)
     cached = cache_tokens.get(key)
     if cached:
-        return Page(page=page, page_size=page_size, total=cached["total"], items=cached["items"])
+        return Page(page=page, page_size=page_size, total_mode=total_mode, **cached)
 
+    meta = await _meta_index()
     limit = page_size
-    offset = (page - 1) * page_size
-    where = "(:q is null or t.symbol ilike '%' || :q || '%')"
-
-    count_sql = text(f"select count(*) from tokens t where {where}").bindparams(
-        bindparam("q", type_=String),
-    )
-    data_sql = text(f"""
-      select t.address, t.symbol, t.decimals
-      from tokens t
-      where {where}
-      order by coalesce(t.symbol,'') asc, t.address asc
-      limit :limit offset :offset
-    """).bindparams(
-        bindparam("q", type_=String),
-        bindparam("limit", type_=Integer),
-        bindparam("offset", type_=Integer),
-    )
-    params = {"q": q, "limit": limit, "offset": offset}
-
-    async with SessionLocal() as session:
-        total = (await session.execute(count_sql, params)).scalar_one()
-        rows = (await session.execute(data_sql, params)).mappings().all()
-
-    items = [TokenOut(address=r["address"], symbol=r["symbol"], decimals=r["decimals"]) for r in rows]
-    payload = {"total": total, "items": items}
+    offset = 0 if cursor else (page - 1) * page_size
+    after = None
+    if cursor:
+        after = tuple(_decode_cursor(cursor, "tokens", (_cursor_str, _cursor_str)))
+
+    # Served from the metadata index; counting in memory is as cheap as estimating
+    total = None if total_mode == "none" else sum(1 for _ in meta.iter_tokens(q))
+    page_idx = list(islice(meta.iter_tokens(q, after), offset, offset + limit + 1))
+    has_more = len(page_idx) > limit
+    page_idx = page_idx[:limit]
+    items = [TokenOut(**meta.token_out(j)) for j in page_idx]
+    next_cursor = None
+    if has_more:
+        last = page_idx[-1]
+        next_cursor = _encode_cursor("tokens", [meta.token_sym[last] or "", meta.token_addr[last]])
+    payload = {"total": total, "has_more": has_more, "items": items, "next_cursor": next_cursor}
     cache_tokens.set(key, payload)
-    return Page(page=page, page_size=page_size, total=total, items=items)
+    return Page(page=page, page_size=page_size, total_mode=total_mode, **payload)
 
 # ---------- POOLS LIST ----------
 @app.get("/pools", response_model=Page)
@@ -123,99 +617,41 @@ async def list_pools(
     order_dir: Literal["asc", "desc"] = "desc",
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque next_cursor from a previous page; replaces page"),
+    total_mode: TotalMode = Query("exact"),
 ):
-    token_norm = token.lower() if token else None
-    if token_norm and (not token_norm.startswith("0x") or len(token_norm) != 42):
-        raise HTTPException(status_code=400, detail="Invalid token address")
+    token_norm = _token_norm(token)
 
-    key = ("pools", version, token_norm or "", token_symbol or "", fee_min, fee_max, order_by, order_dir, page, page_size)
+    filter_key = ("pools", version, token_norm or "", token_symbol or "", fee_min, fee_max)
+    key = filter_key + (order_by, order_dir, page, page_size, cursor or "", total_mode)
     cached = cache_pools.get(key)
     if cached:
-        return Page(page=page, page_size=page_size, total=cached["total"], items=cached["items"])
+        return Page(page=page, page_size=page_size, total_mode=total_mode, **cached)
 
+    meta = await _meta_index()
     limit = page_size
-    offset = (page - 1) * page_size
-
-    allowed_cols = {"created_at_ts": "p.created_at_ts", "fee_tier_bps": "p.fee_tier_bps"}
-    col_sql = allowed_cols[order_by]
-    dir_sql = "ASC" if order_dir.lower() == "asc" else "DESC"
-
-    where = """
-      (:version is null or p.version = :version)
-      and (:token is null or p.token0_id = :token or p.token1_id = :token)
-      and (:token_symbol is null or t0.symbol ilike :ts_like or t1.symbol ilike :ts_like)
-      and (:fee_min is null or p.fee_tier_bps >= :fee_min)
-      and (:fee_max is null or p.fee_tier_bps <= :fee_max)
-    """
-
-    count_sql = text(f"""
-      select count(*) from pools p
-      join tokens t0 on t0.id = p.token0_id
-      join tokens t1 on t1.id = p.token1_id
-      where {where}
-    """).bindparams(
-        bindparam("version", type_=SmallInteger),
-        bindparam("token", type_=String),
-        bindparam("token_symbol", type_=String),
-        bindparam("ts_like", type_=String),
-        bindparam("fee_min", type_=Integer),
-        bindparam("fee_max", type_=Integer),
-    )
-
-    data_sql = text(f"""
-      select
-        p.id, p.version, p.chain_id, p.fee_tier_bps, p.tick_spacing, p.created_at_ts,
-        t0.address as t0_addr, t0.symbol as t0_sym, t0.decimals as t0_dec,
-        t1.address as t1_addr, t1.symbol as t1_sym, t1.decimals as t1_dec
-      from pools p
-      join tokens t0 on t0.id = p.token0_id
-      join tokens t1 on t1.id = p.token1_id
-      where {where}
-      order by {col_sql} {dir_sql}
-      limit :limit offset :offset
-    """).bindparams(
-        bindparam("version", type_=SmallInteger),
-        bindparam("token", type_=String),
-        bindparam("token_symbol", type_=String),
-        bindparam("ts_like", type_=String),
-        bindparam("fee_min", type_=Integer),
-        bindparam("fee_max", type_=Integer),
-        bindparam("limit", type_=Integer),
-        bindparam("offset", type_=Integer),
-    )
-
-    ts_like = f"%{token_symbol}%" if token_symbol else None
-    params = {
-        "version": version,
-        "token": token_norm,
-        "token_symbol": token_symbol,
-        "ts_like": ts_like,
-        "fee_min": fee_min,
-        "fee_max": fee_max,
-        "limit": limit,
-        "offset": offset,
-    }
-
-    async with SessionLocal() as session:
-        total = (await session.execute(count_sql, params)).scalar_one()
-        rows = (await session.execute(data_sql, params)).mappings().all()
-
-    items = []
-    for r in rows:
-        items.append({
-            "id": r["id"],
-            "version": r["version"],
-            "chain_id": r["chain_id"],
-            "token0": {"address": r["t0_addr"], "symbol": r["t0_sym"], "decimals": r["t0_dec"]},
-            "token1": {"address": r["t1_addr"], "symbol": r["t1_sym"], "decimals": r["t1_dec"]},
-            "fee_tier_bps": r["fee_tier_bps"],
-            "tick_spacing": r["tick_spacing"],
-            "created_at_ts": r["created_at_ts"],
-        })
-
-    payload = {"total": total, "items": items}
+    offset = 0 if cursor else (page - 1) * page_size
+    sort_id = f"pools:{order_by}:{order_dir}"
+    after = None
+    if cursor:
+        after = tuple(_decode_cursor(cursor, sort_id, (_cursor_int, _cursor_str)))
+
+    match = meta.pool_matcher(version, token_norm, token_symbol, fee_min, fee_max)
+    total = None
+    if total_mode != "none":
+        total = sum(1 for i in meta.candidates(version, token_norm) if match(i))
+    page_idx = list(islice(meta.iter_pools(order_by, order_dir == "desc", match, after), offset, offset + limit + 1))
+    has_more = len(page_idx) > limit
+    page_idx = page_idx[:limit]
+    items = [meta.pool_out(i) for i in page_idx]
+
+    next_cursor = None
+    if has_more:
+        last = items[-1]
+        next_cursor = _encode_cursor(sort_id, [last[order_by], last["id"]])
+    payload = {"total": total, "has_more": has_more, "items": items, "next_cursor": next_cursor}
     cache_pools.set(key, payload)
-    return Page(page=page, page_size=page_size, total=total, items=items)
+    return Page(page=page, page_size=page_size, total_mode=total_mode, **payload)
 
 # ---------- METRICS SUMMARY ----------
 @app.get("/metrics/summary")
@@ -232,79 +668,12 @@ async def metrics_summary(
     if cached:
         return cached
 
-    where = """
-      (:version is null or p.version = :version)
-      and (:token is null or p.token0_id = :token or p.token1_id = :token)
-      and (:token_symbol is null or t0.symbol ilike :ts_like or t1.symbol ilike :ts_like)
-      and (:fee_min is null or p.fee_tier_bps >= :fee_min)
-      and (:fee_max is null or p.fee_tier_bps <= :fee_max)
-    """
-    ts_like = f"%{token_symbol}%" if token_symbol else None
-
-    total_sql = text(f"""
-      select count(*) from pools p
-      join tokens t0 on t0.id = p.token0_id
-      join tokens t1 on t1.id = p.token1_id
-      where {where}
-    """).bindparams(
-        bindparam("version", type_=SmallInteger),
-        bindparam("token", type_=String),
-        bindparam("token_symbol", type_=String),
-        bindparam("ts_like", type_=String),
-        bindparam("fee_min", type_=Integer),
-        bindparam("fee_max", type_=Integer),
-    )
-    by_ver_sql = text(f"""
-      select p.version as version, count(*) as cnt
-      from pools p
-      join tokens t0 on t0.id = p.token0_id
-      join tokens t1 on t1.id = p.token1_id
-      where {where}
-      group by p.version
-      order by p.version asc
-    """).bindparams(
-        bindparam("version", type_=SmallInteger),
-        bindparam("token", type_=String),
-        bindparam("token_symbol", type_=String),
-        bindparam("ts_like", type_=String),
-        bindparam("fee_min", type_=Integer),
-        bindparam("fee_max", type_=Integer),
-    )
-    by_fee_sql = text(f"""
-      select p.fee_tier_bps as fee, count(*) as cnt
-      from pools p
-      join tokens t0 on t0.id = p.token0_id
-      join tokens t1 on t1.id = p.token1_id
-      where {where}
-      group by p.fee_tier_bps
-      order by p.fee_tier_bps asc
-    """).bindparams(
-        bindparam("version", type_=SmallInteger),
-        bindparam("token", type_=String),
-        bindparam("token_symbol", type_=String),
-        bindparam("ts_like", type_=String),
-        bindparam("fee_min", type_=Integer),
-        bindparam("fee_max", type_=Integer),
-    )
-
-    params = {
-        "version": version,
-        "token": token_norm,
-        "token_symbol": token_symbol,
-        "ts_like": ts_like,
-        "fee_min": fee_min,
-        "fee_max": fee_max,
-    }
-
-    async with SessionLocal() as session:
-        total = (await session.execute(total_sql, params)).scalar_one()
-        by_ver = (await session.execute(by_ver_sql, params)).mappings().all()
-        by_fee = (await session.execute(by_fee_sql, params)).mappings().all()
-
+    meta = await _meta_index()
+    total, by_ver, by_fee = meta.summary(meta.filter_pools(version, token_norm, token_symbol, fee_min, fee_max))
     result = {
         "total": total,
-        "by_version": [{"version": int(r["version"]), "count": int(r["cnt"])} for r in by_ver],
-        "by_fee_tier": [{"fee_tier_bps": int(r["fee"]), "count": int(r["cnt"])} for r in by_fee],
+        "by_version": [{"version": v, "count": n} for v, n in sorted(by_ver.items())],
+        "by_fee_tier": [{"fee_tier_bps": f, "count": n} for f, n in sorted(by_fee.items())],
         "cache_ttl_seconds": cache_metrics.ttl,
     }
     cache_metrics.set(key, result)
@@ -319,6 +688,326 @@ def _window_threshold(window: str, lookback: int, since_day_id: Optional[int], s
         th = int(since_hour_id if since_hour_id is not None else (time.time() // 3600) - lookback)
         return th, "pool_hour_data", "hour_start_unix"
 
+# Resampling for /pools/{id}/agg: "<n>h", "<n>d", "<n>w" (weeks start on Monday) or "<n>mo"
+# (calendar months, aligned so 3mo = quarters, 12mo = years). Whole days come from pool_day_data.
+BUCKET_RE = re.compile(r"^(\d+)(h|d|w|mo)$")
+EPOCH_DATE = date(1970, 1, 1)
+
+def _parse_bucket(spec: str) -> Tuple[str, int, str, str]:
+    """-> (unit, n, agg_table, agg_field); unit is "h" (hour table), "d", "w" or "mo" (day table)."""
+    m = BUCKET_RE.match(spec)
+    n = int(m.group(1)) if m else 0
+    if not m or n < 1 or n > 10000:
+        raise HTTPException(status_code=400, detail="Invalid bucket (use e.g. 4h, 1d, 1w, 1mo)")
+    unit = m.group(2)
+    if unit == "h" and n % 24:
+        return "h", n, "pool_hour_data", "hour_start_unix"
+    if unit == "h":
+        unit, n = "d", n // 24
+    return unit, n, "pool_day_data", "date"
+
+def _bucket_start(unit: str, n: int, t: int) -> int:
+    """Start of the bucket holding t (hour id for "h", day id otherwise)."""
+    if unit == "w":
+        return (t + 3) // (7 * n) * (7 * n) - 3
+    if unit == "mo":
+        d = EPOCH_DATE + timedelta(days=t)
+        mi = (d.year * 12 + d.month - 1) // n * n
+        return (date(mi // 12, mi % 12 + 1, 1) - EPOCH_DATE).days
+    return t // n * n
+
+def _resample_window(bucket: str, window: str, th: int, agg_table: str) -> Tuple[str, int, int, str, str]:
+    """
+    Same window, summed server-side: -> (unit, n for the SQL, th, agg_table, agg_field), with th in the
+    source table's unit and moved back to a bucket boundary so no bucket is partial.
+    """
+    unit, n, src_table, src_field = _parse_bucket(bucket)
+    if src_table != agg_table:
+        th = th * 24 if window == "day" else th // 24
+    return unit, 7 * n if unit == "w" else n, _bucket_start(unit, n, th), src_table, src_field
+
+# Cold tier: hours below a table's archive cutoff live in Parquet files (backend/db/archive.py).
+# Hourly reads bind max(th, cutoff) for the SQL and take older hours from the files.
+AGG_COLUMNS = ("volume_token0", "volume_token1", "approx_fee_token0", "approx_fee_token1", "swap_count")
+
+def _cold_cut(table: str, th: int) -> Optional[int]:
+    """The table's archive cutoff when a window starting at th reaches below it."""
+    cut = archive.cutoff(table)
+    return cut if cut is not None and th < cut else None
+
+def _cold_agg(pool_ids: List[str], th: int, until: int, n: int = 1, max_rows: Optional[int] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Archived pool_hour_data per pool in n-hour buckets (keyed like _bucket_expr), newest first."""
+    t = archive.read("pool_hour_data", pool_ids, th, until, ["pool_id", "hour_start_unix", *AGG_COLUMNS], max_rows)
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    if not t.num_rows:
+        return out
+    pids = np.asarray(t["pool_id"].to_pylist(), dtype=object)
+    b = t["hour_start_unix"].to_numpy() // n * n
+    vals = np.column_stack([t[c].fill_null(0).to_numpy().astype(np.float64) for c in AGG_COLUMNS])
+    for pid in set(pids.tolist()):
+        m = pids == pid
+        keys, inv = np.unique(b[m], return_inverse=True)
+        sums = np.zeros((len(keys), len(AGG_COLUMNS)))
+        np.add.at(sums, inv, vals[m])
+        out[pid] = [{"bucket": k, **dict(zip(AGG_COLUMNS, v))} for k, v in zip(keys[::-1].tolist(), sums[::-1].tolist())]
+    return out
+
+def _with_cold_agg(rows, cold: List[Dict[str, Any]], limit: int) -> List[Any]:
+    """Hot rows then cold rows (both newest first); a bucket straddling the cutoff is summed."""
+    out = list(rows)
+    if cold and out and int(out[-1]["bucket"]) == cold[0]["bucket"]:
+        out[-1] = {**out[-1], **{c: float(out[-1][c]) + cold[0][c] for c in AGG_COLUMNS}}
+        cold = cold[1:]
+    return (out + cold)[:limit]
+
+def _cold_candles(pool_id: str, price: str, since: int, until: int, limit: int) -> List[Dict[str, Any]]:
+    """Archived 1h candles (the hourly snapshots themselves), newest first."""
+    t = archive.read("pool_price_hour", [pool_id], since, until, ["hour_start_unix", price, "liquidity"], limit)
+    hs, ps, ls = (c.to_pylist() for c in t.columns)
+    return [{"bucket": h, "open": p, "high": p, "low": p, "close": p, "liquidity": l, "hours": 1}
+            for h, p, l in zip(hs[::-1], ps[::-1], ls[::-1])][:limit]
+
+# ---------- query shapes ----------
+# Each distinct SQL shape (window table, metric, which predicates are present) is built once and
+# reused, so requests only bind values. Stable SQL text also means asyncpg prepares each shape
+# once per connection and Postgres plans every filter combination separately.
+# metric -> (ranking expression, its alias, extra select columns)
+TOP_METRICS = {
+    "fees": ("sum(coalesce(a.approx_fee_token0,0) + coalesce(a.approx_fee_token1,0))", "fees_sum", ""),
+    "volume:both": ("sum(coalesce(a.volume_token0,0) + coalesce(a.volume_token1,0))", "volume_sum", ", sum(coalesce(a.swap_count,0)) as swaps"),
+    "volume:token0": ("sum(coalesce(a.volume_token0,0))", "volume_sum", ", sum(coalesce(a.swap_count,0)) as swaps"),
+    "volume:token1": ("sum(coalesce(a.volume_token1,0))", "volume_sum", ", sum(coalesce(a.swap_count,0)) as swaps"),
+}
+
+def _top_from(agg_table: str, agg_field: str, pooled: bool, cold: bool) -> str:
+    """
+    Rows of the window. With cold, the table is read from :th (the archive cutoff) and each pool's
+    archived hours are added as one row of sums from the :cold_* arrays.
+    """
+    where = f"a.{agg_field} >= :th" + (" and a.pool_id = any(:pool_ids)" if pooled else "")
+    if not cold:
+        return f"from {agg_table} a where {where}"
+    return f"""from (
+        select a.pool_id, {", ".join("a." + c for c in AGG_COLUMNS)} from {agg_table} a where {where}
+        union all
+        select c.pool_id, {", ".join(f"c.{c}::numeric" for c in AGG_COLUMNS[:-1])}, c.swap_count::bigint
+        from unnest(:cold_pool_id, {", ".join(f":cold_{c}" for c in AGG_COLUMNS)}) as c(pool_id, {", ".join(AGG_COLUMNS)})
+      ) a"""
+
+@lru_cache(maxsize=None)
+def _top_binds(pooled: bool, cold: bool = False) -> Tuple:
+    binds = [bindparam("th", type_=Integer)]
+    if pooled:
+        binds.append(bindparam("pool_ids", type_=ARRAY(String)))
+    if cold:
+        binds.append(bindparam("cold_pool_id", type_=ARRAY(String)))
+        binds += [bindparam(f"cold_{c}", type_=ARRAY(Float)) for c in AGG_COLUMNS]
+    return tuple(binds)
+
+@lru_cache(maxsize=None)
+def _top_rows_sql(agg_table: str, agg_field: str, pooled: bool, cold: bool = False) -> str:
+    """Pools in the window (the row set behind totals)."""
+    return f"""
+      select a.pool_id
+      {_top_from(agg_table, agg_field, pooled, cold)}
+      group by a.pool_id
+    """
+
+@lru_cache(maxsize=None)
+def _top_page_sql(metric: str, agg_table: str, agg_field: str, pooled: bool, keyset: bool, cold: bool = False):
+    expr, alias, extra = TOP_METRICS[metric]
+    having = ""
+    if keyset:
+        # The cursor filters the grouped rows, so every page still aggregates the whole window
+        having = f"having {expr} < :c_metric or ({expr} = :c_metric and a.pool_id > :c_id)"
+    sql = text(f"""
+      select a.pool_id as id, {expr} as {alias}{extra}
+      {_top_from(agg_table, agg_field, pooled, cold)}
+      group by a.pool_id
+      {having}
+      order by {alias} desc, a.pool_id asc
+      limit :limit offset :offset
+    """).bindparams(*_top_binds(pooled, cold), bindparam("limit", type_=Integer), bindparam("offset", type_=Integer))
+    if keyset:
+        sql = sql.bindparams(bindparam("c_metric", type_=Numeric), bindparam("c_id", type_=String))
+    return sql
+
+@lru_cache(maxsize=None)
+def _top_export_sql(metric: str, agg_table: str, agg_field: str, pooled: bool, cold: bool = False):
+    expr, alias, extra = TOP_METRICS[metric]
+    return text(f"""
+      select a.pool_id as id, {expr} as {alias}{extra}
+      {_top_from(agg_table, agg_field, pooled, cold)}
+      group by a.pool_id
+      order by {alias} desc
+      limit :limit
+    """).bindparams(*_top_binds(pooled, cold), bindparam("limit", type_=Integer))
+
+def _cold_sums(pool_ids: Optional[List[str]], th: int, until: int) -> Dict[str, List[Any]]:
+    """Per-pool sums of archived pool_hour_data, as the :cold_* arrays of _top_from."""
+    t = archive.read("pool_hour_data", pool_ids, th, until, ["pool_id", *AGG_COLUMNS])
+    g = t.group_by("pool_id").aggregate([(c, "sum") for c in AGG_COLUMNS])
+    return {"cold_pool_id": g["pool_id"].to_pylist(), **{f"cold_{c}": g[f"{c}_sum"].to_pylist() for c in AGG_COLUMNS}}
+
+async def _top_cold(agg_table: str, th: int, pool_ids: Optional[List[str]]) -> Tuple[int, Optional[Dict[str, List[Any]]]]:
+    """(threshold for the table, :cold_* params or None) for a top-list window."""
+    cut = _cold_cut(agg_table, th) if agg_table == "pool_hour_data" else None
+    if cut is None:
+        return th, None
+    key = ("cold_sums", agg_table, th, cut, tuple(pool_ids) if pool_ids is not None else None)
+    sums = cache_top.get(key)
+    if sums is None:
+        sums = await asyncio.to_thread(_cold_sums, pool_ids, th, cut - 1)
+        cache_top.set(key, sums)
+    return cut, sums
+
+@lru_cache(maxsize=None)
+def _series_sql(agg_table: str, agg_field: str):
+    """One pool's buckets in the window, newest first."""
+    return text(f"""
+      select
+        a.{agg_field} as bucket,
+        coalesce(a.volume_token0,0) as volume_token0,
+        coalesce(a.volume_token1,0) as volume_token1,
+        coalesce(a.approx_fee_token0,0) as approx_fee_token0,
+        coalesce(a.approx_fee_token1,0) as approx_fee_token1,
+        coalesce(a.swap_count,0) as swap_count
+      from {agg_table} a
+      where a.pool_id = :pool_id and a.{agg_field} >= :th
+      order by a.{agg_field} desc
+      limit :limit
+    """).bindparams(
+        bindparam("pool_id", type_=String),
+        bindparam("th", type_=Integer),
+        bindparam("limit", type_=Integer),
+    )
+
+@lru_cache(maxsize=None)
+def _series_batch_sql(agg_table: str, agg_field: str):
+    """Newest :limit buckets per pool for pool_id = any(:pool_ids)."""
+    return text(f"""
+      select pool_id, bucket, volume_token0, volume_token1, approx_fee_token0, approx_fee_token1, swap_count
+      from (
+        select
+          a.pool_id,
+          a.{agg_field} as bucket,
+          coalesce(a.volume_token0,0) as volume_token0,
+          coalesce(a.volume_token1,0) as volume_token1,
+          coalesce(a.approx_fee_token0,0) as approx_fee_token0,
+          coalesce(a.approx_fee_token1,0) as approx_fee_token1,
+          coalesce(a.swap_count,0) as swap_count,
+          row_number() over (partition by a.pool_id order by a.{agg_field} desc) as rn
+        from {agg_table} a
+        where a.pool_id = any(:pool_ids) and a.{agg_field} >= :th
+      ) s
+      where rn <= :limit
+      order by pool_id, bucket desc
+    """).bindparams(
+        bindparam("pool_ids", type_=ARRAY(String)),
+        bindparam("th", type_=Integer),
+        bindparam("limit", type_=Integer),
+    )
+
+@lru_cache(maxsize=None)
+def _candles_sql(resolution: str, price: str):
+    """One pool's candles in [:since, :until], newest first; 1h reads pool_price_hour directly."""
+    hours = CANDLE_RESOLUTIONS[resolution][0]
+    if hours == 1:
+        sql = f"""
+      select hour_start_unix as bucket, {price} as open, {price} as high, {price} as low, {price} as close, liquidity, 1 as hours
+      from pool_price_hour
+      where pool_id = :pool_id and hour_start_unix >= :since and hour_start_unix <= :until
+      order by hour_start_unix desc
+      limit :limit
+    """
+    else:
+        p = price[-1]
+        sql = f"""
+      select bucket, open{p} as open, high{p} as high, low{p} as low, close{p} as close, liquidity, hours
+      from pool_price_candle
+      where pool_id = :pool_id and resolution = {hours} and bucket >= :since and bucket <= :until
+      order by bucket desc
+      limit :limit
+    """
+    return text(sql).bindparams(
+        bindparam("pool_id", type_=String),
+        bindparam("since", type_=Integer),
+        bindparam("until", type_=Integer),
+        bindparam("limit", type_=Integer),
+    )
+
+def _bucket_expr(unit: str, col: str) -> str:
+    """
+    Bucket start as an hour id; :n is the bucket length in the unit (weeks in days, or months).
+    col is an hour id for "h" and a day id otherwise.
+    """
+    if unit == "h":
+        return f"{col} / :n * :n"
+    if unit == "d":
+        return f"{col} / :n * :n * 24"
+    if unit == "w":
+        return f"(({col} + 3) / :n * :n - 3) * 24"
+    d = f"(date '1970-01-01' + {col})"
+    return f"""(extract(epoch from date_trunc('month', {d}) - make_interval(months =>
+              (extract(year from {d})::int * 12 + extract(month from {d})::int - 1) % :n)) / 3600)::int"""
+
+@lru_cache(maxsize=None)
+def _resampled_sql(unit: str, agg_table: str, agg_field: str):
+    """One pool's buckets of :n units from :th (aligned to a bucket start), newest first."""
+    return text(f"""
+      select
+        {_bucket_expr(unit, "a." + agg_field)} as bucket,
+        sum(coalesce(a.volume_token0,0)) as volume_token0,
+        sum(coalesce(a.volume_token1,0)) as volume_token1,
+        sum(coalesce(a.approx_fee_token0,0)) as approx_fee_token0,
+        sum(coalesce(a.approx_fee_token1,0)) as approx_fee_token1,
+        sum(coalesce(a.swap_count,0)) as swap_count
+      from {agg_table} a
+      where a.pool_id = :pool_id and a.{agg_field} >= :th
+      group by 1
+      order by 1 desc
+      limit :limit
+    """).bindparams(
+        bindparam("pool_id", type_=String),
+        bindparam("th", type_=Integer),
+        bindparam("n", type_=Integer),
+        bindparam("limit", type_=Integer),
+    )
+
+@lru_cache(maxsize=None)
+def _pair_tiers_sql(unit: str, agg_table: str, agg_field: str):
+    """Bucketed volume/fees/swaps and last price0 per bucket for pool_id = any(:pool_ids), in one pass."""
+    price_col = "h.hour_start_unix" if unit == "h" else "(h.hour_start_unix / 24)"
+    return text(f"""
+      with v as (
+        select
+          a.pool_id,
+          {_bucket_expr(unit, "a." + agg_field)} as bucket,
+          sum(coalesce(a.volume_token0,0)) as volume_token0,
+          sum(coalesce(a.volume_token1,0)) as volume_token1,
+          sum(coalesce(a.approx_fee_token0,0)) as approx_fee_token0,
+          sum(coalesce(a.approx_fee_token1,0)) as approx_fee_token1,
+          sum(coalesce(a.swap_count,0)) as swap_count
+        from {agg_table} a
+        where a.pool_id = any(:pool_ids) and a.{agg_field} >= :th
+        group by 1, 2
+      ), p as (
+        select distinct on (1, 2) h.pool_id, {_bucket_expr(unit, price_col)} as bucket, h.price0::float8 as price0
+        from pool_price_hour h
+        where h.pool_id = any(:pool_ids) and h.hour_start_unix >= :th_hour
+        order by 1, 2, h.hour_start_unix desc
+      )
+      select coalesce(v.pool_id, p.pool_id) as pool_id, coalesce(v.bucket, p.bucket) as bucket,
+             v.volume_token0, v.volume_token1, v.approx_fee_token0, v.approx_fee_token1, v.swap_count, p.price0
+      from v full join p on p.pool_id = v.pool_id and p.bucket = v.bucket
+      order by 2, 1
+    """).bindparams(
+        bindparam("pool_ids", type_=ARRAY(String)),
+        bindparam("th", type_=Integer),
+        bindparam("th_hour", type_=Integer),
+        bindparam("n", type_=Integer),
+    )
+
 # ---------- TOP FEES ----------
 @app.get("/pools/top_fees", response_model=Page)
 async def pools_top_fees(
@@ -334,88 +1023,69 @@ async def pools_top_fees(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
     limit: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque next_cursor from a previous page; replaces page"),
+    total_mode: TotalMode = Query("exact"),
 ):
-    token_norm = token.lower() if token else None
-    if token_norm and (not token_norm.startswith("0x") or len(token_norm) != 42):
-        raise HTTPException(status_code=400, detail="Invalid token address")
+    token_norm = _token_norm(token)
     if limit:
         page_size = limit
 
     limit_q = page_size
-    offset = (page - 1) * page_size
+    offset = 0 if cursor else (page - 1) * page_size
     th, agg_table, agg_field = _window_threshold(window, lookback, since_day_id, since_hour_id)
 
-    where = f"""
-      (:version is null or p.version = :version)
-      and (:token is null or p.token0_id = :token or p.token1_id = :token)
-      and (:token_symbol is null or t0.symbol ilike :ts_like or t1.symbol ilike :ts_like)
-      and (:fee_min is null or p.fee_tier_bps >= :fee_min)
-      and (:fee_max is null or p.fee_tier_bps <= :fee_max)
-      and a.{agg_field} >= :th
-    """
-    ts_like = f"%{token_symbol}%" if token_symbol else None
-    params_base = {
-        "version": version, "token": token_norm, "token_symbol": token_symbol, "ts_like": ts_like,
-        "fee_min": fee_min, "fee_max": fee_max, "th": th, "limit": limit_q, "offset": offset
-    }
+    sort_id = f"top_fees:{window}"
+    if cursor:
+        # The cursor pins the window threshold so a walk stays on one snapshot of the window
+        th, c_metric, c_id = _decode_cursor(cursor, sort_id, (_cursor_int, _cursor_decimal, _cursor_str))
 
-    count_sql = text(f"""
-      select count(*) from (
-        select p.id
-        from {agg_table} a
-        join pools p on p.id = a.pool_id
-        join tokens t0 on t0.id = p.token0_id
-        join tokens t1 on t1.id = p.token1_id
-        where {where}
-        group by p.id
-      ) s
-    """).bindparams(
-        bindparam("version", type_=SmallInteger), bindparam("token", type_=String),
-        bindparam("token_symbol", type_=String), bindparam("ts_like", type_=String),
-        bindparam("fee_min", type_=Integer), bindparam("fee_max", type_=Integer),
-        bindparam("th", type_=Integer)
-    )
-
-    data_sql = text(f"""
-      select
-        p.id, p.version, p.chain_id, p.fee_tier_bps, p.tick_spacing, p.created_at_ts,
-        t0.address as t0_addr, t0.symbol as t0_sym, t0.decimals as t0_dec,
-        t1.address as t1_addr, t1.symbol as t1_sym, t1.decimals as t1_dec,
-        sum(coalesce(a.approx_fee_token0,0) + coalesce(a.approx_fee_token1,0)) as fees_sum
-      from {agg_table} a
-      join pools p on p.id = a.pool_id
-      join tokens t0 on t0.id = p.token0_id
-      join tokens t1 on t1.id = p.token1_id
-      where {where}
-      group by p.id, p.version, p.chain_id, p.fee_tier_bps, p.tick_spacing, p.created_at_ts,
-               t0.address, t0.symbol, t0.decimals, t1.address, t1.symbol, t1.decimals
-      order by fees_sum desc
-      limit :limit offset :offset
-    """).bindparams(
-        bindparam("version", type_=SmallInteger), bindparam("token", type_=String),
-        bindparam("token_symbol", type_=String), bindparam("ts_like", type_=String),
-        bindparam("fee_min", type_=Integer), bindparam("fee_max", type_=Integer),
-        bindparam("th", type_=Integer), bindparam("limit", type_=Integer), bindparam("offset", type_=Integer)
-    )
+    key = ("top_fees", agg_table, th, version, token_norm or "", token_symbol or "", fee_min, fee_max,
+           page, page_size, cursor or "", total_mode)
+    cached = cache_top.get(key)
+    if cached:
+        return Page(page=page, page_size=page_size, total_mode=total_mode, **cached)
+
+    meta = await _meta_index()
+    pool_ids = _meta_pool_ids(meta, version, token_norm, token_symbol, fee_min, fee_max)
+    if pool_ids == []:
+        payload = {"total": None if total_mode == "none" else 0, "has_more": False, "items": [], "next_cursor": None}
+        cache_top.set(key, payload)
+        return Page(page=page, page_size=page_size, total_mode=total_mode, **payload)
+
+    pooled = pool_ids is not None
+    hot_th, cold = await _top_cold(agg_table, th, pool_ids)
+    params_base = {"th": hot_th, "limit": limit_q + 1, "offset": offset}
+    if pooled:
+        params_base["pool_ids"] = pool_ids
+    if cold is not None:
+        params_base.update(cold)
+    if cursor:
+        params_base.update({"c_metric": c_metric, "c_id": c_id})
+    filter_key = (agg_table, th, hot_th, version, token_norm or "", token_symbol or "", fee_min, fee_max)
+    data_sql = _top_page_sql("fees", agg_table, agg_field, pooled, bool(cursor), cold is not None)
 
     async with SessionLocal() as session:
-        total = (await session.execute(count_sql, params_base)).scalar_one()
-        rows = (await session.execute(data_sql, params_base)).mappings().all()
+        total = await _resolve_total(session, total_mode, filter_key, _top_rows_sql(agg_table, agg_field, pooled, cold is not None),
+                                     _top_binds(pooled, cold is not None), params_base, "top_fees")
+        rows = await _fetch_all(session, "top_fees", data_sql, params_base)
 
+    has_more = len(rows) > limit_q
+    rows = rows[:limit_q]
+    meta = await _meta_for([r["id"] for r in rows])
     items = []
     for r in rows:
-        items.append({
-            "pool": {
-                "id": r["id"], "version": r["version"], "chain_id": r["chain_id"],
-                "token0": {"address": r["t0_addr"], "symbol": r["t0_sym"], "decimals": r["t0_dec"]},
-                "token1": {"address": r["t1_addr"], "symbol": r["t1_sym"], "decimals": r["t1_dec"]},
-                "fee_tier_bps": r["fee_tier_bps"], "tick_spacing": r["tick_spacing"], "created_at_ts": r["created_at_ts"]
-            },
-            "fees_sum": float(r["fees_sum"]),
-            "window": window
-        })
-
-    return Page(page=page, page_size=page_size, total=total, items=items)
+        i = meta.pool_pos.get(r["id"])
+        if i is None:
+            continue
+        items.append({"pool": meta.pool_out(i), "fees_sum": float(r["fees_sum"]), "window": window})
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = _encode_cursor(sort_id, [th, str(last["fees_sum"]), last["id"]])
+    payload = {"total": total, "has_more": has_more, "items": items, "next_cursor": next_cursor}
+    cache_top.set(key, payload)
+    return Page(page=page, page_size=page_size, total_mode=total_mode, **payload)
 
 # ---------- TOP VOLUME ----------
 @app.get("/pools/top_volume", response_model=Page)
@@ -433,99 +1103,231 @@ async def pools_top_volume(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
     limit: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque next_cursor from a previous page; replaces page"),
+    total_mode: TotalMode = Query("exact"),
 ):
-    token_norm = token.lower() if token else None
-    if token_norm and (not token_norm.startswith("0x") or len(token_norm) != 42):
-        raise HTTPException(status_code=400, detail="Invalid token address")
+    token_norm = _token_norm(token)
     if limit:
         page_size = limit
 
     limit_q = page_size
-    offset = (page - 1) * page_size
+    offset = 0 if cursor else (page - 1) * page_size
     th, agg_table, agg_field = _window_threshold(window, lookback, since_day_id, since_hour_id)
 
-    vol_expr = {
-        "both": "sum(coalesce(a.volume_token0,0) + coalesce(a.volume_token1,0))",
-        "token0": "sum(coalesce(a.volume_token0,0))",
-        "token1": "sum(coalesce(a.volume_token1,0))",
-    }[side]
-
-    where = f"""
-      (:version is null or p.version = :version)
-      and (:token is null or p.token0_id = :token or p.token1_id = :token)
-      and (:token_symbol is null or t0.symbol ilike :ts_like or t1.symbol ilike :ts_like)
-      and (:fee_min is null or p.fee_tier_bps >= :fee_min)
-      and (:fee_max is null or p.fee_tier_bps <= :fee_max)
-      and a.{agg_field} >= :th
-    """
-    ts_like = f"%{token_symbol}%" if token_symbol else None
-    params_base = {
-        "version": version, "token": token_norm, "token_symbol": token_symbol, "ts_like": ts_like,
-        "fee_min": fee_min, "fee_max": fee_max, "th": th, "limit": limit_q, "offset": offset
-    }
+    sort_id = f"top_volume:{window}:{side}"
+    if cursor:
+        # The cursor pins the window threshold so a walk stays on one snapshot of the window
+        th, c_metric, c_id = _decode_cursor(cursor, sort_id, (_cursor_int, _cursor_decimal, _cursor_str))
 
-    count_sql = text(f"""
-      select count(*) from (
-        select p.id
-        from {agg_table} a
-        join pools p on p.id = a.pool_id
-        join tokens t0 on t0.id = p.token0_id
-        join tokens t1 on t1.id = p.token1_id
-        where {where}
-        group by p.id
-      ) s
-    """).bindparams(
-        bindparam("version", type_=SmallInteger), bindparam("token", type_=String),
-        bindparam("token_symbol", type_=String), bindparam("ts_like", type_=String),
-        bindparam("fee_min", type_=Integer), bindparam("fee_max", type_=Integer),
-        bindparam("th", type_=Integer)
-    )
-
-    data_sql = text(f"""
-      select
-        p.id, p.version, p.chain_id, p.fee_tier_bps, p.tick_spacing, p.created_at_ts,
-        t0.address as t0_addr, t0.symbol as t0_sym, t0.decimals as t0_dec,
-        t1.address as t1_addr, t1.symbol as t1_sym, t1.decimals as t1_dec,
-        {vol_expr} as volume_sum,
-        sum(coalesce(a.swap_count,0)) as swaps
-      from {agg_table} a
-      join pools p on p.id = a.pool_id
-      join tokens t0 on t0.id = p.token0_id
-      join tokens t1 on t1.id = p.token1_id
-      where {where}
-      group by p.id, p.version, p.chain_id, p.fee_tier_bps, p.tick_spacing, p.created_at_ts,
-               t0.address, t0.symbol, t0.decimals, t1.address, t1.symbol, t1.decimals
-      order by volume_sum desc
-      limit :limit offset :offset
-    """).bindparams(
-        bindparam("version", type_=SmallInteger), bindparam("token", type_=String),
-        bindparam("token_symbol", type_=String), bindparam("ts_like", type_=String),
-        bindparam("fee_min", type_=Integer), bindparam("fee_max", type_=Integer),
-        bindparam("th", type_=Integer), bindparam("limit", type_=Integer), bindparam("offset", type_=Integer)
-    )
+    key = ("top_volume", agg_table, th, side, version, token_norm or "", token_symbol or "", fee_min, fee_max,
+           page, page_size, cursor or "", total_mode)
+    cached = cache_top.get(key)
+    if cached:
+        return Page(page=page, page_size=page_size, total_mode=total_mode, **cached)
+
+    meta = await _meta_index()
+    pool_ids = _meta_pool_ids(meta, version, token_norm, token_symbol, fee_min, fee_max)
+    if pool_ids == []:
+        payload = {"total": None if total_mode == "none" else 0, "has_more": False, "items": [], "next_cursor": None}
+        cache_top.set(key, payload)
+        return Page(page=page, page_size=page_size, total_mode=total_mode, **payload)
+
+    pooled = pool_ids is not None
+    hot_th, cold = await _top_cold(agg_table, th, pool_ids)
+    params_base = {"th": hot_th, "limit": limit_q + 1, "offset": offset}
+    if pooled:
+        params_base["pool_ids"] = pool_ids
+    if cold is not None:
+        params_base.update(cold)
+    if cursor:
+        params_base.update({"c_metric": c_metric, "c_id": c_id})
+    filter_key = (agg_table, th, hot_th, version, token_norm or "", token_symbol or "", fee_min, fee_max)
+    data_sql = _top_page_sql(f"volume:{side}", agg_table, agg_field, pooled, bool(cursor), cold is not None)
 
     async with SessionLocal() as session:
-        total = (await session.execute(count_sql, params_base)).scalar_one()
-        rows = (await session.execute(data_sql, params_base)).mappings().all()
+        total = await _resolve_total(session, total_mode, filter_key, _top_rows_sql(agg_table, agg_field, pooled, cold is not None),
+                                     _top_binds(pooled, cold is not None), params_base, "top_volume")
+        rows = await _fetch_all(session, "top_volume", data_sql, params_base)
 
+    has_more = len(rows) > limit_q
+    rows = rows[:limit_q]
+    meta = await _meta_for([r["id"] for r in rows])
     items = []
     for r in rows:
+        i = meta.pool_pos.get(r["id"])
+        if i is None:
+            continue
         items.append({
-            "pool": {
-                "id": r["id"], "version": r["version"], "chain_id": r["chain_id"],
-                "token0": {"address": r["t0_addr"], "symbol": r["t0_sym"], "decimals": r["t0_dec"]},
-                "token1": {"address": r["t1_addr"], "symbol": r["t1_sym"], "decimals": r["t1_dec"]},
-                "fee_tier_bps": r["fee_tier_bps"], "tick_spacing": r["tick_spacing"], "created_at_ts": r["created_at_ts"]
-            },
+            "pool": meta.pool_out(i),
             "volume_sum": float(r["volume_sum"]),
             "swaps_sum": int(r["swaps"]),
             "side": side,
             "window": window
         })
 
-    return Page(page=page, page_size=page_size, total=total, items=items)
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = _encode_cursor(sort_id, [th, str(last["volume_sum"]), last["id"]])
+    payload = {"total": total, "has_more": has_more, "items": items, "next_cursor": next_cursor}
+    cache_top.set(key, payload)
+    return Page(page=page, page_size=page_size, total_mode=total_mode, **payload)
+
+# ---------- TOP YIELD ----------
+# Rolling fee APR / TVL per pool precomputed by backend/analytics/yields.py into pool_yield;
+# each ordering has a (window_hours, metric desc, pool_id) index.
+YIELD_WINDOWS = {"1d": 24, "7d": 168, "30d": 720}
+
+def _yield_rows_sql(sort_by: str, pooled: bool) -> str:
+    return f"""
+      select y.pool_id as id, y.{sort_by} as metric, y.end_hour, y.hours, y.tvl_token1, y.avg_tvl_token1,
+             y.fees_token1, y.fee_tvl, y.fee_apr
+      from pool_yield y
+      where y.window_hours = :window_hours and y.hours >= :min_hours{" and y.pool_id = any(:pool_ids)" if pooled else ""}"""
+
+@lru_cache(maxsize=None)
+def _yield_binds(pooled: bool) -> Tuple:
+    binds = [bindparam("window_hours", type_=Integer), bindparam("min_hours", type_=Integer)]
+    if pooled:
+        binds.append(bindparam("pool_ids", type_=ARRAY(String)))
+    return tuple(binds)
+
+@lru_cache(maxsize=None)
+def _yield_page_sql(sort_by: str, pooled: bool, keyset: bool):
+    after = f" and (y.{sort_by} < :c_metric or (y.{sort_by} = :c_metric and y.pool_id > :c_id))" if keyset else ""
+    sql = f"""{_yield_rows_sql(sort_by, pooled)}{after}
+      order by y.{sort_by} desc, y.pool_id
+      limit :limit offset :offset"""
+    binds = list(_yield_binds(pooled)) + [bindparam("limit", type_=Integer), bindparam("offset", type_=Integer)]
+    if keyset:
+        binds += [bindparam("c_metric", type_=Float), bindparam("c_id", type_=String)]
+    return text(sql).bindparams(*binds)
+
+@app.get("/pools/top_yield", response_model=Page)
+async def pools_top_yield(
+    window: Literal["1d", "7d", "30d"] = Query("7d"),
+    sort_by: Literal["fee_apr", "fee_tvl", "tvl_token1", "fees_token1"] = Query("fee_apr"),
+    min_hours: int = Query(1, ge=1, description="Hours with a price and active liquidity in the window"),
+    version: Optional[int] = Query(None),
+    token: Optional[str] = Query(None),
+    token_symbol: Optional[str] = Query(None),
+    fee_min: Optional[int] = Query(None, ge=0),
+    fee_max: Optional[int] = Query(None, ge=0),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque next_cursor from a previous page; replaces page"),
+    total_mode: TotalMode = Query("exact"),
+):
+    """Pools by rolling fee APR (full-range LP), fee/TVL, TVL or fees; TVL and fees are in each pool's token1."""
+    token_norm = _token_norm(token)
+    offset = 0 if cursor else (page - 1) * page_size
+    sort_id = f"top_yield:{window}:{sort_by}"
+    if cursor:
+        c_metric, c_id = _decode_cursor(cursor, sort_id, (_cursor_float, _cursor_str))
+
+    key = ("top_yield", "pool_yield", window, sort_by, min_hours, version, token_norm or "", token_symbol or "", fee_min, fee_max,
+           page, page_size, cursor or "", total_mode)
+    cached = cache_top.get(key)
+    if cached:
+        return Page(page=page, page_size=page_size, total_mode=total_mode, **cached)
+
+    meta = await _meta_index()
+    pool_ids = _meta_pool_ids(meta, version, token_norm, token_symbol, fee_min, fee_max)
+    if pool_ids == []:
+        payload = {"total": None if total_mode == "none" else 0, "has_more": False, "items": [], "next_cursor": None}
+        cache_top.set(key, payload)
+        return Page(page=page, page_size=page_size, total_mode=total_mode, **payload)
+
+    pooled = pool_ids is not None
+    params = {"window_hours": YIELD_WINDOWS[window], "min_hours": min_hours, "limit": page_size + 1, "offset": offset}
+    if pooled:
+        params["pool_ids"] = pool_ids
+    if cursor:
+        params.update({"c_metric": c_metric, "c_id": c_id})
+    filter_key = ("pool_yield", window, sort_by, min_hours, version, token_norm or "", token_symbol or "", fee_min, fee_max)
+    async with SessionLocal() as session:
+        total = await _resolve_total(session, total_mode, filter_key, _yield_rows_sql(sort_by, pooled), list(_yield_binds(pooled)),
+                                     params, "top_yield")
+        rows = await _fetch_all(session, "top_yield", _yield_page_sql(sort_by, pooled, bool(cursor)), params)
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    meta = await _meta_for([r["id"] for r in rows])
+    items = []
+    for r in rows:
+        i = meta.pool_pos.get(r["id"])
+        if i is None:
+            continue
+        items.append({"pool": meta.pool_out(i), "window": window, "end_hour": r["end_hour"], "hours": r["hours"],
+                      **{m: r[m] for m in ("tvl_token1", "avg_tvl_token1", "fees_token1", "fee_tvl", "fee_apr")}})
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = _encode_cursor(sort_id, [last["metric"], last["id"]])
+    payload = {"total": total, "has_more": has_more, "items": items, "next_cursor": next_cursor}
+    cache_top.set(key, payload)
+    return Page(page=page, page_size=page_size, total_mode=total_mode, **payload)
 
 # ---------- CSV EXPORTS ----------
+EXPORT_CHUNK_ROWS = 5000
+
+def _stream_csv(sql, params: Dict[str, Any], header: List[str], row_fn, name: str, tail=None) -> StreamingResponse:
+    """
+    Stream a query as CSV straight from a server-side cursor, one chunk of rows at a time.
+    The header goes out before the query runs; memory is bounded by EXPORT_CHUNK_ROWS.
+    tail(n) returns rows to append after the n streamed ones (the cold tier, or every row when
+    sql is None).
+    """
+    async def gen():
+        buf = io.StringIO()
+        w = csv.writer(buf)
+        w.writerow(header)
+        yield buf.getvalue()
+        n = 0
+        with timed_query(f"export_{name}") as q:
+            if sql is not None:
+                async with SessionLocal() as session:
+                    result = await session.stream(sql, params, execution_options={"yield_per": EXPORT_CHUNK_ROWS})
+                    async for chunk in result.mappings().partitions(EXPORT_CHUNK_ROWS):
+                        buf.seek(0)
+                        buf.truncate()
+                        for r in chunk:
+                            w.writerow(row_fn(r))
+                        n += len(chunk)
+                        yield buf.getvalue()
+            if tail is not None:
+                rest = await asyncio.to_thread(tail, n)
+                for i in range(0, len(rest), EXPORT_CHUNK_ROWS):
+                    buf.seek(0)
+                    buf.truncate()
+                    for r in rest[i:i + EXPORT_CHUNK_ROWS]:
+                        w.writerow(row_fn(r))
+                    yield buf.getvalue()
+                n += len(rest)
+            q.rows(n)
+    return _not_modified_response() or StreamingResponse(gen(), media_type="text/csv")
+
+async def _export_top_fees_query(meta, window, lookback, since_day_id, since_hour_id, version, token, token_symbol, fee_min, fee_max, limit):
+    token_norm = token.lower() if token else None
+    th, agg_table, agg_field = _window_threshold(window, lookback, since_day_id, since_hour_id)
+    pool_ids = _meta_pool_ids(meta, version, token_norm, token_symbol, fee_min, fee_max)
+    th, cold = await _top_cold(agg_table, th, pool_ids)
+    params = {"th": th, "limit": limit, **(cold or {})}
+    if pool_ids is not None:
+        params["pool_ids"] = pool_ids
+    return _top_export_sql("fees", agg_table, agg_field, pool_ids is not None, cold is not None), params
+
+async def _export_top_volume_query(meta, window, side, lookback, since_day_id, since_hour_id, version, token, token_symbol, fee_min, fee_max, limit):
+    token_norm = token.lower() if token else None
+    th, agg_table, agg_field = _window_threshold(window, lookback, since_day_id, since_hour_id)
+    pool_ids = _meta_pool_ids(meta, version, token_norm, token_symbol, fee_min, fee_max)
+    th, cold = await _top_cold(agg_table, th, pool_ids)
+    params = {"th": th, "limit": limit, **(cold or {})}
+    if pool_ids is not None:
+        params["pool_ids"] = pool_ids
+    return _top_export_sql(f"volume:{side}", agg_table, agg_field, pool_ids is not None, cold is not None), params
+
 @app.get("/export/top_fees.csv")
 async def export_top_fees_csv(
     window: Literal["day","hour"] = Query("day"),
@@ -537,60 +1339,13 @@ async def export_top_fees_csv(
     token_symbol: Optional[str] = Query(None),
     fee_min: Optional[int] = Query(None, ge=0),
     fee_max: Optional[int] = Query(None, ge=0),
-    limit: int = Query(100, ge=1, le=100),
+    limit: int = Query(100, ge=1, le=100000),
 ):
-    token_norm = token.lower() if token else None
-    th, agg_table, agg_field = _window_threshold(window, lookback, since_day_id, since_hour_id)
-
-    where = f"""
-      (:version is null or p.version = :version)
-      and (:token is null or p.token0_id = :token or p.token1_id = :token)
-      and (:token_symbol is null or t0.symbol ilike :ts_like or t1.symbol ilike :ts_like)
-      and (:fee_min is null or p.fee_tier_bps >= :fee_min)
-      and (:fee_max is null or p.fee_tier_bps <= :fee_max)
-      and a.{agg_field} >= :th
-    """
-    ts_like = f"%{token_symbol}%" if token_symbol else None
-    params = {
-        "version": version, "token": token_norm, "token_symbol": token_symbol, "ts_like": ts_like,
-        "fee_min": fee_min, "fee_max": fee_max, "th": th, "limit": limit
-    }
-
-    sql = text(f"""
-      select
-        p.id, p.version, p.chain_id, p.fee_tier_bps, p.tick_spacing, p.created_at_ts,
-        t0.address as t0_addr, t0.symbol as t0_sym,
-        t1.address as t1_addr, t1.symbol as t1_sym,
-        sum(coalesce(a.approx_fee_token0,0) + coalesce(a.approx_fee_token1,0)) as fees_sum
-      from {agg_table} a
-      join pools p on p.id = a.pool_id
-      join tokens t0 on t0.id = p.token0_id
-      join tokens t1 on t1.id = p.token1_id
-      where {where}
-      group by p.id, p.version, p.chain_id, p.fee_tier_bps, p.tick_spacing, p.created_at_ts,
-               t0.address, t0.symbol, t1.address, t1.symbol
-      order by fees_sum desc
-      limit :limit
-    """).bindparams(
-        bindparam("version", type_=SmallInteger), bindparam("token", type_=String),
-        bindparam("token_symbol", type_=String), bindparam("ts_like", type_=String),
-        bindparam("fee_min", type_=Integer), bindparam("fee_max", type_=Integer),
-        bindparam("th", type_=Integer), bindparam("limit", type_=Integer)
-    )
-
-    async with SessionLocal() as session:
-        rows = (await session.execute(sql, params)).mappings().all()
-
-    buf = io.StringIO()
-    w = csv.writer(buf)
-    w.writerow(["pool_id","version","chain_id","token0","token1","fee_tier_bps","tick_spacing","created_at_ts","fees_sum","window"])
-    for r in rows:
-        w.writerow([r["id"], r["version"], r["chain_id"],
-                    (r["t0_sym"] or r["t0_addr"]), (r["t1_sym"] or r["t1_addr"]),
-                    r["fee_tier_bps"], r["tick_spacing"], r["created_at_ts"],
-                    float(r["fees_sum"]), window])
-    buf.seek(0)
-    return StreamingResponse(iter([buf.getvalue()]), media_type="text/csv")
+    meta = await _meta_index()
+    sql, params = await _export_top_fees_query(meta, window, lookback, since_day_id, since_hour_id, version, token, token_symbol, fee_min, fee_max, limit)
+    header = ["pool_id","version","chain_id","token0","token1","fee_tier_bps","tick_spacing","created_at_ts","fees_sum","window"]
+    return _stream_csv(sql, params, header, lambda r: [
+        r["id"], *meta.export_row(r["id"]), float(r["fees_sum"]), window], "top_fees")
 
 @app.get("/export/top_volume.csv")
 async def export_top_volume_csv(
@@ -604,67 +1359,163 @@ async def export_top_volume_csv(
     token_symbol: Optional[str] = Query(None),
     fee_min: Optional[int] = Query(None, ge=0),
     fee_max: Optional[int] = Query(None, ge=0),
-    limit: int = Query(100, ge=1, le=100),
+    limit: int = Query(100, ge=1, le=100000),
 ):
-    token_norm = token.lower() if token else None
-    th, agg_table, agg_field = _window_threshold(window, lookback, since_day_id, since_hour_id)
-
-    vol_expr = {
-        "both": "sum(coalesce(a.volume_token0,0) + coalesce(a.volume_token1,0))",
-        "token0": "sum(coalesce(a.volume_token0,0))",
-        "token1": "sum(coalesce(a.volume_token1,0))",
-    }[side]
-
-    where = f"""
-      (:version is null or p.version = :version)
-      and (:token is null or p.token0_id = :token or p.token1_id = :token)
-      and (:token_symbol is null or t0.symbol ilike :ts_like or t1.symbol ilike :ts_like)
-      and (:fee_min is null or p.fee_tier_bps >= :fee_min)
-      and (:fee_max is null or p.fee_tier_bps <= :fee_max)
-      and a.{agg_field} >= :th
+    meta = await _meta_index()
+    sql, params = await _export_top_volume_query(meta, window, side, lookback, since_day_id, since_hour_id, version, token, token_symbol, fee_min, fee_max, limit)
+    header = ["pool_id","version","chain_id","token0","token1","fee_tier_bps","tick_spacing","created_at_ts","volume_sum","swaps_sum","side","window"]
+    return _stream_csv(sql, params, header, lambda r: [
+        r["id"], *meta.export_row(r["id"]), float(r["volume_sum"]), int(r["swaps"]), side, window], "top_volume")
+
+# ---------- COLUMNAR EXPORTS (Arrow IPC / Parquet) ----------
+COLUMNAR_BATCH_ROWS = 65536
+COLUMNAR_MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever the Arrow writer produced since the last drain."""
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        b = bytes(data)
+        self._parts.append(b)
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+def _stream_columnar(sql, params: Dict[str, Any], fmt: str, columns: List[Tuple[str, Any, Any]], name: str, tail=None) -> StreamingResponse:
     """
-    ts_like = f"%{token_symbol}%" if token_symbol else None
-    params = {
-        "version": version, "token": token_norm, "token_symbol": token_symbol, "ts_like": ts_like,
-        "fee_min": fee_min, "fee_max": fee_max, "th": th, "limit": limit
-    }
-
-    sql = text(f"""
-      select
-        p.id, p.version, p.chain_id, p.fee_tier_bps, p.tick_spacing, p.created_at_ts,
-        t0.address as t0_addr, t0.symbol as t0_sym,
-        t1.address as t1_addr, t1.symbol as t1_sym,
-        {vol_expr} as volume_sum,
-        sum(coalesce(a.swap_count,0)) as swaps
-      from {agg_table} a
-      join pools p on p.id = a.pool_id
-      join tokens t0 on t0.id = p.token0_id
-      join tokens t1 on t1.id = p.token1_id
-      where {where}
-      group by p.id, p.version, p.chain_id, p.fee_tier_bps, p.tick_spacing, p.created_at_ts,
-               t0.address, t0.symbol, t1.address, t1.symbol
-      order by volume_sum desc
-      limit :limit
-    """).bindparams(
-        bindparam("version", type_=SmallInteger), bindparam("token", type_=String),
-        bindparam("token_symbol", type_=String), bindparam("ts_like", type_=String),
-        bindparam("fee_min", type_=Integer), bindparam("fee_max", type_=Integer),
-        bindparam("th", type_=Integer), bindparam("limit", type_=Integer)
-    )
-
-    async with SessionLocal() as session:
-        rows = (await session.execute(sql, params)).mappings().all()
-
-    buf = io.StringIO()
-    w = csv.writer(buf)
-    w.writerow(["pool_id","version","chain_id","token0","token1","fee_tier_bps","tick_spacing","created_at_ts","volume_sum","swaps_sum","side","window"])
-    for r in rows:
-        w.writerow([r["id"], r["version"], r["chain_id"],
-                    (r["t0_sym"] or r["t0_addr"]), (r["t1_sym"] or r["t1_addr"]),
-                    r["fee_tier_bps"], r["tick_spacing"], r["created_at_ts"],
-                    float(r["volume_sum"]), int(r["swaps"]), side, window])
-    buf.seek(0)
-    return StreamingResponse(iter([buf.getvalue()]), media_type="text/csv")
+    Stream a query as Arrow IPC (stream format) or Parquet, one record batch / row group per
+    COLUMNAR_BATCH_ROWS rows read from a server-side cursor. columns: (name, arrow type, row getter);
+    tail as for _stream_csv.
+    """
+    schema = pa.schema([(c, t) for c, t, _ in columns])
+
+    async def gen():
+        sink = _ChunkSink()
+        f = pa.PythonFile(sink, mode="w")
+        if fmt == "parquet":
+            writer = pq.ParquetWriter(f, schema, compression="zstd")
+        else:
+            writer = pa.ipc.new_stream(f, schema)
+        try:
+            head = sink.drain()
+            if head:
+                yield head
+            n = 0
+            with timed_query(f"export_{name}") as q:
+                async with SessionLocal() as session:
+                    result = await session.stream(sql, params, execution_options={"yield_per": COLUMNAR_BATCH_ROWS})
+                    async for chunk in result.mappings().partitions(COLUMNAR_BATCH_ROWS):
+                        arrays = [pa.array([get(r) for r in chunk], type=t) for _, t, get in columns]
+                        writer.write_batch(pa.record_batch(arrays, schema=schema))
+                        n += len(chunk)
+                        yield sink.drain()
+                if tail is not None:
+                    rest = await asyncio.to_thread(tail, n)
+                    for i in range(0, len(rest), COLUMNAR_BATCH_ROWS):
+                        chunk = rest[i:i + COLUMNAR_BATCH_ROWS]
+                        arrays = [pa.array([get(r) for r in chunk], type=t) for _, t, get in columns]
+                        writer.write_batch(pa.record_batch(arrays, schema=schema))
+                        yield sink.drain()
+                    n += len(rest)
+                q.rows(n)
+        finally:
+            writer.close()
+        yield sink.drain()
+
+    headers = {"Content-Disposition": f'attachment; filename="{name}.{fmt}"'}
+    return _not_modified_response() or StreamingResponse(gen(), media_type=COLUMNAR_MEDIA_TYPES[fmt], headers=headers)
+
+def _columnar_response(t: pa.Table, fmt: str, name: str) -> Response:
+    """A table already in memory (series cache hits) as one Arrow IPC stream / Parquet file."""
+    sink = pa.BufferOutputStream()
+    if fmt == "parquet":
+        pq.write_table(t, sink, compression="zstd")
+    else:
+        with pa.ipc.new_stream(sink, t.schema) as w:
+            w.write_table(t)
+    headers = {"Content-Disposition": f'attachment; filename="{name}.{fmt}"'}
+    return Response(sink.getvalue().to_pybytes(), media_type=COLUMNAR_MEDIA_TYPES[fmt], headers=headers)
+
+def _pool_columns(meta: MetaIndex) -> List[Tuple[str, Any, Any]]:
+    # Rows carry only the pool id; metadata comes from the index, looked up once per pool
+    fields = lru_cache(maxsize=None)(meta.export_row)
+    return [
+        ("pool_id", pa.string(), lambda r: r["id"]),
+        ("version", pa.int16(), lambda r: fields(r["id"])[0]),
+        ("chain_id", pa.int32(), lambda r: fields(r["id"])[1]),
+        ("token0", pa.string(), lambda r: fields(r["id"])[2]),
+        ("token1", pa.string(), lambda r: fields(r["id"])[3]),
+        ("fee_tier_bps", pa.int32(), lambda r: fields(r["id"])[4]),
+        ("tick_spacing", pa.int32(), lambda r: fields(r["id"])[5]),
+        ("created_at_ts", pa.int64(), lambda r: fields(r["id"])[6]),
+    ]
+
+@app.get("/export/top_fees.{fmt}")
+async def export_top_fees_columnar(
+    fmt: Literal["arrow", "parquet"],
+    window: Literal["day","hour"] = Query("day"),
+    lookback: int = Query(30, ge=1),
+    since_day_id: Optional[int] = Query(None),
+    since_hour_id: Optional[int] = Query(None),
+    version: Optional[int] = Query(None),
+    token: Optional[str] = Query(None),
+    token_symbol: Optional[str] = Query(None),
+    fee_min: Optional[int] = Query(None, ge=0),
+    fee_max: Optional[int] = Query(None, ge=0),
+    limit: int = Query(100, ge=1, le=100000),
+):
+    meta = await _meta_index()
+    sql, params = await _export_top_fees_query(meta, window, lookback, since_day_id, since_hour_id, version, token, token_symbol, fee_min, fee_max, limit)
+    columns = _pool_columns(meta) + [
+        ("fees_sum", pa.float64(), lambda r: float(r["fees_sum"])),
+        ("window", pa.string(), lambda r: window),
+    ]
+    return _stream_columnar(sql, params, fmt, columns, "top_fees")
+
+@app.get("/export/top_volume.{fmt}")
+async def export_top_volume_columnar(
+    fmt: Literal["arrow", "parquet"],
+    window: Literal["day","hour"] = Query("day"),
+    side: Literal["both","token0","token1"] = Query("both"),
+    lookback: int = Query(30, ge=1),
+    since_day_id: Optional[int] = Query(None),
+    since_hour_id: Optional[int] = Query(None),
+    version: Optional[int] = Query(None),
+    token: Optional[str] = Query(None),
+    token_symbol: Optional[str] = Query(None),
+    fee_min: Optional[int] = Query(None, ge=0),
+    fee_max: Optional[int] = Query(None, ge=0),
+    limit: int = Query(100, ge=1, le=100000),
+):
+    meta = await _meta_index()
+    sql, params = await _export_top_volume_query(meta, window, side, lookback, since_day_id, since_hour_id, version, token, token_symbol, fee_min, fee_max, limit)
+    columns = _pool_columns(meta) + [
+        ("volume_sum", pa.float64(), lambda r: float(r["volume_sum"])),
+        ("swaps_sum", pa.int64(), lambda r: int(r["swaps"])),
+        ("side", pa.string(), lambda r: side),
+        ("window", pa.string(), lambda r: window),
+    ]
+    return _stream_columnar(sql, params, fmt, columns, "top_volume")
 
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
@@ -689,6 +1540,18 @@ class PoolAggRow(TypedDict):
     approx_fee_token1: float
     swap_count: int
 
+def _cached_hours(pool_id: str, agg_table: str, th: int, limit: int, n: int = 1) -> Optional[Dict[str, np.ndarray]]:
+    """Hourly rows / n-hour buckets from the series cache, or None (day window, pool not cached)."""
+    if agg_table != "pool_hour_data":
+        return None
+    cols = _pool_series.hours(pool_id, th, limit, n)
+    metrics.cache_requests.inc("series", "miss" if cols is None else "hit")
+    return cols
+
+def _cached_agg_rows(cols: Dict[str, np.ndarray]) -> List[PoolAggRow]:
+    return [PoolAggRow(bucket=b, volume_token0=v0, volume_token1=v1, approx_fee_token0=f0, approx_fee_token1=f1, swap_count=sc)
+            for b, v0, v1, f0, f1, sc in zip(*(cols[c].tolist() for c in ("bucket", *AGG_COLUMNS)))]
+
 @app.get("/pools/{pool_id}/agg")
 async def pool_agg(
     pool_id: str,
@@ -697,63 +1560,164 @@ async def pool_agg(
     since_day_id: Optional[int] = Query(None),
     since_hour_id: Optional[int] = Query(None),
     limit: int = Query(100, ge=1, le=1000),
+    bucket: Optional[str] = Query(None, description="Resample into buckets of 4h, 1d, 1w, 1mo, ...; rows are then keyed by the bucket's first hour id"),
 ):
     th, agg_table, agg_field = _window_threshold(window, lookback, since_day_id, since_hour_id)
+    n = 1
+    if bucket:
+        unit, n, th, agg_table, agg_field = _resample_window(bucket, window, th, agg_table)
+    cut = _cold_cut(agg_table, th) if agg_table == "pool_hour_data" else None
+    if bucket:
+        sql, params = _resampled_sql(unit, agg_table, agg_field), {"pool_id": pool_id, "th": cut or th, "n": n, "limit": limit}
+    else:
+        sql, params = _series_sql(agg_table, agg_field), {"pool_id": pool_id, "th": cut or th, "limit": limit}
+    key = ("agg", agg_table, th, pool_id, limit, bucket)
+    cached = cache_agg.get(key)
+    if cached:
+        return cached
 
-    pool_sql = text("""
-      select
-        p.id, p.version, p.chain_id, p.fee_tier_bps, p.tick_spacing, p.created_at_ts,
-        t0.address as t0_addr, t0.symbol as t0_sym, t0.decimals as t0_dec,
-        t1.address as t1_addr, t1.symbol as t1_sym, t1.decimals as t1_dec
-      from pools p
-      join tokens t0 on t0.id = p.token0_id
-      join tokens t1 on t1.id = p.token1_id
-      where p.id = :pool_id
-    """).bindparams(bindparam("pool_id", type_=String))
-
-    data_sql = text(f"""
-      select
-        a.{agg_field} as bucket,
-        coalesce(a.volume_token0,0) as volume_token0,
-        coalesce(a.volume_token1,0) as volume_token1,
-        coalesce(a.approx_fee_token0,0) as approx_fee_token0,
-        coalesce(a.approx_fee_token1,0) as approx_fee_token1,
-        coalesce(a.swap_count,0) as swap_count
-      from {agg_table} a
-      where a.pool_id = :pool_id and a.{agg_field} >= :th
-      order by a.{agg_field} desc
-      limit :limit
-    """).bindparams(
-        bindparam("pool_id", type_=String),
-        bindparam("th", type_=Integer),
-        bindparam("limit", type_=Integer),
-    )
+    meta = await _meta_for([pool_id])
+    i = meta.pool_pos.get(pool_id)
+    if i is None:
+        raise HTTPException(status_code=404, detail="Pool not found")
+    cols = _cached_hours(pool_id, agg_table, th, limit, n)
+    if cols is not None:
+        out_rows = _cached_agg_rows(cols)
+    else:
+        async with SessionLocal() as session:
+            rows = await _fetch_all(session, "pool_agg_resampled" if bucket else "pool_agg", sql, params)
+        if cut and (len(rows) < limit or int(rows[-1]["bucket"]) < cut):
+            cold = await asyncio.to_thread(_cold_agg, [pool_id], th, cut - 1, n, (limit + 1) * n)
+            rows = _with_cold_agg(rows, cold.get(pool_id, []), limit)
+        out_rows = []
+        for r in rows:
+            out_rows.append(PoolAggRow(
+                bucket=int(r["bucket"]),
+                volume_token0=float(r["volume_token0"]),
+                volume_token1=float(r["volume_token1"]),
+                approx_fee_token0=float(r["approx_fee_token0"]),
+                approx_fee_token1=float(r["approx_fee_token1"]),
+                swap_count=int(r["swap_count"]),
+            ))
+
+    result = {"pool": meta.pool_out(i), "window": window, "rows": out_rows}
+    if bucket:
+        result["bucket"] = bucket
+    cache_agg.set(key, result)
+    return result
 
+# --------- Per-pool OHLC candles (JSON) ---------
+@app.get("/pools/{pool_id}/candles")
+async def pool_candles(
+    pool_id: str,
+    resolution: Literal["1h", "4h", "1d", "1w"] = Query("1d"),
+    price: Literal["price0", "price1"] = Query("price0"),
+    since_hour_id: Optional[int] = Query(None),
+    until_hour_id: Optional[int] = Query(None),
+    limit: int = Query(500, ge=1, le=5000),
+):
+    """
+    Candles oldest first: the newest `limit` buckets starting in [since_hour_id, until_hour_id].
+    Buckets are hour ids (UTC; weeks start on Monday); hours = snapshots in the candle.
+    """
+    until = bucket_of(until_hour_id if until_hour_id is not None else int(time.time() // 3600), resolution)
+    since = bucket_of(since_hour_id, resolution) if since_hour_id is not None else 0
+    key = ("candles", resolution, pool_id, since, until, price, limit)
+    cached = cache_candles.get(key)
+    if cached:
+        return cached
+
+    meta = await _meta_for([pool_id])
+    i = meta.pool_pos.get(pool_id)
+    if i is None:
+        raise HTTPException(status_code=404, detail="Pool not found")
+    cached = _pool_series.prices(pool_id, price, since, until, limit) if resolution == "1h" else None
+    if cached is not None:
+        candles = [{"bucket": b, "open": p, "high": p, "low": p, "close": p, "liquidity": None if np.isnan(l) else l, "hours": 1}
+                   for b, p, l in zip(*(cached[c][::-1].tolist() for c in ("bucket", price, "liquidity")))]
+        result = {"pool": meta.pool_out(i), "resolution": resolution, "price": price, "candles": candles}
+        cache_candles.set(key, result)
+        return result
+    cut = _cold_cut("pool_price_hour", since) if resolution == "1h" else None
     async with SessionLocal() as session:
-        prow = (await session.execute(pool_sql, {"pool_id": pool_id})).mappings().first()
-        if not prow:
-            raise HTTPException(status_code=404, detail="Pool not found")
-        rows = (await session.execute(data_sql, {"pool_id": pool_id, "th": th, "limit": limit})).mappings().all()
-
-    pool = {
-        "id": prow["id"], "version": prow["version"], "chain_id": prow["chain_id"],
-        "token0": {"address": prow["t0_addr"], "symbol": prow["t0_sym"], "decimals": prow["t0_dec"]},
-        "token1": {"address": prow["t1_addr"], "symbol": prow["t1_sym"], "decimals": prow["t1_dec"]},
-        "fee_tier_bps": prow["fee_tier_bps"], "tick_spacing": prow["tick_spacing"], "created_at_ts": prow["created_at_ts"],
-    }
-    out_rows: List[PoolAggRow] = []
-    for r in rows:
-        out_rows.append(PoolAggRow(
+        rows = await _fetch_all(session, "pool_candles", _candles_sql(resolution, price),
+                                {"pool_id": pool_id, "since": max(since, cut or since), "until": until, "limit": limit})
+    if cut and len(rows) < limit and since <= until:
+        rows = list(rows) + await asyncio.to_thread(_cold_candles, pool_id, price, since, min(until, cut - 1), limit - len(rows))
+
+    candles = [
+        {"bucket": int(r["bucket"]), "open": float(r["open"]), "high": float(r["high"]), "low": float(r["low"]),
+         "close": float(r["close"]), "liquidity": float(r["liquidity"]) if r["liquidity"] is not None else None,
+         "hours": int(r["hours"])}
+        for r in reversed(rows) if r["close"] is not None
+    ]
+    result = {"pool": meta.pool_out(i), "resolution": resolution, "price": price, "candles": candles}
+    cache_candles.set(key, result)
+    return result
+
+# --------- Multi-pool aggregation (JSON, batch) ---------
+class PoolAggBatchIn(BaseModel):
+    pool_ids: List[str] = Field(..., min_length=1, max_length=500)
+    window: Literal["day","hour"] = "day"
+    lookback: int = Field(30, ge=1)
+    since_day_id: Optional[int] = None
+    since_hour_id: Optional[int] = None
+    limit_per_pool: int = Field(100, ge=1, le=1000)
+
+@app.post("/pools/agg/batch")
+async def pool_agg_batch(req: PoolAggBatchIn):
+    """Series for many pools: cached pools are sliced from the series cache, the rest come from one query keyed by pool_id = any(...)."""
+    pool_ids = list(dict.fromkeys(req.pool_ids))
+    th, agg_table, agg_field = _window_threshold(req.window, req.lookback, req.since_day_id, req.since_hour_id)
+
+    meta = await _meta_for(pool_ids)
+    known = [pid for pid in pool_ids if pid in meta.pool_pos]
+    series: Dict[str, List[PoolAggRow]] = {}
+    for pid in known:
+        cols = _cached_hours(pid, agg_table, th, req.limit_per_pool)
+        if cols is not None:
+            series[pid] = _cached_agg_rows(cols)
+    by_pool: Dict[str, List[Any]] = {}
+    rest = [pid for pid in known if pid not in series]
+    if rest:
+        cut = _cold_cut(agg_table, th) if agg_table == "pool_hour_data" else None
+        async with SessionLocal() as session:
+            rows = await _fetch_all(session, "pool_agg_batch", _series_batch_sql(agg_table, agg_field), {"pool_ids": rest, "th": cut or th, "limit": req.limit_per_pool})
+        for r in rows:
+            by_pool.setdefault(r["pool_id"], []).append(r)
+        short = [pid for pid in rest if len(by_pool.get(pid, [])) < req.limit_per_pool]
+        if cut and short:
+            cold = await asyncio.to_thread(_cold_agg, short, th, cut - 1)
+            for pid in short:
+                by_pool[pid] = _with_cold_agg(by_pool.get(pid, []), cold.get(pid, []), req.limit_per_pool)
+
+    for pid, rs in by_pool.items():
+        series[pid] = [PoolAggRow(
             bucket=int(r["bucket"]),
             volume_token0=float(r["volume_token0"]),
             volume_token1=float(r["volume_token1"]),
             approx_fee_token0=float(r["approx_fee_token0"]),
             approx_fee_token1=float(r["approx_fee_token1"]),
             swap_count=int(r["swap_count"]),
-        ))
-    return {"pool": pool, "window": window, "rows": out_rows}
+        ) for r in rs]
+
+    items = [{"pool": meta.pool_out(meta.pool_pos[pid]), "rows": series.get(pid, [])} for pid in known]
+    missing = [pid for pid in pool_ids if pid not in meta.pool_pos]
+    return {"window": req.window, "items": items, "missing": missing}
 
 # --------- Per-pool aggregation (CSV export) ---------
+def _export_pool_agg_query(pool_id, window, lookback, since_day_id, since_hour_id, limit):
+    """-> (sql, params, tail, cols); cols are the series-cache columns for a cached pool, and then sql is None."""
+    th, agg_table, agg_field = _window_threshold(window, lookback, since_day_id, since_hour_id)
+    cols = _cached_hours(pool_id, agg_table, th, limit)
+    if cols is not None:
+        return None, {}, None, cols
+    cut = _cold_cut(agg_table, th) if agg_table == "pool_hour_data" else None
+    tail = None
+    if cut:
+        tail = lambda n: _cold_agg([pool_id], th, cut - 1, 1, limit - n).get(pool_id, [])[:limit - n] if n < limit else []
+    return _series_sql(agg_table, agg_field), {"pool_id": pool_id, "th": cut or th, "limit": limit}, tail, None
+
 @app.get("/export/pool_agg.csv")
 async def export_pool_agg_csv(
     pool_id: str = Query(...),
@@ -761,77 +1725,487 @@ async def export_pool_agg_csv(
     lookback: int = Query(30, ge=1),
     since_day_id: Optional[int] = Query(None),
     since_hour_id: Optional[int] = Query(None),
-    limit: int = Query(100, ge=1, le=10000),
+    limit: int = Query(100, ge=1, le=1000000),
 ):
-    th, agg_table, agg_field = _window_threshold(window, lookback, since_day_id, since_hour_id)
+    sql, params, tail, cols = _export_pool_agg_query(pool_id, window, lookback, since_day_id, since_hour_id, limit)
+    header = ["pool_id","window","bucket","volume_token0","volume_token1","approx_fee_token0","approx_fee_token1","swap_count"]
+    if cols is not None:
+        rows = list(zip(*(cols[c].tolist() for c in ("bucket", *AGG_COLUMNS))))
+        return _stream_csv(None, {}, header, lambda r: [pool_id, window, *r], "pool_agg", lambda n: rows)
+    return _stream_csv(sql, params, header, lambda r: [
+        pool_id, window, int(r["bucket"]), float(r["volume_token0"]), float(r["volume_token1"]),
+        float(r["approx_fee_token0"]), float(r["approx_fee_token1"]), int(r["swap_count"])], "pool_agg", tail)
+
+@app.get("/export/pool_agg.{fmt}")
+async def export_pool_agg_columnar(
+    fmt: Literal["arrow", "parquet"],
+    pool_id: str = Query(...),
+    window: Literal["day","hour"] = Query("day"),
+    lookback: int = Query(30, ge=1),
+    since_day_id: Optional[int] = Query(None),
+    since_hour_id: Optional[int] = Query(None),
+    limit: int = Query(100, ge=1, le=10000000),
+):
+    sql, params, tail, cols = _export_pool_agg_query(pool_id, window, lookback, since_day_id, since_hour_id, limit)
+    columns = [
+        ("pool_id", pa.string(), lambda r: pool_id),
+        ("window", pa.string(), lambda r: window),
+        ("bucket", pa.int64(), lambda r: int(r["bucket"])),
+        ("volume_token0", pa.float64(), lambda r: float(r["volume_token0"])),
+        ("volume_token1", pa.float64(), lambda r: float(r["volume_token1"])),
+        ("approx_fee_token0", pa.float64(), lambda r: float(r["approx_fee_token0"])),
+        ("approx_fee_token1", pa.float64(), lambda r: float(r["approx_fee_token1"])),
+        ("swap_count", pa.int64(), lambda r: int(r["swap_count"])),
+    ]
+    if cols is not None:
+        k = len(cols["bucket"])
+        arrays = [pa.array([pool_id] * k, pa.string()), pa.array([window] * k, pa.string()),
+                  *(pa.array(cols[c], type=t) for c, t, _ in columns[2:])]
+        return _columnar_response(pa.table(arrays, schema=pa.schema([(c, t) for c, t, _ in columns])), fmt, "pool_agg")
+    return _stream_columnar(sql, params, fmt, columns, "pool_agg", tail)
+
+# ---------- PAIR FEE TIERS ----------
+# Every pool of a pair (all v3 fee tiers + v4) on one bucket grid, from the meta index's
+# canonical pair lookup and a single query over the series tables.
+TIER_SERIES = ("volume_token0", "volume_token1", "approx_fee_token0", "approx_fee_token1", "swap_count")
+
+def _bucket_hours(unit: str, n: int, hours: np.ndarray) -> np.ndarray:
+    """_bucket_expr over hour ids, in numpy."""
+    if unit == "h":
+        return hours // n * n
+    d = hours // 24
+    if unit == "d":
+        return d // n * n * 24
+    if unit == "w":
+        return ((d + 3) // n * n - 3) * 24
+    days, inv = np.unique(d, return_inverse=True)
+    return np.array([_bucket_start("mo", n, int(x)) * 24 for x in days.tolist()], dtype=np.int64)[inv]
+
+def _cold_tiers(pool_ids: List[str], unit: str, n: int, th: int, cut: Optional[int], th_hour: int, price_cut: Optional[int]) -> List[Dict[str, Any]]:
+    """Archived rows of _pair_tiers_sql: hourly sums below cut, last price0 per bucket below price_cut."""
+    out: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    if cut is not None:
+        for pid, rows in _cold_agg(pool_ids, th, cut - 1, n).items():
+            for r in rows:
+                out[(pid, r["bucket"])] = {"pool_id": pid, **r, "price0": None}
+    if price_cut is not None:
+        t = archive.read("pool_price_hour", pool_ids, th_hour, price_cut - 1, ["pool_id", "hour_start_unix", "price0"])
+        buckets = _bucket_hours(unit, n, t["hour_start_unix"].to_numpy().astype(np.int64)).tolist()
+        # Months ascending, hours ascending within a pool: the last write is the bucket's last price
+        for pid, b, p in zip(t["pool_id"].to_pylist(), buckets, t["price0"].to_pylist()):
+            r = out.get((pid, b))
+            if r is None:
+                r = out[(pid, b)] = {"pool_id": pid, "bucket": b, **{f: None for f in TIER_SERIES}}
+            r["price0"] = p
+    return list(out.values())
+
+def _with_cold_tiers(rows, cold: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Hot rows over cold ones: sums add up in a bucket straddling a cutoff, the hot price is the later one."""
+    out = {(r["pool_id"], r["bucket"]): r for r in cold}
+    for r in rows:
+        c = out.get((r["pool_id"], int(r["bucket"])))
+        if c is None:
+            out[(r["pool_id"], int(r["bucket"]))] = dict(r)
+            continue
+        for f in TIER_SERIES:
+            if r[f] is not None:
+                c[f] = float(r[f]) + (c[f] or 0.0)
+        if r["price0"] is not None:
+            c["price0"] = r["price0"]
+    return list(out.values())
+
+@app.get("/pairs/fee_tiers")
+async def pair_fee_tiers(
+    token_a: str = Query(...),
+    token_b: str = Query(...),
+    versions: List[int] = Query([3, 4]),
+    window: Literal["day","hour"] = Query("day"),
+    lookback: int = Query(30, ge=1),
+    since_day_id: Optional[int] = Query(None),
+    since_hour_id: Optional[int] = Query(None),
+    bucket: Optional[str] = Query(None, description="4h, 1d, 1w, 1mo, ...; default one row per day / hour of the window"),
+    limit: int = Query(500, ge=1, le=5000, description="Newest buckets kept"),
+):
+    """
+    Aligned volume, fees, swaps and last price0 per bucket for each pool of the pair (either
+    orientation), with each pool's share of the pair's volume and fees per token.
+    """
+    a, b = token_a.lower(), token_b.lower()
+    for t in (a, b):
+        if not t.startswith("0x") or len(t) != 42:
+            raise HTTPException(status_code=400, detail="Invalid token address")
+    th, agg_table, _ = _window_threshold(window, lookback, since_day_id, since_hour_id)
+    bucket = bucket or ("1d" if window == "day" else "1h")
+    unit, n, th, agg_table, agg_field = _resample_window(bucket, window, th, agg_table)
+    meta = await _meta_index()
+    idx = meta.pair_pools(a, b, versions) if a != b else []
+    if not idx:
+        raise HTTPException(status_code=404, detail="No pools for this pair")
+    pool_ids = [meta.pool_ids[i] for i in idx]
+    key = ("pair_tiers", agg_table, th, tuple(pool_ids), bucket, limit)
+    cached = cache_agg.get(key)
+    if cached:
+        return cached
+    th_hour = th if agg_table == "pool_hour_data" else th * 24
+    cut = _cold_cut(agg_table, th) if agg_table == "pool_hour_data" else None
+    price_cut = _cold_cut("pool_price_hour", th_hour)
+    async with SessionLocal() as session:
+        rows = await _fetch_all(session, "pair_tiers", _pair_tiers_sql(unit, agg_table, agg_field),
+                                {"pool_ids": pool_ids, "th": cut or th, "th_hour": price_cut or th_hour, "n": n})
+    if cut or price_cut:
+        cold = await asyncio.to_thread(_cold_tiers, pool_ids, unit, n, th, cut, th_hour, price_cut)
+        rows = _with_cold_tiers(rows, cold)
+
+    buckets = sorted({int(r["bucket"]) for r in rows})[-limit:]
+    col = {bk: j for j, bk in enumerate(buckets)}
+    pos = {pid: k for k, pid in enumerate(pool_ids)}
+    series = [{f: [0.0] * len(buckets) for f in TIER_SERIES} for _ in pool_ids]
+    prices: List[List[Optional[float]]] = [[None] * len(buckets) for _ in pool_ids]
+    for r in rows:
+        j = col.get(int(r["bucket"]))
+        if j is None:
+            continue
+        k = pos[r["pool_id"]]
+        for f in TIER_SERIES:
+            if r[f] is not None:
+                series[k][f][j] = float(r[f])
+        prices[k][j] = r["price0"]
+
+    totals = [{f: sum(sr[f]) for f in TIER_SERIES} for sr in series]
+    pair_tot = {f: sum(t[f] for t in totals) for f in TIER_SERIES}
+    pools = []
+    for k, i in enumerate(idx):
+        pools.append({
+            "pool": meta.pool_out(i),
+            "totals": totals[k],
+            "share": {f: totals[k][f] / pair_tot[f] if pair_tot[f] else None for f in TIER_SERIES},
+            "series": {**series[k], "price0": prices[k]},
+        })
+    pools.sort(key=lambda p: (p["pool"]["version"], p["pool"]["fee_tier_bps"], p["pool"]["id"]))
+    t0, t1 = (meta.pool_t0[idx[0]], meta.pool_t1[idx[0]])
+    result = {"token0": meta.token_out(t0), "token1": meta.token_out(t1), "window": window, "bucket": bucket,
+              "buckets": buckets, "totals": pair_tot, "pools": pools}
+    cache_agg.set(key, result)
+    return result
 
-    sql = text(f"""
-      select
-        a.{agg_field} as bucket,
-        coalesce(a.volume_token0,0) as volume_token0,
-        coalesce(a.volume_token1,0) as volume_token1,
-        coalesce(a.approx_fee_token0,0) as approx_fee_token0,
-        coalesce(a.approx_fee_token1,0) as approx_fee_token1,
-        coalesce(a.swap_count,0) as swap_count
-      from {agg_table} a
-      where a.pool_id = :pool_id and a.{agg_field} >= :th
-      order by a.{agg_field} desc
-      limit :limit
-    """).bindparams(
-        bindparam("pool_id", type_=String),
-        bindparam("th", type_=Integer),
-        bindparam("limit", type_=Integer),
-    )
+# ---------- BACKTEST ----------
+# Concentrated-liquidity ranges replayed over a pool's hourly price + fee history
+# (backend/analytics/backtest.py); all ranges are evaluated together as array operations.
+BACKTEST_MAX_RANGES = 20000
+BACKTEST_MAX_WIDTH_PCT = 10000.0
+WidthPct = Annotated[float, Field(gt=0, le=BACKTEST_MAX_WIDTH_PCT)]
+Tick = Annotated[int, Field(ge=bt.MIN_TICK, le=bt.MAX_TICK)]
+
+class BacktestIn(BaseModel):
+    lookback_hours: int = Field(24 * 30, ge=24)
+    since_hour_id: Optional[int] = None
+    until_hour_id: Optional[int] = None
+    capital: float = Field(1000.0, gt=0, description="Position value in token1 at the first hour")
+    ranges: Optional[List[Tuple[Tick, Tick]]] = Field(None, max_length=BACKTEST_MAX_RANGES, description="(tick_lower, tick_upper); snapped outward to tick_spacing")
+    widths_pct: Optional[List[WidthPct]] = Field(None, max_length=1000, description="Ranges of +/- w% around the first hour's price")
+    skews: List[Annotated[float, Field(ge=-1, le=1)]] = Field([0.0], min_length=1, max_length=100, description="Centre shift for widths_pct, in half-widths (-1..1)")
+    sort_by: Literal["pnl", "pnl_vs_hold", "fees_value", "fee_apr", "in_range", "il"] = "pnl"
+    top: Optional[int] = Field(None, ge=1, description="Return only the best N ranges by sort_by")
+
+    @field_validator("ranges")
+    @classmethod
+    def _ordered(cls, v):
+        if v and any(lo >= hi for lo, hi in v):
+            raise ValueError("tick_lower must be below tick_upper")
+        return v
+
+def _run_backtest(req: BacktestIn, rows, tick_spacing: int, dec0: int, dec1: int) -> Optional[Dict[str, Any]]:
+    series = series_by_pool(rows).get(rows[0]["pool_id"]) if rows else None
+    if series is None:
+        return None
+    los, his = [], []
+    if req.ranges:
+        lo, hi = bt.align_ranges([r[0] for r in req.ranges], [r[1] for r in req.ranges], tick_spacing)
+        los.append(lo); his.append(hi)
+    if req.widths_pct:
+        tick0 = int(bt.tick_at(series.sqrt_p[:1])[0])
+        lo, hi = bt.ranges_around(tick0, req.widths_pct, req.skews, tick_spacing)
+        los.append(lo); his.append(hi)
+    lower, upper = np.concatenate(los), np.concatenate(his)
+    res = bt.backtest(series, lower, upper, dec0, dec1, req.capital)
+
+    order = np.argsort(-res[req.sort_by], kind="stable")
+    if req.top:
+        order = order[:req.top]
+    to_human = 10.0 ** (dec0 - dec1)
+    price_lo = bt.sqrt_at(lower) ** 2 * to_human
+    price_hi = bt.sqrt_at(upper) ** 2 * to_human
+    fields = ["fees_token0", "fees_token1", "fees_value", "in_range", "il", "value", "pnl", "pnl_vs_hold", "fee_apr"]
+    cols = {k: res[k][order].tolist() for k in fields}
+    lo_l, hi_l = lower[order].tolist(), upper[order].tolist()
+    plo, phi = price_lo[order].tolist(), price_hi[order].tolist()
+    results = [
+        {"tick_lower": lo_l[n], "tick_upper": hi_l[n], "price_lower": plo[n], "price_upper": phi[n],
+         **{k: cols[k][n] for k in fields}}
+        for n in range(len(order))
+    ]
+    return {
+        "start_hour": series.start, "end_hour": series.start + len(series) - 1, "hours": len(series),
+        "price_start": bt.price_of(series.sqrt_p[0], dec0, dec1), "price_end": bt.price_of(series.sqrt_p[-1], dec0, dec1),
+        "ranges": int(len(lower)), "results": results,
+    }
 
+@app.post("/pools/{pool_id}/backtest")
+async def pool_backtest(pool_id: str, req: BacktestIn):
+    """Fee income, time in range, impermanent loss and PnL for many LP ranges over the pool's history."""
+    n = len(req.ranges or []) + len(req.widths_pct or []) * len(req.skews)
+    if n == 0:
+        raise HTTPException(status_code=400, detail="Provide ranges and/or widths_pct")
+    if n > BACKTEST_MAX_RANGES:
+        raise HTTPException(status_code=400, detail=f"At most {BACKTEST_MAX_RANGES} ranges per call")
+
+    meta = await _meta_for([pool_id])
+    i = meta.pool_pos.get(pool_id)
+    if i is None:
+        raise HTTPException(status_code=404, detail="Pool not found")
+    until = req.until_hour_id if req.until_hour_id is not None else int(time.time() // 3600)
+    th = req.since_hour_id if req.since_hour_id is not None else until - req.lookback_hours
     async with SessionLocal() as session:
-        rows = (await session.execute(sql, {"pool_id": pool_id, "th": th, "limit": limit})).mappings().all()
+        rows = await _fetch_all(session, "backtest_series", SQL_POOLS_SERIES, series_params([pool_id], th, until))
+    rows = await asyncio.to_thread(with_cold, rows, [pool_id], th, until)
+
+    dec0, dec1 = meta.token_dec[meta.pool_t0[i]], meta.token_dec[meta.pool_t1[i]]
+    out = await asyncio.to_thread(_run_backtest, req, rows, meta.pool_tick[i], dec0, dec1)
+    if out is None:
+        raise HTTPException(status_code=404, detail="No price history for the pool in this window")
+    return {"pool": meta.pool_out(i), "capital": req.capital, "sort_by": req.sort_by, **out}
+
+# ---------- GRID SEARCH ----------
+# Width x rebalance-rule grid over every pool of a token pair (all fee tiers / versions), one
+# worker process per pool reading the series from shared memory (backend/analytics/grid_search.py).
+GRID_MAX_STRATEGIES = 50000
+
+class GridSearchIn(BaseModel):
+    token_a: str
+    token_b: str
+    versions: List[int] = Field([3, 4], min_length=1)
+    lookback_hours: int = Field(24 * 90, ge=24)
+    until_hour_id: Optional[int] = None
+    widths_pct: List[WidthPct] = Field(list(grid_search.DEFAULT_WIDTHS), min_length=1, max_length=200)
+    rules: List[str] = Field(list(grid_search.DEFAULT_RULES), min_length=1, max_length=50, description="static, exit:H (re-centre after H hours out of range), every:H")
+    capital: float = Field(1000.0, gt=0, description="Position value in token1 at the first hour")
+    extra_cost_bps: float = Field(0.0, ge=0, description="Gas/slippage per re-centre, on top of the swap fee")
+    sort_by: Literal["pnl", "pnl_vs_hold", "fees_value", "fee_apr", "in_range"] = "pnl"
+    top: int = Field(50, ge=1, le=1000)
+
+@app.post("/pairs/grid_search")
+async def pair_grid_search(req: GridSearchIn):
+    """Best (pool, width, rebalance rule) strategies for a token pair over its hourly history."""
+    a, b = req.token_a.lower(), req.token_b.lower()
+    for t in (a, b):
+        if not t.startswith("0x") or len(t) != 42:
+            raise HTTPException(status_code=400, detail="Invalid token address")
+    for r in req.rules:
+        try:
+            grid_search.parse_rule(r)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid rule: {r}")
+
+    meta = await _meta_index()
+    idx = meta.pair_pools(a, b, req.versions) if a != b else []
+    if not idx:
+        raise HTTPException(status_code=404, detail="No pools for this pair")
+    if len(idx) * len(req.widths_pct) * len(req.rules) > GRID_MAX_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"At most {GRID_MAX_STRATEGIES} pool x width x rule combinations per call")
+
+    until = req.until_hour_id if req.until_hour_id is not None else int(time.time() // 3600)
+    pool_ids = [meta.pool_ids[i] for i in idx]
+    async with SessionLocal() as session:
+        rows = await _fetch_all(session, "grid_series", SQL_POOLS_SERIES, series_params(pool_ids, until - req.lookback_hours, until))
+    rows = await asyncio.to_thread(with_cold, rows, pool_ids, until - req.lookback_hours, until)
+    series = await asyncio.to_thread(series_by_pool, rows)
 
-    buf = io.StringIO()
-    w = csv.writer(buf)
-    w.writerow(["pool_id","window","bucket","volume_token0","volume_token1","approx_fee_token0","approx_fee_token1","swap_count"])
-    for r in rows:
-        w.writerow([pool_id, window, int(r["bucket"]), float(r["volume_token0"]), float(r["volume_token1"]),
-                    float(r["approx_fee_token0"]), float(r["approx_fee_token1"]), int(r["swap_count"])])
-    buf.seek(0)
-    return StreamingResponse(iter([buf.getvalue()]), media_type="text/csv")
-import os, httpx
+    pools = [{"id": meta.pool_ids[i], "version": meta.pool_ver[i], "fee_tier_bps": meta.pool_fee[i], "tick_spacing": meta.pool_tick[i],
+              "dec0": meta.token_dec[meta.pool_t0[i]], "dec1": meta.token_dec[meta.pool_t1[i]]} for i in idx]
+    rows = await grid_search.run_grid(pools, series, req.widths_pct, req.rules, req.capital, req.extra_cost_bps)
+    return {
+        "token0": meta.token_out(meta.pool_t0[idx[0]]), "token1": meta.token_out(meta.pool_t1[idx[0]]),
+        "pools": [meta.pool_out(i) for i in idx if meta.pool_ids[i] in series],
+        "capital": req.capital, "sort_by": req.sort_by, "strategies": len(rows),
+        "results": grid_search.rank(rows, req.sort_by, req.top),
+    }
 
-@app.get("/sync/status")
-async def sync_status():
-    async with SessionLocal() as session:
-        pools = (await session.execute(text("select count(*) from pools"))).scalar_one()
-        day_rows = (await session.execute(text("select count(*) from pool_day_data"))).scalar_one()
-        hour_rows = (await session.execute(text("select count(*) from pool_hour_data"))).scalar_one()
-        max_day = (await session.execute(text("select coalesce(max(date),0) from pool_day_data"))).scalar_one()
-        max_hour = (await session.execute(text("select coalesce(max(hour_start_unix),0) from pool_hour_data"))).scalar_one()
+# ---------- VOLATILITY / CORRELATION ----------
+# Hourly log prices of the VOL_MAX_POOLS most-snapshotted pools kept in memory as one aligned
+# matrix (backend/analytics/volatility.py). New hours and pool_price_hour notifications patch it
+# in place; vol/cov/corr per window are computed once per update and requests slice them.
+VOL_MAX_POOLS = int(os.getenv("VOL_MAX_POOLS", "2000"))
+VOL_REFRESH_SECONDS = 60
+# The tracked set is re-chosen this often (new pools, pools going quiet)
+VOL_RELOAD_SECONDS = 6 * 3600
+_returns = ReturnsStore()
+_returns_loaded_at = 0.0
+_returns_dirty: Optional[int] = None
+
+def _mark_returns(pools: set, lo: Optional[int]):
+    global _returns_dirty
+    if _returns.end is None or (pools and not any(p in _returns.pos for p in pools)):
+        return
+    lo = _returns.start if lo is None else lo
+    _returns_dirty = lo if _returns_dirty is None else min(_returns_dirty, lo)
+
+async def _refresh_returns():
+    global _returns_loaded_at, _returns_dirty
+    now_h = int(time.time() // 3600)
+    if _returns.end is None or time.time() - _returns_loaded_at >= VOL_RELOAD_SECONDS:
+        _returns_dirty = None
+        th = now_h - _returns.width + 1
+        async with SessionLocal() as session:
+            ids = [r["pool_id"] for r in await _fetch_all(session, "vol_tracked_pools", SQL_TRACKED_POOLS,
+                                                           {"th": th, "until": now_h, "limit": VOL_MAX_POOLS})]
+            rows = await _fetch_all(session, "vol_prices", SQL_PRICES, {"pool_ids": ids, "th": th, "until": now_h})
+        await asyncio.to_thread(_returns.load, ids, rows, now_h)
+        _returns_loaded_at = time.time()
+    elif now_h > _returns.end or _returns_dirty is not None:
+        lo = _returns.end + 1 if _returns_dirty is None else min(_returns_dirty, _returns.end + 1)
+        _returns_dirty = None
+        async with SessionLocal() as session:
+            rows = await _fetch_all(session, "vol_prices", SQL_PRICES, {"pool_ids": _returns.pool_ids, "th": lo, "until": now_h})
+        await asyncio.to_thread(_returns.update, rows, lo, now_h)
+
+async def _returns_loop():
+    while True:
+        try:
+            await _refresh_returns()
+        except Exception:
+            pass
+        await asyncio.sleep(VOL_REFRESH_SECONDS)
 
+async def _returns_stats(window: str):
+    if _returns.end is None:
+        raise HTTPException(status_code=503, detail="Volatility data is still loading")
+    return await asyncio.to_thread(_returns.stats, window)
+
+def _finite(x: float) -> Optional[float]:
+    return x if x == x and abs(x) != float("inf") else None
+
+@app.get("/analytics/volatility")
+async def analytics_volatility(
+    window: Literal["1d", "7d", "30d"] = Query("7d"),
+    pool_id: Optional[List[str]] = Query(None, description="Repeat for several pools; default: the most volatile tracked pools"),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Annualised realized volatility of hourly log returns of price0."""
+    st = await _returns_stats(window)
+    if pool_id:
+        idx = [st.pos[p] for p in dict.fromkeys(pool_id) if p in st.pos]
+    else:
+        idx = np.argsort(-np.nan_to_num(st.vol, nan=-1.0), kind="stable")[:limit].tolist()
+    meta = await _meta_for([st.pool_ids[k] for k in idx])
+    items = []
+    for k in idx:
+        i = meta.pool_pos.get(st.pool_ids[k])
+        if i is not None:
+            items.append({"pool": meta.pool_out(i), "vol": _finite(float(st.vol[k]))})
+    return {"window": window, "end_hour": _returns.end, "tracked": len(st.pool_ids), "items": items}
+
+class CorrelationIn(BaseModel):
+    pool_ids: List[str] = Field(..., min_length=1, max_length=500)
+    window: Literal["1d", "7d", "30d"] = "7d"
+    kind: Literal["corr", "cov"] = "corr"
+
+@app.post("/analytics/correlation")
+async def analytics_correlation(req: CorrelationIn):
+    """Correlation (or annualised covariance) of hourly log returns between pools, in request order."""
+    st = await _returns_stats(req.window)
+    key = ("corr", _returns.version, req.window, req.kind, tuple(req.pool_ids))
+    cached = cache_vol.get(key)
+    if cached:
+        return cached
+    ids, m = st.slice(req.kind, list(dict.fromkeys(req.pool_ids)))
+    present = set(ids)
+    result = {
+        "window": req.window, "kind": req.kind, "end_hour": _returns.end,
+        "pool_ids": ids, "missing": [p for p in req.pool_ids if p not in present],
+        "matrix": [[_finite(v) for v in row] for row in m.astype(np.float64).tolist()],
+    }
+    cache_vol.set(key, result)
+    return result
+
+# ---------- SYNC STATUS ----------
+# Served from the snapshot tables ingestion maintains (backend/db/sync_state.py); the
+# subgraph _meta is polled in the background and stored alongside.
+SUBGRAPH_POLL_SECONDS = int(os.getenv("SUBGRAPH_POLL_SECONDS", "60"))
+SYNC_LAG_LIMIT = 10
+
+async def _subgraph_loop():
     endpoint = os.environ.get("GRAPH_ENDPOINT")
-    sg_block = None
-    has_err = None
-    if endpoint:
-        q = {"query": "{ _meta { block { number } hasIndexingErrors } }"}
+    if not endpoint:
+        return
+    v4_start = read_v4_startblock()
+    while True:
         try:
-            async with httpx.AsyncClient(timeout=10) as ac:
-                r = await ac.post(endpoint, json=q)
-                j = r.json()
-                m = (j.get("data") or {}).get("_meta") or {}
-                b = (m.get("block") or {}).get("number")
-                sg_block = b
-                has_err = m.get("hasIndexingErrors")
+            m = await asyncio.to_thread(fetch_meta, endpoint)
+            async with SessionLocal() as session:
+                with timed_query("sync_subgraph_store"):
+                    await record_subgraph(session, endpoint, m["block_number"], m["has_indexing_errors"], v4_start)
+                    await session.commit()
         except Exception:
             pass
+        await asyncio.sleep(SUBGRAPH_POLL_SECONDS)
+
+SQL_SYNC_STATUS = text("""
+  with m as (
+    select
+      (select max_bucket from sync_table_state where table_name = 'pool_day_data') as max_day,
+      (select max_bucket from sync_table_state where table_name = 'pool_hour_data') as max_hour
+  )
+  select
+    (select coalesce(json_object_agg(table_name, json_build_object(
+        'rows', row_count, 'max_bucket', max_bucket, 'updated_at', floor(extract(epoch from updated_at))::bigint)), '{}'::json)
+      from sync_table_state) as tables,
+    (select coalesce(json_object_agg(job, json_build_object(
+        'status', status, 'pools', pools, 'rows', rows_upserted, 'error', error,
+        'started_at', floor(extract(epoch from started_at))::bigint,
+        'finished_at', floor(extract(epoch from finished_at))::bigint)), '{}'::json)
+      from sync_runs) as runs,
+    (select row_to_json(g) from (
+        select endpoint, block_number, has_indexing_errors, v4_start_block,
+               floor(extract(epoch from checked_at))::bigint as checked_at
+        from sync_subgraph) g) as subgraph,
+    (select json_build_object(
+        'pools_behind_day', count(*) filter (where coalesce(s.max_day, -1) < m.max_day),
+        'pools_behind_hour', count(*) filter (where coalesce(s.max_hour, -1) < m.max_hour))
+      from sync_pool_state s, m) as lag,
+    (select coalesce(json_agg(x), '[]'::json) from (
+        select s.pool_id, s.max_day, s.max_hour, m.max_hour - s.max_hour as hours_behind
+        from sync_pool_state s, m
+        order by s.max_hour asc nulls first
+        limit :lag_limit) x) as most_behind
+""").bindparams(bindparam("lag_limit", type_=Integer))
+
+@app.get("/sync/status")
+async def sync_status():
+    async with SessionLocal() as session:
+        r = await _fetch_one(session, "sync_status", SQL_SYNC_STATUS, {"lag_limit": SYNC_LAG_LIMIT})
+
+    tables = r["tables"] or {}
+    sg = r["subgraph"] or {}
+    def _t(name, field):
+        return int((tables.get(name) or {}).get(field) or 0)
 
     return {
         "db": {
-            "pools": int(pools),
-            "pool_day_rows": int(day_rows),
-            "pool_hour_rows": int(hour_rows),
-            "max_day_id": int(max_day),
-            "max_hour_id": int(max_hour),
+            "pools": _t("pools", "rows"),
+            "pool_day_rows": _t("pool_day_data", "rows"),
+            "pool_hour_rows": _t("pool_hour_data", "rows"),
+            "max_day_id": _t("pool_day_data", "max_bucket"),
+            "max_hour_id": _t("pool_hour_data", "max_bucket"),
         },
+        "tables": tables,
+        "archive": {t: {"months": len(archive.months(t)), "cutoff_hour_id": archive.cutoff(t)} for t in archive.TABLES},
+        "runs": r["runs"] or {},
+        "lag": {**(r["lag"] or {}), "most_behind": r["most_behind"] or []},
         "subgraph": {
-            "endpoint": endpoint,
-            "block_number": sg_block,
-            "hasIndexingErrors": has_err,
+            "endpoint": sg.get("endpoint") or os.environ.get("GRAPH_ENDPOINT"),
+            "block_number": sg.get("block_number"),
+            "hasIndexingErrors": sg.get("has_indexing_errors"),
+            "v4_start_block": sg.get("v4_start_block"),
+            "checked_at": sg.get("checked_at"),
         },
     }
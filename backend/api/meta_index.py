@@ -0,0 +1,199 @@
+# In-process index of pool/token metadata (comments in English).
+# Struct-of-arrays storage: one compact array per column, rows addressed by position.
+# Secondary indexes map token / version / fee tier to arrays of pool positions, and
+# pre-sorted orders back keyset pagination without a per-request sort.
+
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from backend.db.pairs import pair_key
+
+SQL_TOKENS = text("select id, address, symbol, decimals from tokens")
+SQL_POOLS = text("""
+select id, version, chain_id, token0_id, token1_id, fee_tier_bps, tick_spacing, created_at_ts, pair_key
+from pools
+""")
+
+class MetaIndex:
+    __slots__ = (
+        # tokens
+        "token_ids", "token_addr", "token_sym", "token_sym_lc", "token_dec", "token_pos", "token_order", "token_order_keys",
+        # pools
+        "pool_ids", "pool_ver", "pool_chain", "pool_t0", "pool_t1", "pool_fee", "pool_tick", "pool_created", "pool_pos",
+        # secondary indexes and orders
+        "by_token", "by_version", "by_fee", "by_pair", "orders", "order_keys",
+        "loaded_at",
+    )
+
+    def __init__(self, tokens: Sequence[Dict[str, Any]], pools: Sequence[Dict[str, Any]], loaded_at: float = 0.0):
+        self.token_ids: List[str] = []
+        self.token_addr: List[str] = []
+        self.token_sym: List[Optional[str]] = []
+        self.token_sym_lc: List[str] = []
+        self.token_dec = array("h")
+        self.token_pos: Dict[str, int] = {}
+        for t in tokens:
+            self.token_pos[t["id"]] = len(self.token_ids)
+            self.token_ids.append(t["id"])
+            self.token_addr.append(t["address"])
+            self.token_sym.append(t["symbol"])
+            self.token_sym_lc.append((t["symbol"] or "").lower())
+            self.token_dec.append(int(t["decimals"]))
+        order = sorted(range(len(self.token_ids)), key=lambda j: (self.token_sym[j] or "", self.token_addr[j]))
+        self.token_order = array("i", order)
+        self.token_order_keys = [(self.token_sym[j] or "", self.token_addr[j]) for j in order]
+
+        self.pool_ids: List[str] = []
+        self.pool_ver = array("h")
+        self.pool_chain = array("i")
+        self.pool_t0 = array("i")
+        self.pool_t1 = array("i")
+        self.pool_fee = array("i")
+        self.pool_tick = array("i")
+        self.pool_created = array("q")
+        self.pool_pos: Dict[str, int] = {}
+        self.by_token: Dict[int, array] = {}
+        self.by_version: Dict[int, array] = {}
+        self.by_fee: Dict[int, array] = {}
+        # pools.pair_key -> pools, whatever the pools' token order
+        self.by_pair: Dict[str, array] = {}
+        for p in pools:
+            t0 = self.token_pos.get(p["token0_id"])
+            t1 = self.token_pos.get(p["token1_id"])
+            if t0 is None or t1 is None:
+                continue
+            i = len(self.pool_ids)
+            self.pool_pos[p["id"]] = i
+            self.pool_ids.append(p["id"])
+            self.pool_ver.append(int(p["version"]))
+            self.pool_chain.append(int(p["chain_id"]))
+            self.pool_t0.append(t0)
+            self.pool_t1.append(t1)
+            self.pool_fee.append(int(p["fee_tier_bps"]))
+            self.pool_tick.append(int(p["tick_spacing"]))
+            self.pool_created.append(int(p["created_at_ts"]))
+            self.by_token.setdefault(t0, array("i")).append(i)
+            if t1 != t0:
+                self.by_token.setdefault(t1, array("i")).append(i)
+            self.by_version.setdefault(int(p["version"]), array("i")).append(i)
+            self.by_fee.setdefault(int(p["fee_tier_bps"]), array("i")).append(i)
+            self.by_pair.setdefault(p["pair_key"] or pair_key(p["token0_id"], p["token1_id"]), array("i")).append(i)
+
+        # Ascending (sort column, id) orders for keyset pagination
+        self.orders: Dict[str, array] = {}
+        self.order_keys: Dict[str, List[Tuple[int, str]]] = {}
+        for name, col in (("created_at_ts", self.pool_created), ("fee_tier_bps", self.pool_fee)):
+            order = sorted(range(len(self.pool_ids)), key=lambda i: (col[i], self.pool_ids[i]))
+            self.orders[name] = array("i", order)
+            self.order_keys[name] = [(col[i], self.pool_ids[i]) for i in order]
+        self.loaded_at = loaded_at
+
+    # ---- tokens ----
+    def token_out(self, j: int) -> Dict[str, Any]:
+        return {"address": self.token_addr[j], "symbol": self.token_sym[j], "decimals": self.token_dec[j]}
+
+    def symbol_matches(self, q: str) -> set:
+        """Token positions whose symbol contains q, case-insensitively (like ilike '%q%')."""
+        ql = q.lower()
+        return {j for j, s in enumerate(self.token_sym_lc) if ql in s}
+
+    def iter_tokens(self, q: Optional[str] = None, after: Optional[Tuple[str, str]] = None) -> Iterator[int]:
+        """Token positions ordered by (symbol, address), optionally strictly after a keyset cursor."""
+        start = bisect_right(self.token_order_keys, after) if after is not None else 0
+        ql = q.lower() if q else None
+        for k in range(start, len(self.token_order)):
+            j = self.token_order[k]
+            if ql is None or (self.token_sym[j] is not None and ql in self.token_sym_lc[j]):
+                yield j
+
+    # ---- pools ----
+    def pool_out(self, i: int) -> Dict[str, Any]:
+        return {
+            "id": self.pool_ids[i], "version": self.pool_ver[i], "chain_id": self.pool_chain[i],
+            "token0": self.token_out(self.pool_t0[i]), "token1": self.token_out(self.pool_t1[i]),
+            "fee_tier_bps": self.pool_fee[i], "tick_spacing": self.pool_tick[i], "created_at_ts": self.pool_created[i],
+        }
+
+    def export_row(self, pool_id: str) -> Tuple:
+        """(version, chain_id, token0, token1, fee_tier_bps, tick_spacing, created_at_ts) with tokens as symbol-or-address."""
+        i = self.pool_pos.get(pool_id)
+        if i is None:
+            return (None,) * 7
+        t0, t1 = self.pool_t0[i], self.pool_t1[i]
+        return (self.pool_ver[i], self.pool_chain[i], self.token_sym[t0] or self.token_addr[t0], self.token_sym[t1] or self.token_addr[t1],
+                self.pool_fee[i], self.pool_tick[i], self.pool_created[i])
+
+    def pool_matcher(self, version: Optional[int] = None, token: Optional[str] = None, token_symbol: Optional[str] = None,
+                     fee_min: Optional[int] = None, fee_max: Optional[int] = None):
+        """Predicate over pool positions implementing the /pools filters."""
+        tpos = self.token_pos.get(token, -1) if token else None
+        sym = self.symbol_matches(token_symbol) if token_symbol else None
+
+        def match(i: int) -> bool:
+            if version is not None and self.pool_ver[i] != version:
+                return False
+            if tpos is not None and self.pool_t0[i] != tpos and self.pool_t1[i] != tpos:
+                return False
+            if sym is not None and self.pool_t0[i] not in sym and self.pool_t1[i] not in sym:
+                return False
+            if fee_min is not None and self.pool_fee[i] < fee_min:
+                return False
+            if fee_max is not None and self.pool_fee[i] > fee_max:
+                return False
+            return True
+        return match
+
+    def pair_pools(self, token_a: str, token_b: str, versions: Optional[Iterable[int]] = None) -> List[int]:
+        """Pool positions of the pair in either orientation, optionally limited to some versions."""
+        idxs = self.by_pair.get(pair_key(token_a, token_b), ())
+        if versions is None:
+            return list(idxs)
+        vs = set(versions)
+        return [i for i in idxs if self.pool_ver[i] in vs]
+
+    def candidates(self, version: Optional[int] = None, token: Optional[str] = None) -> Iterable[int]:
+        """Smallest secondary-index slice that can contain the matches."""
+        if token:
+            tpos = self.token_pos.get(token)
+            return self.by_token.get(tpos, ()) if tpos is not None else ()
+        if version is not None:
+            return self.by_version.get(version, ())
+        return range(len(self.pool_ids))
+
+    def filter_pools(self, version: Optional[int] = None, token: Optional[str] = None, token_symbol: Optional[str] = None,
+                     fee_min: Optional[int] = None, fee_max: Optional[int] = None) -> List[int]:
+        match = self.pool_matcher(version, token, token_symbol, fee_min, fee_max)
+        return [i for i in self.candidates(version, token) if match(i)]
+
+    def iter_pools(self, order_by: str, desc: bool, match, after: Optional[Tuple[int, str]] = None) -> Iterator[int]:
+        """Pool positions in (order_by, id) order, optionally strictly past a keyset cursor."""
+        order = self.orders[order_by]
+        keys = self.order_keys[order_by]
+        if desc:
+            stop = bisect_left(keys, after) if after is not None else len(order)
+            rng = range(stop - 1, -1, -1)
+        else:
+            start = bisect_right(keys, after) if after is not None else 0
+            rng = range(start, len(order))
+        for k in rng:
+            i = order[k]
+            if match(i):
+                yield i
+
+    def summary(self, idxs: Iterable[int]) -> Tuple[int, Dict[int, int], Dict[int, int]]:
+        total = 0
+        by_ver: Dict[int, int] = {}
+        by_fee: Dict[int, int] = {}
+        for i in idxs:
+            total += 1
+            by_ver[self.pool_ver[i]] = by_ver.get(self.pool_ver[i], 0) + 1
+            by_fee[self.pool_fee[i]] = by_fee.get(self.pool_fee[i], 0) + 1
+        return total, by_ver, by_fee
+
+async def load_meta_index(session, loaded_at: float = 0.0) -> MetaIndex:
+    tokens = (await session.execute(SQL_TOKENS)).mappings().all()
+    pools = (await session.execute(SQL_POOLS)).mappings().all()
+    return MetaIndex(tokens, pools, loaded_at)
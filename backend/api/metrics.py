@@ -0,0 +1,160 @@
+# Minimal in-process metrics with Prometheus text exposition (format 0.0.4).
+# Counters and histograms keyed by label tuples; values are per process, so with several
+# uvicorn workers each one is scraped (or aggregated) separately.
+
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+# Seconds spent in SQL by the current request (set by the HTTP middleware)
+db_time: ContextVar[Optional[List[float]]] = ContextVar("db_time", default=None)
+# Name of the timed_query being executed (read by tools that capture statements per query)
+current_query: ContextVar[Optional[str]] = ContextVar("current_query", default=None)
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class Counter:
+    __slots__ = ("name", "help", "labels", "_values")
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for lv, v in sorted(self._values.items()):
+            out.append(f"{self.name}{_fmt_labels(self.labels, lv)} {_num(v)}")
+        return out
+
+class Gauge:
+    """Value read at scrape time from a callback returning {label_values: value}."""
+    __slots__ = ("name", "help", "labels", "fn")
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], fn):
+        self.name, self.help, self.labels, self.fn = name, help, tuple(labels), fn
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.fn()
+        except Exception:
+            values = {}
+        for lv, v in sorted(values.items()):
+            out.append(f"{self.name}{_fmt_labels(self.labels, lv)} {_num(v)}")
+        return out
+
+class Histogram:
+    __slots__ = ("name", "help", "labels", "buckets", "_series")
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [bucket counts..., sum, count]
+        self._series: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *label_values):
+        s = self._series.get(label_values)
+        if s is None:
+            s = self._series[label_values] = [0] * (len(self.buckets) + 2)
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                s[i] += 1
+        s[-2] += value
+        s[-1] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for lv, s in sorted(self._series.items()):
+            for i, b in enumerate(self.buckets):
+                le = 'le="%s"' % _num(b)
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, lv, le)} {s[i]}")
+            le = 'le="+Inf"'
+            out.append(f"{self.name}_bucket{_fmt_labels(self.labels, lv, le)} {s[-1]}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, lv)} {_num(s[-2])}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, lv)} {s[-1]}")
+        return out
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, m):
+        self._metrics.append(m)
+        return m
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+http_duration = REGISTRY.register(Histogram(
+    "lp_http_request_duration_seconds", "Time to response start per route (streamed bodies continue after).",
+    ("method", "route", "status")))
+http_db_duration = REGISTRY.register(Histogram(
+    "lp_http_request_db_seconds", "Time spent in SQL per request, by route.", ("method", "route")))
+sql_duration = REGISTRY.register(Histogram(
+    "lp_sql_duration_seconds", "SQL execution time per named query (streams: until the last row).", ("query",)))
+sql_rows = REGISTRY.register(Histogram(
+    "lp_sql_rows", "Rows returned per named query.", ("query",), ROW_BUCKETS))
+sql_errors = REGISTRY.register(Counter(
+    "lp_sql_errors_total", "Named queries that raised.", ("query",)))
+cache_requests = REGISTRY.register(Counter(
+    "lp_cache_requests_total", "TTLCache lookups by result.", ("cache", "result")))
+cache_evictions = REGISTRY.register(Counter(
+    "lp_cache_evictions_total", "TTLCache entries dropped, by reason (expired, size, invalidated).", ("cache", "reason")))
+pool_checkout = REGISTRY.register(Histogram(
+    "lp_db_pool_checkout_seconds", "Wait for a connection from the SQLAlchemy pool."))
+
+def add_db_time(seconds: float):
+    acc = db_time.get()
+    if acc is not None:
+        acc[0] += seconds
+
+class timed_query:
+    """Context manager recording duration / errors of one named query; call .rows(n) to record a row count."""
+    __slots__ = ("name", "t0", "_token")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._token = current_query.set(self.name)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        dt = time.perf_counter() - self.t0
+        try:
+            current_query.reset(self._token)
+        except ValueError:
+            # Streaming generators may be finalized from another context
+            pass
+        sql_duration.observe(dt, self.name)
+        add_db_time(dt)
+        if exc_type is not None:
+            sql_errors.inc(self.name)
+        return False
+
+    def rows(self, n: int):
+        sql_rows.observe(n, self.name)
@@ -0,0 +1,168 @@
+# On-demand sampling profiler for single API requests (comments in English).
+#
+# A request carrying "X-Profile: <PROFILE_TOKEN>" is profiled by a background thread that
+# samples the event-loop thread every PROFILE_INTERVAL_MS:
+#   - when the request's task is running, its Python stack (row mapping, pydantic, JSON encoding)
+#   - when the loop is idle in select(), the task's await chain, leaf marked "[wait]"
+#     (SQL round trips, pool checkout)
+#   - when another task holds the loop, a single "[other task]" frame
+# Samples are kept as collapsed stacks (flamegraph.pl / speedscope input) in a small ring
+# buffer and optionally written to PROFILE_DIR. Nothing runs for unprofiled requests.
+
+import os, sys, time, uuid, hmac, asyncio, threading
+from collections import Counter, deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+HEADER = "x-profile"
+
+# Frames of the event loop itself, cut from the bottom of every running-stack sample
+_LOOP_FILES = tuple(os.sep + d + os.sep for d in ("asyncio", "uvicorn", "uvloop", "anyio")) + ("threading.py", "runpy.py")
+
+def _label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _thread_stack(frame) -> List[str]:
+    codes = []
+    while frame is not None:
+        codes.append(frame.f_code)
+        frame = frame.f_back
+    codes.reverse()
+    # Drop the loop plumbing at the bottom (run_forever -> _run_once -> Handle._run)
+    i = 0
+    while i < len(codes) and any(p in codes[i].co_filename for p in _LOOP_FILES):
+        i += 1
+    return [_label(c) for c in codes[i:]]
+
+def _await_chain(coro) -> List[str]:
+    out = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        out.append(_label(frame.f_code))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    if coro is not None and not hasattr(coro, "cr_frame"):
+        out.append(type(coro).__name__)
+    return out
+
+class Profile:
+    __slots__ = ("id", "method", "path", "query", "started_at", "duration", "samples", "interval_ms")
+
+    def __init__(self, method: str, path: str, query: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.method, self.path, self.query = method, path, query
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.samples: Counter = Counter()
+        self.interval_ms = PROFILE_INTERVAL_MS
+
+    def collapsed(self) -> str:
+        return "".join(f"{';'.join(stack)} {n}\n" for stack, n in self.samples.most_common())
+
+    def tree(self) -> str:
+        """Indented call tree with sample counts and share of the total."""
+        total = sum(self.samples.values()) or 1
+        root: Dict = {}
+        for stack, n in self.samples.items():
+            node = root
+            for fr in stack:
+                node = node.setdefault(fr, [0, {}])
+                node[0] += n
+                node = node[1]
+        lines = [f"{self.method} {self.path}{'?' + self.query if self.query else ''}  "
+                 f"{self.duration * 1000:.1f} ms, {total} samples @ {self.interval_ms} ms"]
+        def walk(children: Dict, depth: int):
+            for name, (n, sub) in sorted(children.items(), key=lambda kv: -kv[1][0]):
+                lines.append(f"{'  ' * depth}{n / total * 100:5.1f}% {n:6d}  {name}")
+                walk(sub, depth + 1)
+        walk(root, 0)
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict:
+        return {"id": self.id, "method": self.method, "path": self.path, "query": self.query,
+                "started_at": self.started_at, "duration_ms": round(self.duration * 1000, 3),
+                "samples": sum(self.samples.values()), "interval_ms": self.interval_ms}
+
+class _Sampler(threading.Thread):
+    def __init__(self, profile: Profile, loop: asyncio.AbstractEventLoop, task: asyncio.Task):
+        super().__init__(name=f"profiler-{profile.id}", daemon=True)
+        self.profile, self.loop, self.task = profile, loop, task
+        self.loop_thread = threading.get_ident()
+        self.stopped = threading.Event()
+
+    def _on_stack(self, task: asyncio.Task, frames) -> bool:
+        frame = getattr(task.get_coro(), "cr_frame", None)
+        return frame is not None and id(frame) in frames
+
+    def run(self):
+        interval = self.profile.interval_ms / 1000.0
+        root = ("request",)
+        while not self.stopped.wait(interval):
+            # The task running is the one whose outermost coroutine frame is on the loop thread's stack
+            frame = sys._current_frames().get(self.loop_thread)
+            frames = set()
+            f = frame
+            while f is not None:
+                frames.add(id(f))
+                f = f.f_back
+            if self._on_stack(self.task, frames):
+                stack = root + tuple(_thread_stack(frame))
+            elif any(self._on_stack(t, frames) for t in asyncio.all_tasks(self.loop)):
+                stack = root + ("[other task]",)
+            else:
+                stack = root + tuple(_await_chain(self.task.get_coro())) + ("[wait]",)
+            self.profile.samples[stack] += 1
+
+profiles: Deque[Profile] = deque(maxlen=PROFILE_KEEP)
+_busy = threading.Lock()
+
+def authorized(value: Optional[str]) -> bool:
+    return bool(PROFILE_TOKEN) and value is not None and hmac.compare_digest(value, PROFILE_TOKEN)
+
+def get_profile(pid: str) -> Optional[Profile]:
+    return next((p for p in profiles if p.id == pid), None)
+
+class ProfileMiddleware:
+    """
+    Pure ASGI middleware. Install it innermost so it runs in the same task as the endpoint,
+    response serialization and any streamed body.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILE_TOKEN:
+            return await self.app(scope, receive, send)
+        value = next((v.decode() for k, v in scope["headers"] if k == HEADER.encode()), None)
+        if not authorized(value) or not _busy.acquire(blocking=False):
+            return await self.app(scope, receive, send)
+
+        profile = Profile(scope["method"], scope["path"], scope.get("query_string", b"").decode())
+        sampler = _Sampler(profile, asyncio.get_running_loop(), asyncio.current_task())
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]}
+            await send(message)
+
+        t0 = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stopped.set()
+            await asyncio.to_thread(sampler.join)
+            profile.duration = time.perf_counter() - t0
+            profiles.append(profile)
+            _busy.release()
+            if PROFILE_DIR:
+                try:
+                    Path(PROFILE_DIR).mkdir(parents=True, exist_ok=True)
+                    (Path(PROFILE_DIR) / f"{profile.id}.collapsed").write_text(profile.collapsed(), encoding="utf-8")
+                except OSError:
+                    pass
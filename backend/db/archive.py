@@ -0,0 +1,280 @@
+# Cold tier for the hourly series tables (comments in English).
+#
+# Closed months of pool_hour_data and pool_price_hour move out of Postgres into one zstd Parquet
+# file per table and month:
+#   <ARCHIVE_DIR>/<table>/<YYYY-MM>.parquet     rows sorted by (pool_id, hour_start_unix)
+# Row groups are small and sorted by pool, so a pool's hours are found from the row-group
+# statistics and read through a memory map. Numerics are stored as float64 (what every reader
+# casts them to anyway).
+#
+# Archived months are contiguous from the oldest; a table's cutoff is the first hour after its
+# last archived month. Readers take hours below the cutoff from the files and hours from the
+# cutoff on from Postgres, so a month is cold as soon as its file exists. The archiver publishes
+# each file (NOTIFY "archive"), waits --grace-seconds for readers to pick it up (listeners at once,
+# others within LIST_TTL_SECONDS), and only then deletes the month from Postgres. The delete is
+# keyed by the exported rows' (pool_id, hour, xmin), so rows inserted or corrected after the export
+# stay in Postgres; like any late row of an archived month they are not served until the next run
+# merges them into its file.
+#
+#   python -m backend.db.archive                       # every closed month older than --keep-months (3)
+#   python -m backend.db.archive --before 2024-01 --tables pool_price_hour --dry-run
+
+import os, sys, time, asyncio, argparse, calendar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ROOT = Path("/Users/axel/Dev/open-source/uniswap-lp-analytics")
+
+# table -> archived columns; numerics as float64
+TABLES: Dict[str, pa.Schema] = {
+    "pool_hour_data": pa.schema([
+        ("id", pa.string()), ("pool_id", pa.string()), ("hour_start_unix", pa.int32()),
+        ("volume_token0", pa.float64()), ("volume_token1", pa.float64()),
+        ("approx_fee_token0", pa.float64()), ("approx_fee_token1", pa.float64()),
+        ("swap_count", pa.int32()),
+    ]),
+    "pool_price_hour": pa.schema([
+        ("pool_id", pa.string()), ("hour_start_unix", pa.int32()),
+        ("sqrt_price_x96", pa.float64()), ("price0", pa.float64()), ("price1", pa.float64()),
+        ("liquidity", pa.float64()), ("updated_at", pa.int64()),
+    ]),
+}
+ROW_GROUP_ROWS = 16384
+LIST_TTL_SECONDS = 30
+DELETE_CHUNK_ROWS = 50000
+
+def archive_dir() -> Path:
+    return Path(os.environ.get("ARCHIVE_DIR") or ROOT / "archive")
+
+def month_hours(month: str) -> Tuple[int, int]:
+    """"YYYY-MM" -> (first hour id, first hour id of the next month)."""
+    y, m = (int(x) for x in month.split("-"))
+    lo = calendar.timegm((y, m, 1, 0, 0, 0)) // 3600
+    y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return lo, calendar.timegm((y, m, 1, 0, 0, 0)) // 3600
+
+def month_of(hour_id: int) -> str:
+    return datetime.fromtimestamp(hour_id * 3600, tz=timezone.utc).strftime("%Y-%m")
+
+def month_path(table: str, month: str) -> Path:
+    return archive_dir() / table / f"{month}.parquet"
+
+# ---------- reading ----------
+# table -> [(lo, hi exclusive, path)] of the contiguous archived months, oldest first
+_months: Dict[str, List[Tuple[int, int, Path]]] = {}
+_listed: Tuple[float, Optional[Path]] = (0.0, None)
+
+def refresh():
+    """Re-scan ARCHIVE_DIR; months after a gap are ignored until the gap is filled."""
+    global _listed
+    root = archive_dir()
+    out: Dict[str, List[Tuple[int, int, Path]]] = {}
+    for table in TABLES:
+        months = []
+        d = root / table
+        names = sorted(p.stem for p in d.glob("*.parquet")) if d.is_dir() else []
+        for name in names:
+            try:
+                lo, hi = month_hours(name)
+            except ValueError:
+                continue
+            if months and months[-1][1] != lo:
+                break
+            months.append((lo, hi, d / f"{name}.parquet"))
+        out[table] = months
+    _months.clear()
+    _months.update(out)
+    _listed = (time.monotonic(), root)
+
+def months(table: str) -> List[Tuple[int, int, Path]]:
+    at, root = _listed
+    if root != archive_dir() or time.monotonic() - at > LIST_TTL_SECONDS:
+        refresh()
+    return _months.get(table, [])
+
+def cutoff(table: str) -> Optional[int]:
+    """First hour id served by Postgres, or None when nothing of the table is archived."""
+    m = months(table)
+    return m[-1][1] if m else None
+
+def read(table: str, pool_ids: Optional[Sequence[str]], lo: int, hi: int, columns: Optional[List[str]] = None,
+         max_rows: Optional[int] = None) -> pa.Table:
+    """
+    Archived rows with lo <= hour_start_unix <= hi (of pool_ids, or all pools when None), months in
+    ascending order and each sorted by (pool_id, hour). With max_rows, months are read newest first
+    until at least that many rows were found.
+    """
+    schema = TABLES[table]
+    cols = columns or schema.names
+    filters = [("hour_start_unix", ">=", lo), ("hour_start_unix", "<=", hi)]
+    if pool_ids is not None:
+        filters.append(("pool_id", "in", list(pool_ids)))
+    parts: List[pa.Table] = []
+    n = 0
+    for m_lo, m_hi, path in reversed(months(table)):
+        if m_lo > hi or m_hi <= lo:
+            continue
+        t = pq.read_table(path, columns=cols, filters=filters, memory_map=True)
+        parts.append(t)
+        n += t.num_rows
+        if max_rows is not None and n >= max_rows:
+            break
+    if not parts:
+        return pa.schema([schema.field(c) for c in cols]).empty_table()
+    return pa.concat_tables(parts[::-1])
+
+# ---------- writing ----------
+def _select_sql(table: str) -> str:
+    """The archived columns, then the row version (xmin) the delete is keyed by."""
+    cols = ", ".join(f"{f.name}::float8 as {f.name}" if pa.types.is_float64(f.type) else f.name for f in TABLES[table])
+    return f"""
+      select {cols}, xmin::text as row_xmin from {table}
+      where hour_start_unix >= :lo and hour_start_unix < :hi
+      order by pool_id, hour_start_unix
+    """
+
+def _delete_sql(table: str) -> str:
+    """Delete exported row versions; -> the pools that lost rows."""
+    return f"""
+      with d as (
+        delete from {table} t
+        using unnest(cast(:pool_ids as text[]), cast(:hours as int[]), cast(:xmins as text[])) as k(pool_id, h, x)
+        where t.pool_id = k.pool_id and t.hour_start_unix = k.h and t.xmin = k.x::xid
+        returning t.pool_id
+      )
+      select distinct pool_id from d
+    """
+
+def _write(table: str, month: str, t: pa.Table):
+    """Write atomically (temp file, fsync, rename); rows already in the month's file are kept unless t replaces them."""
+    path = month_path(table, month)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        old = pq.read_table(path)
+        key = lambda x: np.char.add(np.asarray(x["pool_id"].to_pylist(), dtype=str), np.asarray(x["hour_start_unix"]).astype(str))
+        keep = ~np.isin(key(old), key(t)) if t.num_rows else np.ones(old.num_rows, dtype=bool)
+        t = pa.concat_tables([old.filter(pa.array(keep)), t]).sort_by([("pool_id", "ascending"), ("hour_start_unix", "ascending")])
+    tmp = path.with_suffix(".parquet.tmp")
+    pq.write_table(t, tmp, compression="zstd", row_group_size=ROW_GROUP_ROWS)
+    fd = os.open(tmp, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
+    fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+async def main():
+    from dotenv import load_dotenv
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from backend.db.notify import notify_changes
+    from backend.db.sync_state import update_pool_state, update_table_state, record_run, utcnow
+
+    ap = argparse.ArgumentParser(description="Move closed months of the hourly series tables into Parquet files")
+    ap.add_argument("--tables", default=",".join(TABLES), help="Comma-separated subset of " + ", ".join(TABLES))
+    ap.add_argument("--keep-months", type=int, default=3, help="Months kept in Postgres besides the current one")
+    ap.add_argument("--before", default=None, help="Archive months before YYYY-MM instead (must be closed)")
+    ap.add_argument("--grace-seconds", type=float, default=2 * LIST_TTL_SECONDS,
+                    help="Wait between publishing a file and deleting its rows; at least the readers' rescan interval")
+    ap.add_argument("--dry-run", action="store_true", help="Print the months that would be archived")
+    args = ap.parse_args()
+
+    load_dotenv(ROOT / ".env", override=True)
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        print("ERROR: DATABASE_URL is not set", file=sys.stderr); sys.exit(2)
+    tables = [t.strip() for t in args.tables.split(",") if t.strip()]
+    bad = [t for t in tables if t not in TABLES]
+    if bad:
+        print(f"ERROR: unknown tables: {', '.join(bad)}", file=sys.stderr); sys.exit(2)
+
+    current = month_hours(month_of(int(time.time() // 3600)))[0]
+    if args.before:
+        try:
+            before = month_hours(args.before)[0]
+        except ValueError:
+            print("ERROR: --before must be YYYY-MM", file=sys.stderr); sys.exit(2)
+        if before > current:
+            print("ERROR: --before must not be after the current month", file=sys.stderr); sys.exit(2)
+    else:
+        before = current
+        for _ in range(args.keep_months):
+            before = month_hours(month_of(before - 1))[0]
+
+    engine = create_async_engine(db_url, future=True)
+    started = utcnow()
+    total = 0
+    try:
+        for table in tables:
+            async with engine.connect() as conn:
+                first = (await conn.execute(text(f"select min(hour_start_unix) from {table}"))).scalar_one()
+            if first is None or first >= before:
+                print(f"{table}: nothing before {month_of(before)}")
+                continue
+            # Start at the archive's end when there is one so empty months keep the files contiguous
+            refresh()
+            lo = min(first, cutoff(table) or first)
+            lo = month_hours(month_of(lo))[0]
+            while lo < before:
+                month = month_of(lo)
+                hi = month_hours(month)[1]
+                if args.dry_run:
+                    async with engine.connect() as conn:
+                        n = (await conn.execute(text(f"select count(*) from {table} where hour_start_unix >= :lo and hour_start_unix < :hi"),
+                                                {"lo": lo, "hi": hi})).scalar_one()
+                    print(f"{table} {month}: {n} rows")
+                    lo = hi
+                    continue
+
+                t0 = time.perf_counter()
+                schema = TABLES[table]
+                batches = []
+                xmins: List[str] = []
+                async with engine.connect() as conn:
+                    result = await conn.stream(text(_select_sql(table)), {"lo": lo, "hi": hi})
+                    async for chunk in result.partitions(100000):
+                        batches.append(pa.record_batch([pa.array([r[k] for r in chunk], type=f.type) for k, f in enumerate(schema)], schema=schema))
+                        xmins += [r[-1] for r in chunk]
+                t = pa.Table.from_batches(batches, schema=schema)
+                path = month_path(table, month)
+                if not t.num_rows and path.exists():
+                    lo = hi
+                    continue
+                await asyncio.to_thread(_write, table, month, t)
+                async with engine.begin() as conn:
+                    await notify_changes(conn, "archive", [], lo, hi - 1)
+                if t.num_rows:
+                    await asyncio.sleep(args.grace_seconds)
+                    keys = (t["pool_id"].to_pylist(), t["hour_start_unix"].to_pylist())
+                    pool_ids = set()
+                    async with engine.begin() as conn:
+                        for i in range(0, t.num_rows, DELETE_CHUNK_ROWS):
+                            part = slice(i, i + DELETE_CHUNK_ROWS)
+                            res = await conn.execute(text(_delete_sql(table)), {"pool_ids": keys[0][part], "hours": keys[1][part], "xmins": xmins[part]})
+                            pool_ids.update(res.scalars().all())
+                        await update_pool_state(conn, table, sorted(pool_ids))
+                        await update_table_state(conn, table)
+                total += t.num_rows
+                print(f"{table} {month}: {t.num_rows} rows -> {path} ({path.stat().st_size / 1e6:.1f} MB) in {time.perf_counter() - t0:.1f}s")
+                lo = hi
+        if not args.dry_run:
+            async with engine.begin() as conn:
+                await record_run(conn, "archive_hourly", started, rows=total)
+    except Exception as e:
+        async with engine.begin() as conn:
+            await record_run(conn, "archive_hourly", started, status="error", rows=total, error=repr(e))
+        raise
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+# OHLC candles over pool_price_hour (one price snapshot per hour). 1h candles are the hourly rows
+# themselves; coarser resolutions are rolled up into pool_price_candle by the writers, in the
+# same transaction as the hours they cover, so reads are a primary-key range scan.
+# A candle's open/close are its first/last hourly snapshot, high/low the extremes among them.
+# Candles of archived months (backend/db/archive.py) were rolled up before their hours left
+# Postgres and are kept; a candle straddling the archive cutoff takes its archived hours from the
+# Parquet files.
+#
+# Rebuild (e.g. after creating the table on an existing DB); only candles from the cutoff on:
+#   python -m backend.db.candles
+
+import os, asyncio
+from pathlib import Path
+from typing import Iterable, Optional
+from dotenv import load_dotenv
+from sqlalchemy import text, bindparam, BigInteger, Float, Integer, String
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from backend.db import archive
+from backend.db.sync_state import record_run, utcnow
+
+ROOT = Path("/Users/axel/Dev/open-source/uniswap-lp-analytics")
+
+# name -> (hours, offset); hour id 0 is a Thursday, +72h puts week boundaries on Mondays
+RESOLUTIONS = {"1h": (1, 0), "4h": (4, 0), "1d": (24, 0), "1w": (168, 72)}
+ROLLUPS = ("4h", "1d", "1w")
+
+def bucket_of(hour_id: int, resolution: str) -> int:
+    hours, off = RESOLUTIONS[resolution]
+    return (hour_id + off) // hours * hours - off
+
+# archived pool_price_hour columns fed to a straddling candle
+COLD_COLUMNS = ("pool_id", "hour_start_unix", "price0", "price1", "liquidity", "updated_at")
+COLD_TYPES = (String, Integer, Float, Float, Float, BigInteger)
+
+def _rollup_sql(resolution: str, by_pool: bool, cold: bool):
+    hours, off = RESOLUTIONS[resolution]
+    pools = "pool_id = any(:pool_ids) and" if by_pool else ""
+    src = f"""
+      select pool_id, hour_start_unix, price0, price1, liquidity, updated_at
+      from pool_price_hour
+      where {pools} hour_start_unix >= :lo and hour_start_unix <= :hi"""
+    if cold:
+        src += f"""
+      union all
+      select c.pool_id, c.hour_start_unix, c.price0::numeric, c.price1::numeric, c.liquidity::numeric, c.updated_at
+      from unnest({", ".join(":cold_" + c for c in COLD_COLUMNS)}) as c({", ".join(COLD_COLUMNS)})"""
+    sql = text(f"""
+    insert into pool_price_candle (pool_id, resolution, bucket, open0, high0, low0, close0, open1, high1, low1, close1,
+                                   liquidity, hours, updated_at)
+    select pool_id, {hours}, bucket,
+           (array_agg(price0 order by hour_start_unix))[1], max(price0), min(price0), (array_agg(price0 order by hour_start_unix desc))[1],
+           (array_agg(price1 order by hour_start_unix))[1], max(price1), min(price1), (array_agg(price1 order by hour_start_unix desc))[1],
+           (array_agg(liquidity order by hour_start_unix desc))[1], count(*), max(updated_at)
+    from (
+      select *, (hour_start_unix + {off}) / {hours} * {hours} - {off} as bucket
+      from ({src}
+      ) s
+    ) h
+    group by pool_id, bucket
+    on conflict (pool_id, resolution, bucket) do update set
+      open0 = excluded.open0, high0 = excluded.high0, low0 = excluded.low0, close0 = excluded.close0,
+      open1 = excluded.open1, high1 = excluded.high1, low1 = excluded.low1, close1 = excluded.close1,
+      liquidity = excluded.liquidity, hours = excluded.hours, updated_at = excluded.updated_at
+    """)
+    binds = [bindparam("lo", type_=Integer), bindparam("hi", type_=Integer)]
+    if by_pool:
+        binds.append(bindparam("pool_ids", type_=ARRAY(String)))
+    if cold:
+        binds += [bindparam("cold_" + c, type_=ARRAY(t)) for c, t in zip(COLD_COLUMNS, COLD_TYPES)]
+    return sql.bindparams(*binds)
+
+_ROLLUP_SQL = {(r, p, c): _rollup_sql(r, p, c) for r in ROLLUPS for p in (True, False) for c in (True, False)}
+
+async def refresh_candles(conn, pool_ids: Optional[Iterable[str]], lo: int, hi: int):
+    """
+    Recompute every candle touching hours lo..hi (whole buckets) for pool_ids, or all pools when None.
+    Hours below the archive cutoff are left alone, like every reader does until the archiver merges them.
+    """
+    ids = list(pool_ids) if pool_ids is not None else None
+    cut = archive.cutoff("pool_price_hour")
+    if cut is not None:
+        if hi < cut:
+            return
+        lo = max(lo, cut)
+    for r in ROLLUPS:
+        hours = RESOLUTIONS[r][0]
+        params = {"lo": bucket_of(lo, r), "hi": bucket_of(hi, r) + hours - 1}
+        cold = cut is not None and params["lo"] < cut
+        if cold:
+            t = await asyncio.to_thread(archive.read, "pool_price_hour", ids, params["lo"], cut - 1, list(COLD_COLUMNS))
+            params.update({"cold_" + c: t[c].to_pylist() for c in COLD_COLUMNS})
+            params["lo"] = cut
+        if ids is not None:
+            params["pool_ids"] = ids
+        await conn.execute(_ROLLUP_SQL[(r, ids is not None, cold)], params)
+
+async def main():
+    load_dotenv(ROOT / ".env", override=True)
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        raise SystemExit("DATABASE_URL is not set in .env")
+
+    engine = create_async_engine(db_url, future=True)
+    started = utcnow()
+    cut = archive.cutoff("pool_price_hour")
+    async with engine.begin() as conn:
+        lo, hi = (await conn.execute(text("select min(hour_start_unix), max(hour_start_unix) from pool_price_hour where hour_start_unix >= :cut"),
+                                     {"cut": cut or 0})).one()
+        if cut is None:
+            await conn.execute(text("truncate pool_price_candle"))
+        else:
+            # Keep candles wholly below the cutoff: their hours are only in the archive now
+            await conn.execute(text("delete from pool_price_candle where bucket + resolution > :cut"), {"cut": cut})
+            lo, hi = cut, hi if hi is not None else cut
+        if lo is not None:
+            await refresh_candles(conn, None, lo, hi)
+        n = (await conn.execute(text("select count(*) from pool_price_candle"))).scalar_one()
+        await record_run(conn, "rebuild_price_candles", started, rows=n)
+    await engine.dispose()
+    print(f"Rebuilt {n} candles")
+
+if __name__ == "__main__":
+    asyncio.run(main())
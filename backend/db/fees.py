@@ -0,0 +1,122 @@
+# Fee tier unit (comments in English). pools.fee_tier_bps holds the subgraph's feeTierBps, which is
+# the raw Uniswap fee in hundredths of a bp (3000 = 0.3%). Ingestion, the synthetic generator and
+# the analytics convert it here and nowhere else.
+#
+# Databases ingested before this unit was fixed hold approx fees 100x too high (amount * fee / 1e4).
+# The job below recomputes them from the volumes, so it is safe to re-run: pool_day_data and
+# pool_hour_data, then the archived Parquet months, then every cached series file. pool_yield is
+# emptied first (its APRs come from the same fees); re-run the yields job afterwards. Stop the
+# ingestion jobs and the archiver while it runs.
+#
+#   python -m backend.db.fees && python -m backend.analytics.yields
+
+import os, sys, time, asyncio, argparse
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, Optional
+
+ROOT = Path("/Users/axel/Dev/open-source/uniswap-lp-analytics")
+
+FEE_TIER_SCALE = 1_000_000
+CHUNK_POOLS = 200
+
+def fee_fraction(fee_tier: int) -> float:
+    """pools.fee_tier_bps -> fee as a fraction of the swapped amount."""
+    return fee_tier / FEE_TIER_SCALE
+
+def approx_fee(amount: Optional[Decimal], fee_tier: int) -> Optional[Decimal]:
+    """Fee paid on a swapped amount (token units), as stored in approx_fee_token0/1."""
+    if amount is None: return None
+    return amount * Decimal(fee_tier) / Decimal(FEE_TIER_SCALE)
+
+def _recompute_sql(table: str) -> str:
+    return f"""
+      update {table} a set
+        approx_fee_token0 = a.volume_token0 * p.fee_tier_bps / {FEE_TIER_SCALE},
+        approx_fee_token1 = a.volume_token1 * p.fee_tier_bps / {FEE_TIER_SCALE}
+      from pools p
+      where p.id = a.pool_id and a.pool_id = any(:pool_ids)
+    """
+
+def _recompute_month(table: str, month: str, fee_map: Dict[str, int]) -> int:
+    """Rewrite one archived month with fees recomputed from its volumes; -> rows."""
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from backend.db import archive
+
+    t = pq.read_table(archive.month_path(table, month))
+    ids = t["pool_id"].combine_chunks().dictionary_encode()
+    tiers = np.array([fee_map.get(p, np.nan) for p in ids.dictionary.to_pylist()], dtype=np.float64)
+    frac = fee_fraction(tiers)[ids.indices.to_numpy(zero_copy_only=False)] if len(tiers) else np.zeros(0)
+    for vol, fee in (("volume_token0", "approx_fee_token0"), ("volume_token1", "approx_fee_token1")):
+        v = t[vol].to_numpy(zero_copy_only=False)
+        old = t[fee].to_numpy(zero_copy_only=False)
+        new = np.where(np.isnan(frac), old, v * frac)
+        t = t.set_column(t.schema.get_field_index(fee), fee, pa.array(new, type=pa.float64(), mask=np.isnan(new)))
+    archive._write(table, month, t)
+    return t.num_rows
+
+async def main():
+    from dotenv import load_dotenv
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from backend.db import archive, series_cache
+    from backend.db.notify import notify_changes
+    from backend.db.sync_state import record_run, utcnow
+
+    ap = argparse.ArgumentParser(description="Recompute approx fees from volumes in Postgres, the archive and the series cache")
+    ap.add_argument("--chunk-pools", type=int, default=CHUNK_POOLS, help="Pools updated per transaction")
+    args = ap.parse_args()
+
+    load_dotenv(ROOT / ".env", override=True)
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        print("ERROR: DATABASE_URL is not set", file=sys.stderr); sys.exit(2)
+
+    engine = create_async_engine(db_url, future=True)
+    started = utcnow()
+    t0 = time.perf_counter()
+    rows = 0
+    try:
+        async with engine.connect() as conn:
+            fee_map = {r[0]: int(r[1]) for r in (await conn.execute(text("select id, fee_tier_bps from pools order by id"))).all()}
+        ids = list(fee_map)
+        async with engine.begin() as conn:
+            await conn.execute(text("delete from pool_yield"))
+            await notify_changes(conn, "pool_yield", [])
+        for i in range(0, len(ids), args.chunk_pools):
+            chunk = ids[i:i + args.chunk_pools]
+            async with engine.begin() as conn:
+                for table in ("pool_day_data", "pool_hour_data"):
+                    rows += (await conn.execute(text(_recompute_sql(table)), {"pool_ids": chunk})).rowcount
+                    await notify_changes(conn, table, chunk)
+        print(f"Postgres: {rows} rows in {time.perf_counter() - t0:.1f}s")
+
+        archive.refresh()
+        for lo, hi, path in archive.months("pool_hour_data"):
+            n = await asyncio.to_thread(_recompute_month, "pool_hour_data", path.stem, fee_map)
+            async with engine.begin() as conn:
+                await notify_changes(conn, "archive", [], lo, hi - 1)
+            rows += n
+            print(f"pool_hour_data {path.stem}: {n} rows -> {path}")
+
+        cached = series_cache.cached_pools()
+        for i in range(0, len(cached), args.chunk_pools):
+            async with engine.begin() as conn:
+                await series_cache.build(conn, cached[i:i + args.chunk_pools])
+                await notify_changes(conn, "series_cache", cached[i:i + args.chunk_pools])
+        print(f"Series cache: rebuilt {len(cached)} pools")
+
+        async with engine.begin() as conn:
+            await record_run(conn, "recompute_approx_fees", started, pools=len(ids), rows=rows)
+    except Exception as e:
+        async with engine.begin() as conn:
+            await record_run(conn, "recompute_approx_fees", started, status="error", rows=rows, error=repr(e))
+        raise
+    finally:
+        await engine.dispose()
+    print(f"Recomputed approx fees in {time.perf_counter() - t0:.1f}s; pool_yield is empty until `python -m backend.analytics.yields` runs")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+# Change notifications: ingestion writers publish what they touched, the API LISTENs and
+# invalidates exactly the affected cache entries. NOTIFY is transactional, so listeners
+# only hear about rows once the writer's transaction has committed.
+
+import json, time
+from typing import Iterable, List, Optional
+from sqlalchemy import text
+
+CHANNEL = "lp_changes"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more; stay well below it.
+MAX_PAYLOAD_BYTES = 7500
+
+SQL_NOTIFY = text("select pg_notify(:channel, :payload)")
+
+def change_payloads(table: str, pool_ids: Iterable[str], lo: Optional[int] = None, hi: Optional[int] = None) -> List[str]:
+    """
+    JSON payloads {"table", "pools", "lo", "hi", "at"} split so each fits in one NOTIFY.
+    lo/hi bound the changed buckets (day id, hour id) when known; "at" is the publish time in ms.
+    """
+    at = int(time.time() * 1000)
+    base = {"table": table, "lo": lo, "hi": hi, "at": at}
+    empty = len(json.dumps({**base, "pools": []}, separators=(",", ":")))
+    out: List[str] = []
+    batch: List[str] = []
+    size = empty
+    for pid in pool_ids:
+        extra = len(pid) + 3
+        if batch and size + extra > MAX_PAYLOAD_BYTES:
+            out.append(json.dumps({**base, "pools": batch}, separators=(",", ":")))
+            batch, size = [], empty
+        batch.append(pid)
+        size += extra
+    if batch or not out:
+        out.append(json.dumps({**base, "pools": batch}, separators=(",", ":")))
+    return out
+
+async def notify_changes(conn, table: str, pool_ids: Iterable[str], lo: Optional[int] = None, hi: Optional[int] = None):
+    for payload in change_payloads(table, pool_ids, lo, hi):
+        await conn.execute(SQL_NOTIFY, {"channel": CHANNEL, "payload": payload})
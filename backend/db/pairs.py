@@ -0,0 +1,6 @@
+# Canonical, orientation-independent key for a token pair: the two token ids (lowercase
+# addresses) in ascending order joined by "/". Stored as pools.pair_key and indexed.
+
+def pair_key(a: str, b: str) -> str:
+    a, b = a.lower(), b.lower()
+    return f"{a}/{b}" if a <= b else f"{b}/{a}"
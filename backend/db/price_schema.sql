@@ -0,0 +1,24 @@
+create table if not exists pool_price_hour (
+  pool_id text not null references pools(id) on delete cascade,
+  hour_start_unix int not null,
+  sqrt_price_x96 numeric,
+  price0 numeric,
+  price1 numeric,
+  liquidity numeric,
+  updated_at bigint,
+  primary key (pool_id, hour_start_unix)
+);
+
+-- OHLC rollups of pool_price_hour (backend/db/candles.py). resolution in hours (4, 24, 168),
+-- bucket = first hour id of the candle; weekly candles start on Monday 00:00 UTC.
+create table if not exists pool_price_candle (
+  pool_id text not null references pools(id) on delete cascade,
+  resolution smallint not null,
+  bucket int not null,
+  open0 numeric, high0 numeric, low0 numeric, close0 numeric,
+  open1 numeric, high1 numeric, low1 numeric, close1 numeric,
+  liquidity numeric,
+  hours smallint not null,
+  updated_at bigint,
+  primary key (pool_id, resolution, bucket)
+);
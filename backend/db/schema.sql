@@ -18,9 +18,21 @@ create table if not exists pools (
   token1_id text not null references tokens(id) on delete restrict,
   fee_tier_bps int not null,
   tick_spacing int not null,
-  created_at_ts bigint not null
+  created_at_ts bigint not null,
+  pair_key text
 );
 
 create index if not exists idx_pools_chain_ver on pools(chain_id, version);
 create index if not exists idx_pools_tokens on pools(token0_id, token1_id);
 create index if not exists idx_pools_created on pools(created_at_ts desc);
+
+-- /tokens and /pools paginate from the API's in-memory index; these keyset indexes backed no query
+drop index if exists idx_tokens_symbol_addr;
+drop index if exists idx_pools_created_id;
+drop index if exists idx_pools_fee_id;
+
+-- Canonical pair key (backend/db/pairs.py): token ids in ascending order, "a/b", set by
+-- load_pools_to_db so pair lookups are one index probe whatever the pool's token order.
+alter table pools add column if not exists pair_key text;
+update pools set pair_key = least(token0_id, token1_id) || '/' || greatest(token0_id, token1_id) where pair_key is null;
+create index if not exists idx_pools_pair_key on pools(pair_key, version);
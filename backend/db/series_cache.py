@@ -0,0 +1,383 @@
+# Memory-mapped hourly series per pool, for the API's hot per-pool reads (comments in English).
+#
+# One file per cached pool under SERIES_CACHE_DIR: a 64-byte header, then one contiguous column
+# per field, each `capacity` hours long from `start` and 64-byte aligned (dense; flags say which
+# tables had a row that hour):
+#   volume_token0, volume_token1, approx_fee_token0, approx_fee_token1   pool_hour_data (nulls as 0)
+#   price0, price1, liquidity                                            pool_price_hour (NaN if null)
+#   swap_count, flags (HAS_AGG | HAS_PRICE)
+# API workers map the files read-only and answer range reads with zero-copy column slices; the OS
+# page cache shares them between processes. Writers fill hours up to `capacity` in place between
+# two increments of `seq`; readers retry a read that overlapped a write, and fall back to SQL if it
+# keeps happening. Hours before `start` or past `capacity` rewrite the file (with CHUNK_HOURS of
+# headroom) and rename it over the old one. Writers serialize on <pool_id>.lock, which is never
+# replaced.
+#
+# Ingestion refreshes the hours it committed for pools that have a file (refresh()), and
+# publishes "series_cache" so the API drops responses built before the update. Which pools
+# are cached is decided here:
+#   python -m backend.db.series_cache --top 200          # most active pools over the last 30 days
+#   python -m backend.db.series_cache --pools 0xa,0xb
+#   python -m backend.db.series_cache --rebuild          # every cached pool, from Postgres + archive
+#   python -m backend.db.series_cache --drop 0xa
+
+import os, sys, time, fcntl, asyncio, argparse, tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import text, bindparam, Integer, String
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from backend.db import archive
+
+ROOT = Path("/Users/axel/Dev/open-source/uniswap-lp-analytics")
+
+HEADER = np.dtype([("magic", "S4"), ("version", "<u4"), ("start", "<i8"), ("count", "<i8"), ("seq", "<u8"), ("capacity", "<i8")])
+HEADER_BYTES = 64
+ALIGN = 64
+MAGIC, VERSION = b"LPSC", 2
+AGG_FIELDS = ("volume_token0", "volume_token1", "approx_fee_token0", "approx_fee_token1", "swap_count")
+PRICE_FIELDS = ("price0", "price1", "liquidity")
+COLUMNS = (
+    ("volume_token0", np.dtype("<f8")), ("volume_token1", np.dtype("<f8")),
+    ("approx_fee_token0", np.dtype("<f8")), ("approx_fee_token1", np.dtype("<f8")),
+    ("price0", np.dtype("<f8")), ("price1", np.dtype("<f8")), ("liquidity", np.dtype("<f8")),
+    ("swap_count", np.dtype("<i4")), ("flags", np.dtype("u1")),
+)
+HAS_AGG, HAS_PRICE = 1, 2
+CHUNK_HOURS = 24 * 30
+READ_RETRIES = 3
+
+SQL_CACHE_ROWS = text("""
+  select coalesce(p.pool_id, d.pool_id) as pool_id, coalesce(p.h, d.h) as h,
+         d.h is not null as has_agg, p.h is not null as has_price,
+         d.volume_token0, d.volume_token1, d.approx_fee_token0, d.approx_fee_token1, d.swap_count,
+         p.price0, p.price1, p.liquidity
+  from (
+    select pool_id, hour_start_unix as h, price0::float8 as price0, price1::float8 as price1, liquidity::float8 as liquidity
+    from pool_price_hour
+    where pool_id = any(:pool_ids) and hour_start_unix >= :th_price and hour_start_unix <= :until
+  ) p
+  full join (
+    select pool_id, hour_start_unix as h,
+           coalesce(volume_token0,0)::float8 as volume_token0, coalesce(volume_token1,0)::float8 as volume_token1,
+           coalesce(approx_fee_token0,0)::float8 as approx_fee_token0, coalesce(approx_fee_token1,0)::float8 as approx_fee_token1,
+           coalesce(swap_count,0) as swap_count
+    from pool_hour_data
+    where pool_id = any(:pool_ids) and hour_start_unix >= :th_fee and hour_start_unix <= :until
+  ) d on d.pool_id = p.pool_id and d.h = p.h
+  order by 1, 2
+""").bindparams(bindparam("pool_ids", type_=ARRAY(String)), bindparam("th_price", type_=Integer),
+              bindparam("th_fee", type_=Integer), bindparam("until", type_=Integer))
+
+def cache_dir() -> Path:
+    return Path(os.environ.get("SERIES_CACHE_DIR") or ROOT / "cache" / "series")
+
+def pool_path(pool_id: str) -> Path:
+    return cache_dir() / f"{pool_id}.bin"
+
+def cached_pools() -> List[str]:
+    d = cache_dir()
+    return sorted(p.stem for p in d.glob("*.bin")) if d.is_dir() else []
+
+@contextmanager
+def _pool_lock(pool_id: str):
+    """Exclusive per-pool writer lock on a file that is never renamed over."""
+    path = pool_path(pool_id).with_suffix(".lock")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+def _offsets(capacity: int) -> List[int]:
+    """Byte offset of each column, then the file size."""
+    out = [HEADER_BYTES]
+    for _, dt in COLUMNS:
+        out.append(out[-1] + -(-capacity * dt.itemsize // ALIGN) * ALIGN)
+    return out
+
+def _views(buf: np.ndarray) -> Optional[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+    """Header and column views of a mapped file; None for another format version (--rebuild)."""
+    hdr = buf[:HEADER.itemsize].view(HEADER)
+    if hdr["magic"][0] != MAGIC or hdr["version"][0] != VERSION:
+        return None
+    cap = int(hdr["capacity"][0])
+    off = _offsets(cap)
+    return hdr, {f: buf[off[k]:off[k] + cap * dt.itemsize].view(dt) for k, (f, dt) in enumerate(COLUMNS)}
+
+def _blank(hours: int) -> Dict[str, np.ndarray]:
+    return {f: np.zeros(hours, dt) for f, dt in COLUMNS}
+
+def _capacity(hours: int) -> int:
+    return -(-hours // CHUNK_HOURS) * CHUNK_HOURS + CHUNK_HOURS
+
+# ---------- reading ----------
+class SeriesCache:
+    """Read side: each pool's file is mapped once per process and re-mapped when it grows or is replaced."""
+
+    def __init__(self):
+        # pool_id -> (inode, size, header view, column views)
+        self._maps: Dict[str, Tuple[int, int, np.ndarray, Dict[str, np.ndarray]]] = {}
+
+    def _open(self, pool_id: str) -> Optional[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+        path = pool_path(pool_id)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._maps.pop(pool_id, None)
+            return None
+        m = self._maps.get(pool_id)
+        if m is None or m[0] != st.st_ino or m[1] != st.st_size:
+            v = _views(np.memmap(path, dtype=np.uint8, mode="r"))
+            if v is None:
+                return None
+            m = (st.st_ino, st.st_size, *v)
+            self._maps[pool_id] = m
+        return m[2], m[3]
+
+    def _read(self, pool_id: str, fn):
+        """fn(start, columns) on a consistent snapshot; it must return copies. None if not cached or busy."""
+        for _ in range(READ_RETRIES):
+            v = self._open(pool_id)
+            if v is None:
+                return None
+            hdr, cols = v
+            seq = int(hdr["seq"][0])
+            count = int(hdr["count"][0])
+            if seq & 1 or count > len(cols["flags"]):
+                continue
+            out = fn(int(hdr["start"][0]), {f: c[:count] for f, c in cols.items()})
+            if int(hdr["seq"][0]) == seq:
+                return out
+        return None
+
+    def hours(self, pool_id: str, th: int, limit: int, n: int = 1) -> Optional[Dict[str, np.ndarray]]:
+        """
+        pool_hour_data rows from hour th (n = 1) or their n-hour bucket sums, newest first, as
+        columns "bucket" + AGG_FIELDS; None when the pool is not cached.
+        """
+        def fn(start: int, rec: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+            lo = min(max(th - start, 0), len(rec["flags"]))
+            idx = np.flatnonzero(rec["flags"][lo:] & HAS_AGG) + lo
+            if n == 1 or not len(idx):
+                idx = idx[::-1][:limit]
+                out = {f: rec[f][idx] for f in AGG_FIELDS}
+                out["bucket"] = idx + start
+                return out
+            keys = (idx + start) // n * n
+            first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])[-limit:]
+            idx, first = idx[first[0]:], first - first[0]
+            out = {f: np.add.reduceat(rec[f][idx].astype(np.float64 if f != "swap_count" else np.int64), first)[::-1] for f in AGG_FIELDS}
+            out["bucket"] = keys[-len(idx):][first][::-1]
+            return out
+        return self._read(pool_id, fn)
+
+    def prices(self, pool_id: str, price: str, since: int, until: int, limit: int) -> Optional[Dict[str, np.ndarray]]:
+        """Hours in [since, until] with a price, newest first: columns "bucket", price, "liquidity"."""
+        def fn(start: int, rec: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+            lo = min(max(since - start, 0), len(rec["flags"]))
+            hi = min(max(until - start + 1, lo), len(rec["flags"]))
+            p, liq = rec[price][lo:hi], rec["liquidity"][lo:hi]
+            idx = np.flatnonzero((rec["flags"][lo:hi] & HAS_PRICE).astype(bool) & ~np.isnan(p))[::-1][:limit]
+            return {"bucket": idx + lo + start, price: p[idx], "liquidity": liq[idx]}
+        return self._read(pool_id, fn)
+
+# ---------- writing ----------
+def _fill(rec: Dict[str, np.ndarray], start: int, rows: Sequence[Any]):
+    """Set the hours of SQL_CACHE_ROWS rows (one pool)."""
+    agg = [r for r in rows if r["has_agg"]]
+    if agg:
+        i = np.array([r["h"] for r in agg], dtype=np.int64) - start
+        for f in AGG_FIELDS:
+            rec[f][i] = [r[f] for r in agg]
+        rec["flags"][i] |= HAS_AGG
+    px = [r for r in rows if r["has_price"]]
+    if px:
+        i = np.array([r["h"] for r in px], dtype=np.int64) - start
+        for f in PRICE_FIELDS:
+            rec[f][i] = np.array([r[f] for r in px], dtype=np.float64)
+        rec["flags"][i] |= HAS_PRICE
+
+def _write_file(path: Path, start: int, rec: Dict[str, np.ndarray]):
+    """Whole file: unique temp file, fsync, rename over the old one (readers re-map on the new inode)."""
+    count = len(rec["flags"])
+    cap = _capacity(count)
+    off = _offsets(cap)
+    hdr = np.zeros(1, HEADER)
+    hdr[0] = (MAGIC, VERSION, start, count, 0, cap)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(hdr.tobytes())
+            for k, (name, _) in enumerate(COLUMNS):
+                f.seek(off[k])
+                f.write(rec[name].tobytes())
+            f.truncate(off[-1])
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+def patch(pool_id: str, lo: int, hi: int, rows: Sequence[Any]):
+    """Replace hours lo..hi of a cached pool with rows (SQL_CACHE_ROWS for that span)."""
+    path = pool_path(pool_id)
+    with _pool_lock(pool_id):
+        if not path.exists():
+            return
+        buf = np.memmap(path, dtype=np.uint8, mode="r+")
+        v = _views(buf)
+        if v is None:
+            return
+        hdr, cols = v
+        start, count, cap = int(hdr["start"][0]), int(hdr["count"][0]), int(hdr["capacity"][0])
+        need = hi - start + 1
+        if lo < start or need > cap:
+            first = min(lo, start)
+            rec = _blank(max(start + count, hi + 1) - first)
+            for f, c in cols.items():
+                rec[f][start - first:start - first + count] = c[:count]
+            del buf, hdr, cols
+            for c in rec.values():
+                c[lo - first:hi - first + 1] = 0
+            _fill(rec, first, rows)
+            _write_file(path, first, rec)
+            return
+        hdr["seq"] += 1
+        for c in cols.values():
+            c[lo - start:need] = 0
+        _fill(cols, start, rows)
+        hdr["count"] = max(count, need)
+        hdr["seq"] += 1
+        buf.flush()
+
+async def refresh(conn, spans: Dict[str, Tuple[int, int]]):
+    """
+    Re-read hours lo..hi (from the archive cutoff on) of every cached pool in spans ({pool_id: (lo, hi)})
+    from Postgres into its file, then NOTIFY "series_cache". Call after the data commits.
+    """
+    from backend.db.notify import notify_changes
+    # Hours below the archive cutoff are served from the archive (late rows there wait for the archiver)
+    cut = max(archive.cutoff(t) or 0 for t in archive.TABLES)
+    spans = {pid: (max(a, cut), b) for pid, (a, b) in spans.items() if b >= cut and pool_path(pid).exists()}
+    if not spans:
+        return
+    lo, hi = min(s[0] for s in spans.values()), max(s[1] for s in spans.values())
+    rows = (await conn.execute(SQL_CACHE_ROWS, {"pool_ids": list(spans), "th_price": lo, "th_fee": lo, "until": hi})).mappings().all()
+    by_pool: Dict[str, List[Any]] = {}
+    for r in rows:
+        by_pool.setdefault(r["pool_id"], []).append(r)
+    for pid, (a, b) in spans.items():
+        patch(pid, a, b, [r for r in by_pool.get(pid, []) if a <= r["h"] <= b])
+    await notify_changes(conn, "series_cache", list(spans), lo, hi)
+
+def _cold_rows(pool_ids: Sequence[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """SQL_CACHE_ROWS-shaped rows for the archived hours of pool_ids (backend/db/archive.py)."""
+    out: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    blank = {"has_agg": False, "has_price": False, **{f: None for f in AGG_FIELDS + PRICE_FIELDS}}
+    for table, flag, fields in (("pool_hour_data", "has_agg", AGG_FIELDS), ("pool_price_hour", "has_price", PRICE_FIELDS)):
+        cut = archive.cutoff(table)
+        if cut is None:
+            continue
+        t = archive.read(table, pool_ids, 0, cut - 1, ["pool_id", "hour_start_unix", *fields])
+        cols = [c.to_pylist() for c in t.columns]
+        for pid, h, *vals in zip(*cols):
+            r = out.setdefault((pid, h), {**blank, "pool_id": pid, "h": h})
+            r[flag] = True
+            r.update(zip(fields, vals))
+    by_pool: Dict[str, List[Dict[str, Any]]] = {}
+    for r in out.values():
+        if r["has_agg"]:
+            r.update({f: r[f] or 0 for f in AGG_FIELDS})
+        by_pool.setdefault(r["pool_id"], []).append(r)
+    return by_pool
+
+async def build(conn, pool_ids: Sequence[str]) -> int:
+    """(Re)write the files of pool_ids from the full history (archive + Postgres); returns hours written."""
+    rows = (await conn.execute(SQL_CACHE_ROWS, {
+        "pool_ids": list(pool_ids), "until": 2 ** 31 - 1,
+        "th_price": archive.cutoff("pool_price_hour") or 0, "th_fee": archive.cutoff("pool_hour_data") or 0,
+    })).mappings().all()
+    by_pool = await asyncio.to_thread(_cold_rows, pool_ids)
+    for r in rows:
+        by_pool.setdefault(r["pool_id"], []).append(r)
+    n = 0
+    for pid in pool_ids:
+        prow = by_pool.get(pid)
+        if not prow:
+            pool_path(pid).unlink(missing_ok=True)
+            continue
+        hs = [r["h"] for r in prow]
+        start = min(hs)
+        rec = _blank(max(hs) - start + 1)
+        _fill(rec, start, prow)
+        with _pool_lock(pid):
+            _write_file(pool_path(pid), start, rec)
+        n += len(rec["flags"])
+    return n
+
+async def main():
+    from dotenv import load_dotenv
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from backend.db.notify import notify_changes
+    from backend.db.sync_state import record_run, utcnow
+
+    ap = argparse.ArgumentParser(description="Build the memory-mapped per-pool series cache")
+    g = ap.add_mutually_exclusive_group(required=True)
+    g.add_argument("--top", type=int, help="Cache the N pools with the most hourly rows in the last 30 days")
+    g.add_argument("--pools", help="Comma-separated pool ids to cache")
+    g.add_argument("--rebuild", action="store_true", help="Rebuild every cached pool")
+    g.add_argument("--drop", help="Comma-separated pool ids to remove from the cache")
+    ap.add_argument("--chunk-pools", type=int, default=50, help="Pools loaded per query")
+    args = ap.parse_args()
+
+    load_dotenv(ROOT / ".env", override=True)
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        print("ERROR: DATABASE_URL is not set", file=sys.stderr); sys.exit(2)
+
+    engine = create_async_engine(db_url, future=True)
+    started = utcnow()
+    t0 = time.perf_counter()
+    try:
+        if args.drop:
+            ids = [p.strip() for p in args.drop.split(",") if p.strip()]
+            for pid in ids:
+                pool_path(pid).unlink(missing_ok=True)
+            async with engine.begin() as conn:
+                await notify_changes(conn, "series_cache", ids)
+            print(f"Dropped {len(ids)} pools")
+            return
+        async with engine.connect() as conn:
+            if args.top:
+                ids = [r[0] for r in (await conn.execute(text("""
+                  select pool_id from pool_hour_data
+                  where hour_start_unix >= :th
+                  group by pool_id
+                  order by count(*) desc, pool_id
+                  limit :limit
+                """), {"th": int(time.time() // 3600) - 24 * 30, "limit": args.top})).all()]
+            elif args.pools:
+                ids = [p.strip() for p in args.pools.split(",") if p.strip()]
+            else:
+                ids = cached_pools()
+        hours = 0
+        for i in range(0, len(ids), args.chunk_pools):
+            async with engine.begin() as conn:
+                hours += await build(conn, ids[i:i + args.chunk_pools])
+                await notify_changes(conn, "series_cache", ids[i:i + args.chunk_pools])
+        async with engine.begin() as conn:
+            await record_run(conn, "build_series_cache", started, pools=len(ids), rows=hours)
+    except Exception as e:
+        async with engine.begin() as conn:
+            await record_run(conn, "build_series_cache", started, status="error", error=repr(e))
+        raise
+    finally:
+        await engine.dispose()
+    print(f"Cached {len(ids)} pools ({hours} hours) in {cache_dir()} in {time.perf_counter() - t0:.1f}s")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,41 @@
+-- Sync status snapshot, maintained by ingestion (backend/db/sync_state.py) and read by /sync/status
+
+create table if not exists sync_table_state (
+  table_name text primary key,
+  row_count bigint not null default 0,
+  max_bucket bigint,
+  updated_at timestamptz not null default now()
+);
+
+create table if not exists sync_pool_state (
+  pool_id text primary key references pools(id) on delete cascade,
+  day_rows int not null default 0,
+  max_day int,
+  hour_rows int not null default 0,
+  max_hour int,
+  price_rows int not null default 0,
+  max_price_hour int,
+  updated_at timestamptz not null default now()
+);
+create index if not exists idx_sync_pool_max_day on sync_pool_state(max_day);
+create index if not exists idx_sync_pool_max_hour on sync_pool_state(max_hour);
+
+create table if not exists sync_runs (
+  job text primary key,
+  started_at timestamptz not null,
+  finished_at timestamptz,
+  status text not null,
+  pools int not null default 0,
+  rows_upserted bigint not null default 0,
+  error text
+);
+
+-- Single row, written by the API's subgraph _meta poller
+create table if not exists sync_subgraph (
+  id smallint primary key default 1 check (id = 1),
+  endpoint text,
+  block_number bigint,
+  has_indexing_errors boolean,
+  v4_start_block bigint,
+  checked_at timestamptz not null default now()
+);
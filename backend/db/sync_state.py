@@ -0,0 +1,117 @@
+# Sync status snapshot (backend/db/sync_schema.sql). Writers call these inside their own
+# transaction so the snapshot commits together with the data it describes.
+# Per-pool counts come from the (pool_id, bucket) unique indexes, table totals are rolled up
+# from sync_pool_state, so nothing here scans a time-series table.
+#
+# Rebuild from scratch (e.g. after creating the tables on an existing DB):
+#   python -m backend.db.sync_state
+
+import os, asyncio
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+ROOT = Path("/Users/axel/Dev/open-source/uniswap-lp-analytics")
+
+# table -> (rows column, max column in sync_pool_state, bucket column in the table)
+POOL_STATE_COLUMNS = {
+    "pool_day_data": ("day_rows", "max_day", "date"),
+    "pool_hour_data": ("hour_rows", "max_hour", "hour_start_unix"),
+    "pool_price_hour": ("price_rows", "max_price_hour", "hour_start_unix"),
+}
+
+def _pool_state_sql(table: str):
+    rows_col, max_col, bucket = POOL_STATE_COLUMNS[table]
+    return text(f"""
+    insert into sync_pool_state (pool_id, {rows_col}, {max_col}, updated_at)
+    select :pool_id, count(*), max({bucket}), now() from {table} where pool_id = :pool_id
+    on conflict (pool_id) do update set
+      {rows_col} = excluded.{rows_col},
+      {max_col} = excluded.{max_col},
+      updated_at = now()
+    """)
+
+def _table_state_sql(table: str):
+    if table in POOL_STATE_COLUMNS:
+        rows_col, max_col, _ = POOL_STATE_COLUMNS[table]
+        select = f"select coalesce(sum({rows_col}),0), max({max_col}) from sync_pool_state"
+    else:
+        # pools / tokens: small tables, counted directly
+        select = f"select count(*), null::bigint from {table}"
+    return text(f"""
+    insert into sync_table_state (table_name, row_count, max_bucket, updated_at)
+    select :table, s.*, now() from ({select}) s
+    on conflict (table_name) do update set
+      row_count = excluded.row_count,
+      max_bucket = excluded.max_bucket,
+      updated_at = now()
+    """)
+
+SQL_RECORD_RUN = text("""
+insert into sync_runs (job, started_at, finished_at, status, pools, rows_upserted, error)
+values (:job, :started_at, now(), :status, :pools, :rows, :error)
+on conflict (job) do update set
+  started_at = excluded.started_at,
+  finished_at = excluded.finished_at,
+  status = excluded.status,
+  pools = excluded.pools,
+  rows_upserted = excluded.rows_upserted,
+  error = excluded.error
+""")
+
+SQL_RECORD_SUBGRAPH = text("""
+insert into sync_subgraph (id, endpoint, block_number, has_indexing_errors, v4_start_block, checked_at)
+values (1, :endpoint, :block_number, :has_err, :v4_start_block, now())
+on conflict (id) do update set
+  endpoint = excluded.endpoint,
+  block_number = excluded.block_number,
+  has_indexing_errors = excluded.has_indexing_errors,
+  v4_start_block = excluded.v4_start_block,
+  checked_at = now()
+""")
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+async def update_pool_state(conn, table: str, pool_ids: Iterable[str]):
+    sql = _pool_state_sql(table)
+    for pid in pool_ids:
+        await conn.execute(sql, {"pool_id": pid})
+
+async def update_table_state(conn, *tables: str):
+    for t in tables:
+        await conn.execute(_table_state_sql(t), {"table": t})
+
+async def record_run(conn, job: str, started_at: datetime, status: str = "ok", pools: int = 0, rows: int = 0, error: Optional[str] = None):
+    await conn.execute(SQL_RECORD_RUN, {
+        "job": job, "started_at": started_at, "status": status,
+        "pools": pools, "rows": rows, "error": error[:2000] if error else None,
+    })
+
+async def record_subgraph(conn, endpoint: Optional[str], block_number: Optional[int], has_err: Optional[bool], v4_start_block: Optional[int]):
+    await conn.execute(SQL_RECORD_SUBGRAPH, {
+        "endpoint": endpoint, "block_number": block_number, "has_err": has_err, "v4_start_block": v4_start_block,
+    })
+
+async def main():
+    load_dotenv(ROOT / ".env", override=True)
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        raise SystemExit("DATABASE_URL is not set in .env")
+
+    engine = create_async_engine(db_url, future=True)
+    started = utcnow()
+    async with engine.begin() as conn:
+        pool_ids = [r[0] for r in (await conn.execute(text("select id from pools"))).all()]
+        for table in POOL_STATE_COLUMNS:
+            await update_pool_state(conn, table, pool_ids)
+        await update_table_state(conn, "tokens", "pools", *POOL_STATE_COLUMNS)
+        await record_run(conn, "rebuild_sync_state", started, pools=len(pool_ids))
+    await engine.dispose()
+    print(f"Rebuilt sync state for {len(pool_ids)} pools")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,21 @@
+-- Rolling fee APR / TVL per pool and window, rewritten by backend/analytics/yields.py.
+-- tvl_token1 / fees_token1 are in the pool's token1; fee_tvl and fee_apr are unit-free.
+create table if not exists pool_yield (
+  pool_id text not null references pools(id) on delete cascade,
+  window_hours int not null,
+  end_hour int not null,
+  hours int not null,
+  tvl_token1 double precision not null,
+  avg_tvl_token1 double precision not null,
+  fees_token1 double precision not null,
+  fee_tvl double precision not null,
+  fee_apr double precision not null,
+  updated_at timestamptz not null default now(),
+  primary key (pool_id, window_hours)
+);
+
+-- /pools/top_yield keyset orderings
+create index if not exists idx_pool_yield_apr on pool_yield(window_hours, fee_apr desc, pool_id);
+create index if not exists idx_pool_yield_fee_tvl on pool_yield(window_hours, fee_tvl desc, pool_id);
+create index if not exists idx_pool_yield_tvl on pool_yield(window_hours, tvl_token1 desc, pool_id);
+create index if not exists idx_pool_yield_fees on pool_yield(window_hours, fees_token1 desc, pool_id);
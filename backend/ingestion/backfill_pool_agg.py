@@ -3,7 +3,7 @@
 
 import os, sys, argparse, asyncio
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from decimal import Decimal
 from dotenv import load_dotenv
 from gql import Client, gql
@@ -11,6 +11,11 @@ from gql.transport.httpx import HTTPXAsyncTransport
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy import text
 
+from backend.db.notify import notify_changes
+from backend.db import series_cache
+from backend.db.fees import approx_fee
+from backend.db.sync_state import update_pool_state, update_table_state, record_run, utcnow
+
 ROOT = Path("/Users/axel/Dev/open-source/uniswap-lp-analytics")
 
 Q_DAY_ONE = gql("""
@@ -51,10 +56,6 @@ def to_dec(x: Optional[str]) -> Optional[Decimal]:
     if x is None: return None
     return Decimal(str(x))
 
-def approx_fee(amount: Optional[Decimal], fee_bps: int) -> Optional[Decimal]:
-    if amount is None: return None
-    return (amount * Decimal(fee_bps) / Decimal(10000))
-
 async def fetch_all_for_pool(session: Client, pool_id: str, page_size: int):
     day_rows: List[Dict[str, Any]] = []
     hour_rows: List[Dict[str, Any]] = []
@@ -99,6 +100,8 @@ async def main():
         print("ERROR: DATABASE_URL is not set", file=sys.stderr); sys.exit(2)
 
     engine = create_async_engine(db_url, future=True)
+    job = f"backfill_pool_agg_v{args.version}"
+    started = utcnow()
 
     async with engine.begin() as conn:
         rows = (await conn.execute(text("select id, fee_tier_bps from pools where version = :v order by created_at_ts desc"), {"v": args.version})).mappings().all()
@@ -134,53 +137,73 @@ async def main():
     """)
 
     total_day = total_hour = 0
-
-    async with client as session:
+    # pool -> (first, last) hour written, for the series cache once the data has committed
+    hour_spans: Dict[str, Tuple[int, int]] = {}
+
+    try:
+        async with client as session:
+            async with engine.begin() as conn:
+                for i, pid in enumerate(pool_ids, 1):
+                    drows, hrows = await fetch_all_for_pool(session, pid, args.page_size)
+
+                    # Map and upsert day rows
+                    if drows:
+                        payload = []
+                        for r in drows:
+                            fee = fee_map.get(pid, int(r["pool"]["feeTierBps"]))
+                            v0 = to_dec(r.get("volumeToken0"))
+                            v1 = to_dec(r.get("volumeToken1"))
+                            payload.append({
+                                "id": r["id"],
+                                "pool_id": pid,
+                                "date": int(r["date"]),
+                                "v0": v0, "v1": v1,
+                                "f0": approx_fee(v0, fee),
+                                "f1": approx_fee(v1, fee),
+                                "sc": int(r.get("swapCount") or 0),
+                            })
+                        await conn.execute(up_day, payload)
+                        dates = [p["date"] for p in payload]
+                        await notify_changes(conn, "pool_day_data", [pid], min(dates), max(dates))
+                        total_day += len(payload)
+
+                    # Map and upsert hour rows
+                    if hrows:
+                        payload = []
+                        for r in hrows:
+                            fee = fee_map.get(pid, int(r["pool"]["feeTierBps"]))
+                            v0 = to_dec(r.get("volumeToken0"))
+                            v1 = to_dec(r.get("volumeToken1"))
+                            payload.append({
+                                "id": r["id"],
+                                "pool_id": pid,
+                                "hs": int(r["hourStartUnix"]),
+                                "v0": v0, "v1": v1,
+                                "f0": approx_fee(v0, fee),
+                                "f1": approx_fee(v1, fee),
+                                "sc": int(r.get("swapCount") or 0),
+                            })
+                        await conn.execute(up_hour, payload)
+                        hours = [p["hs"] for p in payload]
+                        await notify_changes(conn, "pool_hour_data", [pid], min(hours), max(hours))
+                        hour_spans[pid] = (min(hours), max(hours))
+                        total_hour += len(payload)
+
+                    # Small progress line
+                    print(f"[{i}/{len(pool_ids)}] pool {pid} -> days={len(drows)}, hours={len(hrows)}")
+
+                # Snapshot for /sync/status, committed with the data
+                await update_pool_state(conn, "pool_day_data", pool_ids)
+                await update_pool_state(conn, "pool_hour_data", pool_ids)
+                await update_table_state(conn, "pool_day_data", "pool_hour_data")
+                await record_run(conn, job, started, pools=len(pool_ids), rows=total_day + total_hour)
+    except Exception as e:
         async with engine.begin() as conn:
-            for i, pid in enumerate(pool_ids, 1):
-                drows, hrows = await fetch_all_for_pool(session, pid, args.page_size)
-
-                # Map and upsert day rows
-                if drows:
-                    payload = []
-                    for r in drows:
-                        fee = fee_map.get(pid, int(r["pool"]["feeTierBps"]))
-                        v0 = to_dec(r.get("volumeToken0"))
-                        v1 = to_dec(r.get("volumeToken1"))
-                        payload.append({
-                            "id": r["id"],
-                            "pool_id": pid,
-                            "date": int(r["date"]),
-                            "v0": v0, "v1": v1,
-                            "f0": approx_fee(v0, fee),
-                            "f1": approx_fee(v1, fee),
-                            "sc": int(r.get("swapCount") or 0),
-                        })
-                    await conn.execute(up_day, payload)
-                    total_day += len(payload)
-
-                # Map and upsert hour rows
-                if hrows:
-                    payload = []
-                    for r in hrows:
-                        fee = fee_map.get(pid, int(r["pool"]["feeTierBps"]))
-                        v0 = to_dec(r.get("volumeToken0"))
-                        v1 = to_dec(r.get("volumeToken1"))
-                        payload.append({
-                            "id": r["id"],
-                            "pool_id": pid,
-                            "hs": int(r["hourStartUnix"]),
-                            "v0": v0, "v1": v1,
-                            "f0": approx_fee(v0, fee),
-                            "f1": approx_fee(v1, fee),
-                            "sc": int(r.get("swapCount") or 0),
-                        })
-                    await conn.execute(up_hour, payload)
-                    total_hour += len(payload)
-
-                # Small progress line
-                print(f"[{i}/{len(pool_ids)}] pool {pid} -> days={len(drows)}, hours={len(hrows)}")
+            await record_run(conn, job, started, status="error", pools=len(pool_ids), error=repr(e))
+        raise
 
+    async with engine.begin() as conn:
+        await series_cache.refresh(conn, hour_spans)
     await engine.dispose()
     print(f"Upserted day rows: {total_day}; hour rows: {total_hour}")
 
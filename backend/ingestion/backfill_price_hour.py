@@ -10,6 +10,12 @@ from gql.transport.httpx import HTTPXAsyncTransport
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine
 
+from backend.db.notify import notify_changes
+from backend.db import series_cache
+from backend.db.candles import refresh_candles
+from backend.db.pairs import pair_key
+from backend.db.sync_state import update_pool_state, update_table_state, record_run, utcnow
+
 Q_PRICE_HOUR = gql("""
 query PriceHour($pool: ID!, $first: Int!, $skip: Int!, $since: Int) {
   poolPriceHours(
@@ -38,11 +44,7 @@ where pool_id = :pool_id
 SQL_SELECT_POOLS_BY_PAIR_ADDRS = text("""
 select p.id
 from pools p
-where p.version = :version
-  and (
-    (p.token0_id = :a and p.token1_id = :b) or
-    (p.token0_id = :b and p.token1_id = :a)
-  )
+where p.pair_key = :pair_key and p.version = :version
 """)
 
 SQL_SELECT_POOLS_ALL = text("""
@@ -119,7 +121,7 @@ async def main():
   async with engine.begin() as conn:
     if pairs:
       for a, b in pairs:
-        rows = (await conn.execute(SQL_SELECT_POOLS_BY_PAIR_ADDRS, {"version": args.version, "a": a, "b": b})).all()
+        rows = (await conn.execute(SQL_SELECT_POOLS_BY_PAIR_ADDRS, {"version": args.version, "pair_key": pair_key(a, b)})).all()
         pool_ids.extend([r[0] for r in rows])
     else:
       rows = (await conn.execute(SQL_SELECT_POOLS_ALL, {"version": args.version})).all()
@@ -137,27 +139,43 @@ async def main():
 
   transport = HTTPXAsyncTransport(url=endpoint, timeout=60.0)
   total_rows = 0
-  async with Client(transport=transport, fetch_schema_from_transport=False) as session:
-    for i, pid in enumerate(pool_ids, 1):
-      async with engine.begin() as conn:
-        last_hour = (await conn.execute(SQL_DB_LAST_HOUR, {"pool_id": pid})).scalar_one()
-      rows = await fetch_price_hours(session, pid, args.page_size, last_hour)
-      if rows:
+  job = f"backfill_price_hour_v{args.version}"
+  started = utcnow()
+  try:
+    async with Client(transport=transport, fetch_schema_from_transport=False) as session:
+      for i, pid in enumerate(pool_ids, 1):
         async with engine.begin() as conn:
-          for r in rows:
-            await conn.execute(SQL_UPSERT, {
-              "pool_id": pid,
-              "hour_start_unix": int(r["hourStartUnix"]),
-              "sqrt_price_x96": str(r["sqrtPriceX96"]),
-              "price0": str(r["price0"]),
-              "price1": str(r["price1"]),
-              "liquidity": str(r["liquidity"]),
-              "updated_at": int(r["updatedAt"]),
-            })
-        print(f"[{i}/{len(pool_ids)}] {pid} -> inserted/updated {len(rows)} rows")
-        total_rows += len(rows)
-      else:
-        print(f"[{i}/{len(pool_ids)}] {pid} -> up to date")
+          last_hour = (await conn.execute(SQL_DB_LAST_HOUR, {"pool_id": pid})).scalar_one()
+        rows = await fetch_price_hours(session, pid, args.page_size, last_hour)
+        if rows:
+          async with engine.begin() as conn:
+            for r in rows:
+              await conn.execute(SQL_UPSERT, {
+                "pool_id": pid,
+                "hour_start_unix": int(r["hourStartUnix"]),
+                "sqrt_price_x96": str(r["sqrtPriceX96"]),
+                "price0": str(r["price0"]),
+                "price1": str(r["price1"]),
+                "liquidity": str(r["liquidity"]),
+                "updated_at": int(r["updatedAt"]),
+              })
+            hours = [int(r["hourStartUnix"]) for r in rows]
+            await refresh_candles(conn, [pid], min(hours), max(hours))
+            await notify_changes(conn, "pool_price_hour", [pid], min(hours), max(hours))
+            await update_pool_state(conn, "pool_price_hour", [pid])
+          async with engine.begin() as conn:
+            await series_cache.refresh(conn, {pid: (min(hours), max(hours))})
+          print(f"[{i}/{len(pool_ids)}] {pid} -> inserted/updated {len(rows)} rows")
+          total_rows += len(rows)
+        else:
+          print(f"[{i}/{len(pool_ids)}] {pid} -> up to date")
+    async with engine.begin() as conn:
+      await update_table_state(conn, "pool_price_hour")
+      await record_run(conn, job, started, pools=len(pool_ids), rows=total_rows)
+  except Exception as e:
+    async with engine.begin() as conn:
+      await record_run(conn, job, started, status="error", pools=len(pool_ids), rows=total_rows, error=repr(e))
+    raise
   print(f"Done. Upserted rows: {total_rows}")
 
 if __name__ == "__main__":
@@ -4,7 +4,10 @@ from gql import Client, gql
 from gql.transport.httpx import HTTPXAsyncTransport
 from dotenv import load_dotenv
 
-# Query only the exact pair, orientation A/B
+from backend.db.pairs import pair_key
+
+# Pools keep their tokens sorted by address (v3 token0 < token1, v4 currency0 < currency1), so
+# querying the pair in canonical order (backend/db/pairs.py) finds every pool in one pass.
 Q_PAIR = gql("""
 query PoolsByPair($first: Int!, $skip: Int!, $version: Int!, $a: Bytes!, $b: Bytes!) {
   pools(
@@ -55,7 +58,7 @@ async def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--version", type=int, choices=[3,4], required=True)
     parser.add_argument("--pairs-addrs", type=str, required=True,
-                        help="CSV of pairs as 'addrA/addrB,addrX/addrY'. Both orientations will be queried.")
+                        help="CSV of pairs as 'addrA/addrB,addrX/addrY', in either order.")
     parser.add_argument("--page-size", type=int, default=200)
     parser.add_argument("--timeout", type=float, default=60.0)
     parser.add_argument("--out", type=str, default="")
@@ -74,12 +77,10 @@ async def main():
         pools: List[Dict[str, Any]] = []
 
         for (a, b) in pairs:
-            # orientation A/B
-            items_ab = await fetch_pair(session, args.version, a, b, args.page_size)
-            # orientation B/A
-            items_ba = await fetch_pair(session, args.version, b, a, args.page_size)
+            t0, t1 = pair_key(a, b).split("/")
+            items = await fetch_pair(session, args.version, t0, t1, args.page_size)
 
-            for item in items_ab + items_ba:
+            for item in items:
                 pid = item["id"].lower()
                 if pid in seen:
                     continue
@@ -8,6 +8,10 @@ from dotenv import load_dotenv
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy import text
 
+from backend.db.notify import notify_changes
+from backend.db.pairs import pair_key
+from backend.db.sync_state import update_table_state, record_run, utcnow
+
 ROOT = Path("/Users/axel/Dev/open-source/uniswap-lp-analytics")
 
 def laddr(a: str) -> str:
@@ -34,8 +38,8 @@ async def upsert_tokens(conn, rows: List[Dict[str, Any]]):
 
 async def upsert_pools(conn, rows: List[Dict[str, Any]]):
     sql = text("""
-    insert into pools (id, version, chain_id, token0_id, token1_id, fee_tier_bps, tick_spacing, created_at_ts)
-    values (:id, :version, :chain_id, :token0_id, :token1_id, :fee_tier_bps, :tick_spacing, :created_at_ts)
+    insert into pools (id, version, chain_id, token0_id, token1_id, fee_tier_bps, tick_spacing, created_at_ts, pair_key)
+    values (:id, :version, :chain_id, :token0_id, :token1_id, :fee_tier_bps, :tick_spacing, :created_at_ts, :pair_key)
     on conflict (id) do update set
       version = excluded.version,
       chain_id = excluded.chain_id,
@@ -43,7 +47,8 @@ async def upsert_pools(conn, rows: List[Dict[str, Any]]):
       token1_id = excluded.token1_id,
       fee_tier_bps = excluded.fee_tier_bps,
       tick_spacing = excluded.tick_spacing,
-      created_at_ts = excluded.created_at_ts
+      created_at_ts = excluded.created_at_ts,
+      pair_key = excluded.pair_key
     """)
     if rows:
         await conn.execute(sql, rows)
@@ -89,21 +94,28 @@ async def main():
 
     pool_rows: List[Dict[str, Any]] = []
     for p in pools:
+        t0 = laddr((p.get("token0") or {}).get("id", ""))
+        t1 = laddr((p.get("token1") or {}).get("id", ""))
         pool_rows.append({
             "id": laddr(p["id"]),
             "version": int(p.get("version") or data.get("version") or 0) if str(data.get("version")).isdigit() else int(p.get("version") or 0),
             "chain_id": args.chain_id,
-            "token0_id": laddr((p.get("token0") or {}).get("id", "")),
-            "token1_id": laddr((p.get("token1") or {}).get("id", "")),
+            "token0_id": t0,
+            "token1_id": t1,
             "fee_tier_bps": to_int(p.get("feeTierBps")),
             "tick_spacing": to_int(p.get("tickSpacing")),
             "created_at_ts": to_int(p.get("createdAtTimestamp")),
+            "pair_key": pair_key(t0, t1),
         })
 
     engine = create_async_engine(db_url, future=True)
+    started = utcnow()
     async with engine.begin() as conn:
         await upsert_tokens(conn, list(token_rows.values()))
         await upsert_pools(conn, pool_rows)
+        await notify_changes(conn, "pools", [r["id"] for r in pool_rows])
+        await update_table_state(conn, "tokens", "pools")
+        await record_run(conn, "load_pools_to_db", started, pools=len(pool_rows), rows=len(token_rows) + len(pool_rows))
     await engine.dispose()
     print(f"Upserted tokens: {len(token_rows)}; pools: {len(pool_rows)}")
 
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# API load test: boots backend.api.app:app under uvicorn against DATABASE_URL (a seeded local
+# Postgres, see gen_synthetic.py), replays a weighted mix of the hot routes at fixed concurrency
+# and reports p50/p95/p99 latency and throughput per route. With --baseline it fails (exit 1)
+# when a route is slower than the recorded baseline beyond the tolerance.
+#
+#   python -m backend.tools.bench_api --concurrency 16 --duration 30 --write-baseline bench_baseline.json
+#   python -m backend.tools.bench_api --concurrency 16 --duration 30 --baseline bench_baseline.json
+#
+# Lookbacks, filters and pools are drawn at random per request so the API's TTL caches rarely hit
+# and the SQL paths are what gets measured; --warm repeats one parameter set per route instead.
+
+import os, sys, json, time, random, socket, argparse, asyncio, subprocess
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+import httpx
+from dotenv import load_dotenv
+
+ROOT = Path("/Users/axel/Dev/open-source/uniswap-lp-analytics")
+
+Request = Tuple[str, str, Optional[Dict]]  # method, path with query, json body
+
+def pct(sorted_vals: List[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_vals:
+        return 0.0
+    k = max(0, min(len(sorted_vals) - 1, int(round(p / 100.0 * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[k]
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def qs(params: Dict) -> str:
+    return "&".join(f"{k}={v}" for k, v in params.items() if v is not None)
+
+# ---------- request mix ----------
+def build_mix(pools: List[Dict], symbols: List[str]) -> Dict[str, Tuple[float, Callable[[random.Random], Request]]]:
+    pool_ids = [p["id"] for p in pools]
+    fees = sorted({p["fee_tier_bps"] for p in pools})
+
+    def filters(rng: random.Random) -> Dict:
+        f: Dict = {}
+        r = rng.random()
+        if r < 0.4 and symbols:
+            f["token_symbol"] = rng.choice(symbols)
+        elif r < 0.6:
+            f["version"] = rng.choice([3, 4])
+        elif r < 0.7 and fees:
+            f["fee_min"] = rng.choice(fees)
+        return f
+
+    def pools_list(rng):
+        p = {"page_size": rng.choice([20, 50, 100]), "order_by": rng.choice(["created_at_ts", "fee_tier_bps"]), **filters(rng)}
+        return "GET", f"/pools?{qs(p)}", None
+
+    def top(path: str, window: str):
+        span = 365 if window == "day" else 24 * 30
+        def gen(rng):
+            p = {"window": window, "lookback": rng.randint(1, span), "page_size": rng.choice([20, 50]), **filters(rng)}
+            return "GET", f"{path}?{qs(p)}", None
+        return gen
+
+    def agg(window: str):
+        span = 365 if window == "day" else 24 * 30
+        def gen(rng):
+            p = {"window": window, "lookback": rng.randint(1, span), "limit": 1000 if window == "hour" else 365}
+            return "GET", f"/pools/{rng.choice(pool_ids)}/agg?{qs(p)}", None
+        return gen
+
+    def batch(rng):
+        body = {"pool_ids": rng.sample(pool_ids, min(len(pool_ids), 20)), "window": "day", "lookback": rng.randint(7, 365)}
+        return "POST", "/pools/agg/batch", body
+
+    def export(path: str):
+        def gen(rng):
+            p = {"window": rng.choice(["day", "hour"]), "lookback": rng.randint(1, 90), "limit": 1000, **filters(rng)}
+            return "GET", f"{path}?{qs(p)}", None
+        return gen
+
+    def export_agg(rng):
+        p = {"pool_id": rng.choice(pool_ids), "window": "hour", "lookback": rng.randint(24, 24 * 90), "limit": 5000}
+        return "GET", f"/export/pool_agg.csv?{qs(p)}", None
+
+    # route label -> (weight, generator)
+    return {
+        "pools": (3, pools_list),
+        "top_fees_day": (3, top("/pools/top_fees", "day")),
+        "top_fees_hour": (2, top("/pools/top_fees", "hour")),
+        "top_volume_day": (2, top("/pools/top_volume", "day")),
+        "top_volume_hour": (1, top("/pools/top_volume", "hour")),
+        "pool_agg_day": (3, agg("day")),
+        "pool_agg_hour": (2, agg("hour")),
+        "pool_agg_batch": (1, batch),
+        "export_top_fees_csv": (0.5, export("/export/top_fees.csv")),
+        "export_top_volume_csv": (0.5, export("/export/top_volume.csv")),
+        "export_pool_agg_csv": (0.5, export_agg),
+    }
+
+async def discover(client: httpx.AsyncClient) -> Tuple[List[Dict], List[str]]:
+    pools: List[Dict] = []
+    cursor = None
+    while len(pools) < 2000:
+        r = await client.get("/pools", params={"page_size": 100, "total_mode": "none", **({"cursor": cursor} if cursor else {})})
+        r.raise_for_status()
+        body = r.json()
+        pools.extend(body["items"])
+        cursor = body.get("next_cursor")
+        if not cursor:
+            break
+    r = await client.get("/tokens", params={"page_size": 100, "total_mode": "none"})
+    r.raise_for_status()
+    symbols = [t["symbol"] for t in r.json()["items"] if t.get("symbol")]
+    return pools, symbols
+
+# ---------- runner ----------
+async def run_load(client: httpx.AsyncClient, mix, concurrency: int, duration: float, seed: int, warm: bool, only: Optional[List[str]]):
+    names = [n for n in mix if not only or n in only]
+    weights = [mix[n][0] for n in names]
+    fixed = {n: mix[n][1](random.Random(seed)) for n in names} if warm else None
+    lat: Dict[str, List[float]] = {n: [] for n in names}
+    errors: Dict[str, int] = {n: 0 for n in names}
+    nbytes: Dict[str, int] = {n: 0 for n in names}
+    deadline = time.perf_counter() + duration
+
+    async def worker(i: int):
+        rng = random.Random(seed * 1000 + i)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            method, path, body = fixed[name] if fixed else mix[name][1](rng)
+            t0 = time.perf_counter()
+            try:
+                r = await client.request(method, path, json=body)
+                size = len(r.content)
+                ok = r.status_code < 400
+            except httpx.HTTPError:
+                size, ok = 0, False
+            dt = time.perf_counter() - t0
+            if ok:
+                lat[name].append(dt)
+                nbytes[name] += size
+            else:
+                errors[name] += 1
+
+    t_start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - t_start
+
+    routes = {}
+    for n in names:
+        v = sorted(lat[n])
+        routes[n] = {
+            "requests": len(v), "errors": errors[n], "rps": round(len(v) / elapsed, 2),
+            "p50_ms": round(pct(v, 50) * 1000, 2), "p95_ms": round(pct(v, 95) * 1000, 2),
+            "p99_ms": round(pct(v, 99) * 1000, 2), "max_ms": round((v[-1] if v else 0) * 1000, 2),
+            "kb_per_req": round(nbytes[n] / len(v) / 1024, 1) if v else 0,
+        }
+    total = sum(r["requests"] for r in routes.values())
+    return {"elapsed_s": round(elapsed, 2), "requests": total, "rps": round(total / elapsed, 2), "routes": routes}
+
+def print_report(res: Dict):
+    print(f"{'route':<24}{'n':>7}{'err':>5}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'KB':>8}")
+    for n, r in res["routes"].items():
+        print(f"{n:<24}{r['requests']:>7}{r['errors']:>5}{r['rps']:>9.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+              f"{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}{r['kb_per_req']:>8.1f}")
+    print(f"total {res['requests']} requests in {res['elapsed_s']}s -> {res['rps']} req/s")
+
+def compare(res: Dict, base: Dict, tolerance: float, slack_ms: float) -> List[str]:
+    """Routes whose p50/p95 grew beyond tolerance (plus an absolute slack for tiny timings), or that now error."""
+    out = []
+    for n, r in res["routes"].items():
+        b = base.get("routes", {}).get(n)
+        if r["errors"]:
+            out.append(f"{n}: {r['errors']} failed requests")
+        if not b or not b.get("requests"):
+            continue
+        for k in ("p50_ms", "p95_ms"):
+            limit = b[k] * (1 + tolerance) + slack_ms
+            if r[k] > limit:
+                out.append(f"{n}: {k} {r[k]:.1f} > {limit:.1f} (baseline {b[k]:.1f})")
+    return out
+
+# ---------- server ----------
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "uvicorn", "backend.api.app:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    return subprocess.Popen(cmd, env={**os.environ})
+
+async def wait_ready(client: httpx.AsyncClient, proc: Optional[subprocess.Popen], timeout: float = 60.0):
+    t_end = time.time() + timeout
+    while time.time() < t_end:
+        if proc is not None and proc.poll() is not None:
+            raise SystemExit(f"ERROR: uvicorn exited with code {proc.returncode}")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit("ERROR: API did not become ready")
+
+async def main(args) -> int:
+    proc = None
+    base_url = args.url
+    if not base_url:
+        port = free_port()
+        proc = start_server(port, args.workers)
+        base_url = f"http://127.0.0.1:{port}"
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+            await wait_ready(client, proc)
+            pools, symbols = await discover(client)
+            if not pools:
+                print("ERROR: no pools in the database; seed it first (backend/tools/gen_synthetic.py)", file=sys.stderr)
+                return 2
+            dataset = (await client.get("/sync/status")).json().get("db", {})
+            mix = build_mix(pools, symbols)
+            only = args.routes.split(",") if args.routes else None
+
+            if args.warmup > 0:
+                await run_load(client, mix, args.concurrency, args.warmup, args.seed + 1, args.warm, only)
+            res = await run_load(client, mix, args.concurrency, args.duration, args.seed, args.warm, only)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    res["config"] = {"concurrency": args.concurrency, "duration_s": args.duration, "workers": args.workers,
+                     "warm": args.warm, "seed": args.seed}
+    res["dataset"] = dataset
+    print_report(res)
+    if args.out:
+        Path(args.out).write_text(json.dumps(res, indent=2), encoding="utf-8")
+    if args.write_baseline:
+        Path(args.write_baseline).write_text(json.dumps(res, indent=2), encoding="utf-8")
+        print(f"baseline written to {args.write_baseline}")
+    if args.baseline:
+        base = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if base.get("dataset") != dataset or base.get("config", {}).get("concurrency") != args.concurrency:
+            print("WARNING: dataset or concurrency differs from the baseline; comparison is indicative only")
+        regressions = compare(res, base, args.tolerance, args.slack_ms)
+        if regressions:
+            print("REGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("no regressions against baseline")
+    return 0
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Load-test the API and compare against a latency baseline")
+    ap.add_argument("--url", default=None, help="Benchmark a running API instead of booting one")
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn workers when booting the API")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--duration", type=float, default=20.0, help="Measured seconds")
+    ap.add_argument("--warmup", type=float, default=3.0, help="Unmeasured seconds before the run")
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--warm", action="store_true", help="One fixed parameter set per route (cache-hit path)")
+    ap.add_argument("--routes", default=None, help="Comma-separated route labels to run (default: all)")
+    ap.add_argument("--out", default=None, help="Write the JSON result here")
+    ap.add_argument("--baseline", default=None, help="Baseline JSON to compare against; exit 1 on regression")
+    ap.add_argument("--write-baseline", default=None, help="Write this run as the new baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative growth of p50/p95")
+    ap.add_argument("--slack-ms", type=float, default=2.0, help="Allowed absolute growth, for sub-ms routes")
+    return ap.parse_args()
+
+if __name__ == "__main__":
+    load_dotenv(ROOT / ".env", override=True)
+    if not os.environ.get("DATABASE_URL") and "--url" not in sys.argv:
+        print("ERROR: DATABASE_URL is not set", file=sys.stderr); sys.exit(2)
+    sys.exit(asyncio.run(main(parse_args())))
@@ -26,6 +26,17 @@ def post_query(url: str, query: str) -> dict:
     with urllib.request.urlopen(req, timeout=60) as resp:
         return json.loads(resp.read().decode("utf-8"))
 
+Q_META = "{ _meta { block { number } hasIndexingErrors } }"
+
+def fetch_meta(url: str) -> dict:
+    """{"block_number", "has_indexing_errors"} from the subgraph _meta (also polled by the API)."""
+    data = post_query(url, Q_META)
+    meta = (data.get("data") or {}).get("_meta") or {}
+    return {
+        "block_number": (meta.get("block") or {}).get("number"),
+        "has_indexing_errors": meta.get("hasIndexingErrors"),
+    }
+
 def main():
     load_dotenv(ENV_PATH, override=True)
     endpoint = os.environ.get("GRAPH_ENDPOINT")
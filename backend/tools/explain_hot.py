@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# Plan regression harness for the hot SQL paths. Runs a fixed set of representative API requests
+# in-process against DATABASE_URL (caches cleared before each), captures every named query the
+# endpoints execute (the exact statement and parameters), then runs EXPLAIN (ANALYZE, BUFFERS)
+# for each and flags:
+#   seq_scan  - sequential scan on a time-series table with at least --min-table-rows rows
+#   drift     - plan node whose row estimate is off by --drift-factor or more
+#   buffers   - shared buffers touched grew past --buffer-tolerance vs the compared recording
+#   plan      - plan shape (node types / relations / indexes) differs from the compared recording
+#
+#   python -m backend.tools.explain_hot --record plans/2024-06-01
+#   python -m backend.tools.explain_hot --compare plans/2024-06-01 --record plans/current
+#
+# Use a DB seeded at realistic scale (gen_synthetic.py); on a few thousand rows the planner
+# rightly prefers seq scans and the report says little.
+
+import os, sys, json, time, asyncio, argparse, statistics
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import asyncpg
+from dotenv import load_dotenv
+
+ROOT = Path("/Users/axel/Dev/open-source/uniswap-lp-analytics")
+
+SERIES_TABLES = {"pool_day_data", "pool_hour_data", "pool_price_hour"}
+FAIL_DEFAULT = "seq_scan,buffers"
+
+# label -> request; {big}/{small} are the pools with most/median hour rows, {symbol} a token symbol
+# of the busiest pool. "follow": request once, then capture the request for its next_cursor.
+CASES: List[Dict[str, Any]] = [
+    {"label": "top_fees_day_7", "path": "/pools/top_fees?window=day&lookback=7"},
+    {"label": "top_fees_day_30", "path": "/pools/top_fees?window=day&lookback=30"},
+    {"label": "top_fees_day_365", "path": "/pools/top_fees?window=day&lookback=365"},
+    {"label": "top_fees_day_30_symbol", "path": "/pools/top_fees?window=day&lookback=30&token_symbol={symbol}"},
+    {"label": "top_fees_day_30_v3", "path": "/pools/top_fees?window=day&lookback=30&version=3"},
+    {"label": "top_fees_day_30_estimate", "path": "/pools/top_fees?window=day&lookback=30&total_mode=estimate"},
+    {"label": "top_fees_day_30_cursor", "path": "/pools/top_fees?window=day&lookback=30&total_mode=none", "follow": True},
+    {"label": "top_fees_hour_24", "path": "/pools/top_fees?window=hour&lookback=24"},
+    {"label": "top_fees_hour_168", "path": "/pools/top_fees?window=hour&lookback=168"},
+    {"label": "top_fees_hour_720_symbol", "path": "/pools/top_fees?window=hour&lookback=720&token_symbol={symbol}"},
+    {"label": "top_volume_day_30", "path": "/pools/top_volume?window=day&lookback=30"},
+    {"label": "top_volume_day_30_token0", "path": "/pools/top_volume?window=day&lookback=30&side=token0&fee_min=3000"},
+    {"label": "top_volume_hour_168", "path": "/pools/top_volume?window=hour&lookback=168"},
+    {"label": "pool_agg_day_365_big", "path": "/pools/{big}/agg?window=day&lookback=365&limit=1000"},
+    {"label": "pool_agg_hour_168_big", "path": "/pools/{big}/agg?window=hour&lookback=168&limit=1000"},
+    {"label": "pool_agg_hour_720_small", "path": "/pools/{small}/agg?window=hour&lookback=720&limit=1000"},
+    {"label": "pool_agg_batch_day_90", "method": "POST", "path": "/pools/agg/batch",
+     "json": {"pool_ids": ["{big}", "{small}"], "window": "day", "lookback": 90}},
+    {"label": "export_top_fees_hour_168", "path": "/export/top_fees.csv?window=hour&lookback=168&limit=1000"},
+    {"label": "export_top_volume_day_90", "path": "/export/top_volume.csv?window=day&lookback=90&limit=1000"},
+    {"label": "export_pool_agg_hour_2160", "path": "/export/pool_agg.csv?pool_id={big}&window=hour&lookback=2160&limit=100000"},
+]
+
+def dsn_from_env() -> str:
+    return os.environ["DATABASE_URL"].replace("postgresql+asyncpg://", "postgresql://", 1)
+
+def _fill(v, subs: Dict[str, str]):
+    if isinstance(v, str):
+        return v.format(**subs)
+    if isinstance(v, list):
+        return [_fill(x, subs) for x in v]
+    if isinstance(v, dict):
+        return {k: _fill(x, subs) for k, x in v.items()}
+    return v
+
+# ---------- capture ----------
+def capture(subs: Dict[str, str], only: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """Run each case through the app and collect (case, query name, statement, parameters)."""
+    from sqlalchemy import event
+    from fastapi.testclient import TestClient
+    from backend.api import app as api
+    from backend.api.metrics import current_query
+
+    caches = [v for v in vars(api).values() if isinstance(v, api.TTLCache) and v is not api.cache_watermark]
+    hot = ("top_fees", "top_volume", "pool_agg", "export_")
+    seen: List[Tuple[str, str, tuple]] = []
+    recording = [False]
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        name = current_query.get()
+        if recording[0] and name and name.startswith(hot):
+            seen.append((name, statement, tuple(parameters or ())))
+
+    event.listen(api.engine.sync_engine, "before_cursor_execute", on_execute)
+    out = []
+    with TestClient(api.app) as client:
+        for case in CASES:
+            if only and case["label"] not in only:
+                continue
+            method = case.get("method", "GET")
+            path, body = _fill(case["path"], subs), _fill(case.get("json"), subs)
+            for c in caches:
+                c.clear()
+            if case.get("follow"):
+                r = client.request(method, path, json=body)
+                cursor = r.json().get("next_cursor")
+                if not cursor:
+                    print(f"skip {case['label']}: no next_cursor (too few pools)")
+                    continue
+                path += f"&cursor={cursor}"
+            del seen[:]
+            recording[0] = True
+            r = client.request(method, path, json=body)
+            recording[0] = False
+            if r.status_code >= 400:
+                print(f"skip {case['label']}: HTTP {r.status_code} {r.text[:200]}")
+                continue
+            uniq = {(name, stmt, repr(params)): (name, stmt, params) for name, stmt, params in seen}
+            for name, stmt, params in uniq.values():
+                # total_mode=estimate runs a plain EXPLAIN; analyze the statement under it
+                if stmt.lstrip().lower().startswith("explain (format json)"):
+                    stmt = stmt.lstrip()[len("explain (format json)"):]
+                out.append({"case": case["label"], "query": name, "sql": stmt, "params": list(params)})
+    event.remove(api.engine.sync_engine, "before_cursor_execute", on_execute)
+    return out
+
+# ---------- plan analysis ----------
+def _walk(node: Dict, depth: int = 0):
+    yield node, depth
+    for child in node.get("Plans", []):
+        yield from _walk(child, depth + 1)
+
+def signature(plan: Dict) -> List[str]:
+    return [f"{d}:{n['Node Type']}:{n.get('Relation Name', '')}:{n.get('Index Name', '')}" for n, d in _walk(plan)]
+
+def render(plan: Dict) -> str:
+    lines = []
+    for n, d in _walk(plan):
+        rel = f" on {n['Relation Name']}" if "Relation Name" in n else ""
+        idx = f" using {n['Index Name']}" if "Index Name" in n else ""
+        loops = n.get("Actual Loops", 1)
+        lines.append(f"{'  ' * d}{n['Node Type']}{rel}{idx}  rows est={n.get('Plan Rows')} act={n.get('Actual Rows')}x{loops}"
+                     f"  time={n.get('Actual Total Time')}ms  buf hit={n.get('Shared Hit Blocks', 0)} read={n.get('Shared Read Blocks', 0)}")
+    return "\n".join(lines)
+
+def analyze(plan: Dict, table_rows: Dict[str, float], args) -> Tuple[Dict[str, Any], List[str]]:
+    flags = []
+    seq = []
+    worst = (1.0, None)
+    for n, _ in _walk(plan):
+        rel = n.get("Relation Name")
+        if n["Node Type"] == "Seq Scan" and rel in SERIES_TABLES and table_rows.get(rel, 0) >= args.min_table_rows:
+            seq.append(rel)
+        est, act = n.get("Plan Rows", 0), n.get("Actual Rows", 0)
+        if max(est, act) >= args.drift_min_rows:
+            ratio = max(est, 1) / max(act, 1)
+            ratio = max(ratio, 1 / ratio)
+            if ratio > worst[0]:
+                worst = (ratio, f"{n['Node Type']}{' on ' + rel if rel else ''} est={est} act={act}")
+    if seq:
+        flags.append("seq_scan: " + ", ".join(sorted(set(seq))))
+    if worst[0] >= args.drift_factor:
+        flags.append(f"drift x{worst[0]:.0f}: {worst[1]}")
+    summary = {
+        "buffers": plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0),
+        "shared_read": plan.get("Shared Read Blocks", 0),
+        "rows": plan.get("Actual Rows"),
+        "max_drift": round(worst[0], 1),
+        "seq_scans": sorted(set(seq)),
+    }
+    return summary, flags
+
+def compare(rec: Dict, base: Dict, args) -> List[str]:
+    flags = []
+    b, c = base["summary"]["buffers"], rec["summary"]["buffers"]
+    if c > b * (1 + args.buffer_tolerance) + args.buffer_slack:
+        flags.append(f"buffers: {c} vs {b}")
+    if base["signature"] != rec["signature"]:
+        flags.append("plan: shape changed")
+    return flags
+
+def _fname(rec: Dict) -> str:
+    return f"{rec['case']}__{rec['query']}"
+
+async def explain_all(captured: List[Dict], args) -> List[Dict]:
+    conn = await asyncpg.connect(dsn_from_env())
+    try:
+        rows = await conn.fetch("select relname, reltuples from pg_class where relname = any($1::text[])", list(SERIES_TABLES))
+        table_rows = {r["relname"]: float(r["reltuples"]) for r in rows}
+        for rec in captured:
+            times = []
+            plan = None
+            async with conn.transaction(readonly=True):
+                for _ in range(args.repeat):
+                    raw = await conn.fetchval("explain (analyze, buffers, format json) " + rec["sql"], *rec["params"])
+                    doc = json.loads(raw) if isinstance(raw, str) else raw
+                    plan = doc[0]["Plan"]
+                    times.append(doc[0]["Execution Time"])
+            rec["exec_ms"] = round(statistics.median(times), 3)
+            rec["planning_ms"] = round(doc[0].get("Planning Time", 0), 3)
+            rec["summary"], rec["flags"] = analyze(plan, table_rows, args)
+            rec["signature"] = signature(plan)
+            rec["plan"] = plan
+    finally:
+        await conn.close()
+    return captured
+
+async def discover(args) -> Dict[str, str]:
+    conn = await asyncpg.connect(dsn_from_env())
+    try:
+        rows = await conn.fetch("select pool_id, count(*) as n from pool_hour_data group by pool_id order by n desc")
+        if not rows:
+            raise SystemExit("ERROR: pool_hour_data is empty; seed the DB first (backend/tools/gen_synthetic.py)")
+        big, small = rows[0]["pool_id"], rows[len(rows) // 2]["pool_id"]
+        symbol = await conn.fetchval("""
+          select t.symbol from pools p join tokens t on t.id in (p.token0_id, p.token1_id)
+          where p.id = $1 and t.symbol is not null order by t.symbol limit 1
+        """, big)
+    finally:
+        await conn.close()
+    return {"big": big, "small": small, "symbol": args.symbol or symbol or ""}
+
+def main():
+    ap = argparse.ArgumentParser(description="EXPLAIN (ANALYZE, BUFFERS) the hot API queries and flag plan regressions")
+    ap.add_argument("--record", default=None, help="Directory to write plans and summaries to")
+    ap.add_argument("--compare", default=None, help="Directory of a previous --record run to compare against")
+    ap.add_argument("--cases", default=None, help="Comma-separated case labels (default: all)")
+    ap.add_argument("--symbol", default=None, help="Token symbol for filtered cases (default: from the busiest pool)")
+    ap.add_argument("--repeat", type=int, default=3, help="EXPLAIN ANALYZE runs per query; median time is reported")
+    ap.add_argument("--min-table-rows", type=float, default=100000, help="Ignore seq scans on smaller series tables")
+    ap.add_argument("--drift-factor", type=float, default=10.0)
+    ap.add_argument("--drift-min-rows", type=int, default=1000)
+    ap.add_argument("--buffer-tolerance", type=float, default=0.5)
+    ap.add_argument("--buffer-slack", type=int, default=100, help="Blocks of growth always allowed")
+    ap.add_argument("--fail-on", default=FAIL_DEFAULT, help="Flag kinds that make the exit code 1")
+    args = ap.parse_args()
+
+    load_dotenv(ROOT / ".env", override=True)
+    if not os.environ.get("DATABASE_URL"):
+        print("ERROR: DATABASE_URL is not set", file=sys.stderr); sys.exit(2)
+
+    subs = asyncio.run(discover(args))
+    captured = capture(subs, args.cases.split(",") if args.cases else None)
+    records = asyncio.run(explain_all(captured, args))
+
+    if args.compare:
+        base_dir = Path(args.compare)
+        for rec in records:
+            f = base_dir / f"{_fname(rec)}.json"
+            if f.exists():
+                base = json.loads(f.read_text(encoding="utf-8"))
+                rec["flags"] += compare(rec, base, args)
+                rec["baseline"] = {"exec_ms": base["exec_ms"], "buffers": base["summary"]["buffers"]}
+            else:
+                rec["flags"].append("plan: no recording to compare")
+
+    if args.record:
+        out = Path(args.record)
+        out.mkdir(parents=True, exist_ok=True)
+        for rec in records:
+            (out / f"{_fname(rec)}.json").write_text(json.dumps(rec, indent=2, default=str), encoding="utf-8")
+            (out / f"{_fname(rec)}.txt").write_text(rec["sql"].strip() + "\n\n" + render(rec["plan"]) + "\n", encoding="utf-8")
+        (out / "meta.json").write_text(json.dumps({"recorded_at": int(time.time()), "subs": subs}, indent=2), encoding="utf-8")
+
+    fail_kinds = set(args.fail_on.split(",")) if args.fail_on else set()
+    failed = False
+    print(f"{'case':<30}{'query':<22}{'ms':>9}{'buffers':>9}{'drift':>7}  flags")
+    for rec in records:
+        s = rec["summary"]
+        prev = rec.get("baseline")
+        ms = f"{rec['exec_ms']:.1f}" + (f" ({prev['exec_ms']:.1f})" if prev else "")
+        print(f"{rec['case']:<30}{rec['query']:<22}{ms:>9}{s['buffers']:>9}{s['max_drift']:>7}  {'; '.join(rec['flags'])}")
+        if any(f.split(":")[0].split(" ")[0] in fail_kinds for f in rec["flags"]):
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
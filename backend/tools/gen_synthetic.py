@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# Fill tokens, pools, pool_day_data, pool_hour_data and pool_price_hour with synthetic history
+# for benchmarking at production scale. Volume follows a Zipf law over pools (a few pools
+# carry most of it) and small pools trade only in some hours, so row counts are skewed too.
+# Rows go in through COPY (asyncpg copy_records_to_table) over several connections.
+#
+#   python -m backend.tools.gen_synthetic --pools 5000 --years 3 --truncate --defer-indexes
+#   python -m backend.db.sync_state      # refresh the /sync/status snapshot afterwards
+#   python -m backend.db.candles         # and the OHLC rollups
+
+import os, sys, math, time, argparse, asyncio
+from pathlib import Path
+from typing import Dict, List, Tuple
+import numpy as np
+import asyncpg
+from dotenv import load_dotenv
+
+from backend.db.fees import fee_fraction
+from backend.db.notify import change_payloads, CHANNEL
+from backend.db.pairs import pair_key
+
+ROOT = Path("/Users/axel/Dev/open-source/uniswap-lp-analytics")
+
+SERIES_TABLES = ("pool_day_data", "pool_hour_data", "pool_price_hour")
+DAY_COLS = ("id", "pool_id", "date", "volume_token0", "volume_token1", "approx_fee_token0", "approx_fee_token1", "swap_count")
+HOUR_COLS = ("id", "pool_id", "hour_start_unix", "volume_token0", "volume_token1", "approx_fee_token0", "approx_fee_token1", "swap_count")
+PRICE_COLS = ("pool_id", "hour_start_unix", "sqrt_price_x96", "price0", "price1", "liquidity", "updated_at")
+
+# symbol, decimals, usd price
+MAJORS = [("WETH", 18, 3000.0), ("USDC", 6, 1.0), ("USDT", 6, 1.0), ("WBTC", 8, 60000.0), ("DAI", 18, 1.0)]
+# fee_tier_bps, tick_spacing (fee tier unit: backend/db/fees.py)
+FEE_TIERS = [(100, 1), (500, 10), (3000, 60), (10000, 200)]
+FEE_TIER_P = [0.1, 0.35, 0.4, 0.15]
+
+def dsn_from_env() -> str:
+    url = os.environ.get("DATABASE_URL")
+    if not url:
+        raise SystemExit("DATABASE_URL is not set in .env")
+    return url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+def make_tokens(rng: np.random.Generator, n: int) -> List[Dict]:
+    out = []
+    for i in range(n):
+        if i < len(MAJORS):
+            sym, dec, usd = MAJORS[i]
+        else:
+            sym, dec, usd = f"TKN{i}", int(rng.choice([6, 8, 18], p=[0.1, 0.1, 0.8])), float(rng.lognormal(0, 2))
+        addr = "0x" + rng.bytes(20).hex()
+        out.append({"id": addr, "address": addr, "symbol": sym, "name": sym, "decimals": dec, "usd": usd})
+    return out
+
+def make_pools(rng: np.random.Generator, tokens: List[Dict], n: int, v4_share: float, skew: float, first_hour: int, end_hour: int) -> List[Dict]:
+    # Pairs lean on the majors; creation times are uniform over the history window
+    tw = np.array([20.0 if i < len(MAJORS) else 1.0 for i in range(len(tokens))])
+    tw /= tw.sum()
+    out = []
+    for _ in range(n):
+        a, b = rng.choice(len(tokens), size=2, replace=False, p=tw)
+        t0, t1 = sorted((tokens[a], tokens[b]), key=lambda t: t["id"])
+        fee, tick = FEE_TIERS[rng.choice(len(FEE_TIERS), p=FEE_TIER_P)]
+        created_hour = int(rng.integers(first_hour, end_hour - 24))
+        out.append({
+            "id": "0x" + rng.bytes(20).hex(), "version": 4 if rng.random() < v4_share else 3, "chain_id": 1,
+            "t0": t0, "t1": t1, "fee_tier_bps": fee, "tick_spacing": tick,
+            "created_at_ts": created_hour * 3600 + int(rng.integers(0, 3600)), "created_hour": created_hour,
+        })
+    # Zipf weights by random rank: weight 1.0 for the busiest pool
+    ranks = rng.permutation(n) + 1
+    for p, r in zip(out, ranks):
+        p["weight"] = 1.0 / r ** skew
+    return out
+
+def pool_series(rng: np.random.Generator, pool: Dict, end_hour: int, args) -> Tuple[List[tuple], List[tuple], List[tuple]]:
+    """Hour, day and price rows for one pool; only hours with swaps produce rows."""
+    hours = np.arange(pool["created_hour"], end_hour, dtype=np.int64)
+    n = len(hours)
+    w = pool["weight"]
+    diurnal = 1.0 + 0.5 * np.sin(2 * np.pi * ((hours % 24) - 8) / 24)
+    p_active = min(1.0, args.activity * math.sqrt(w)) * diurnal / 1.5
+    active = rng.random(n) < p_active
+    hours = hours[active]
+    if not len(hours):
+        return [], [], []
+    m = len(hours)
+    diurnal = diurnal[active]
+
+    # Log-price random walk (token1 per token0) and USD volume
+    t0, t1 = pool["t0"], pool["t1"]
+    drift = rng.normal(0, args.hourly_vol, m).cumsum()
+    price0 = (t0["usd"] / t1["usd"]) * np.exp(drift)
+    usd0 = t0["usd"] * np.exp(drift)
+    vol_usd = args.top_hourly_usd * w * rng.lognormal(0, 1.0, m) * diurnal
+    v0 = vol_usd / usd0
+    v1 = vol_usd / t1["usd"]
+    fee = fee_fraction(pool["fee_tier_bps"])
+    swaps = rng.poisson(1 + 400 * w * diurnal).astype(np.int64)
+    sqrt_x96 = np.sqrt(price0 * 10.0 ** (t1["decimals"] - t0["decimals"])) * 2.0 ** 96
+    liquidity = args.top_hourly_usd * 50 * w * rng.lognormal(0, 0.3, m) * 1e6
+    updated = hours * 3600 + rng.integers(0, 3600, m)
+
+    pid = pool["id"]
+    hs = hours.tolist()
+    v0l, v1l, sw = v0.tolist(), v1.tolist(), swaps.tolist()
+    hour_rows = [(f"{pid}-{h}", pid, h, a, b, a * fee, b * fee, s) for h, a, b, s in zip(hs, v0l, v1l, sw)]
+    price_rows = [(pid, h, int(q), p, 1.0 / p, int(l), u)
+                  for h, q, p, l, u in zip(hs, sqrt_x96.tolist(), price0.tolist(), liquidity.tolist(), updated.tolist())]
+
+    days = hours // 24
+    uniq, inv = np.unique(days, return_inverse=True)
+    d0 = np.bincount(inv, weights=v0).tolist()
+    d1 = np.bincount(inv, weights=v1).tolist()
+    dsw = np.bincount(inv, weights=swaps).astype(np.int64).tolist()
+    day_rows = [(f"{pid}-{d}", pid, d, a, b, a * fee, b * fee, s) for d, a, b, s in zip(uniq.tolist(), d0, d1, dsw)]
+    return hour_rows, day_rows, price_rows
+
+async def deferred_indexes(conn) -> List[Tuple[str, str]]:
+    """Secondary indexes on the series tables (not backing a constraint): name, definition."""
+    rows = await conn.fetch("""
+      select i.indexname, i.indexdef
+      from pg_indexes i
+      where i.schemaname = current_schema() and i.tablename = any($1::text[])
+        and not exists (select 1 from pg_constraint c where c.conname = i.indexname)
+    """, list(SERIES_TABLES))
+    return [(r["indexname"], r["indexdef"]) for r in rows]
+
+async def copy_worker(pool: asyncpg.Pool, queue: asyncio.Queue, stats: Dict[str, int]):
+    async with pool.acquire() as conn:
+        await conn.execute("set synchronous_commit = off")
+        while True:
+            item = await queue.get()
+            if item is None:
+                queue.task_done()
+                return
+            table, cols, records = item
+            await conn.copy_records_to_table(table, records=records, columns=cols)
+            stats[table] = stats.get(table, 0) + len(records)
+            queue.task_done()
+
+async def main(args):
+    load_dotenv(ROOT / ".env", override=True)
+    rng = np.random.default_rng(args.seed)
+    end_hour = int(args.end_hour if args.end_hour is not None else time.time() // 3600)
+    first_hour = end_hour - int(args.years * 365 * 24)
+
+    db = await asyncpg.create_pool(dsn_from_env(), min_size=args.jobs, max_size=args.jobs)
+    async with db.acquire() as conn:
+        if args.truncate:
+            await conn.execute("truncate tokens, pools cascade")
+        dropped = await deferred_indexes(conn) if args.defer_indexes else []
+        for name, _ in dropped:
+            await conn.execute(f'drop index if exists "{name}"')
+
+    t_start = time.perf_counter()
+    tokens = make_tokens(rng, args.tokens)
+    pools = make_pools(rng, tokens, args.pools, args.v4_share, args.skew, first_hour, end_hour)
+    async with db.acquire() as conn:
+        await conn.copy_records_to_table("tokens", columns=("id", "address", "symbol", "name", "decimals", "chain_id", "created_at_ts"),
+            records=[(t["id"], t["address"], t["symbol"], t["name"], t["decimals"], 1, first_hour * 3600) for t in tokens])
+        await conn.copy_records_to_table("pools", columns=("id", "version", "chain_id", "token0_id", "token1_id", "fee_tier_bps", "tick_spacing", "created_at_ts", "pair_key"),
+            records=[(p["id"], p["version"], 1, p["t0"]["id"], p["t1"]["id"], p["fee_tier_bps"], p["tick_spacing"], p["created_at_ts"],
+                      pair_key(p["t0"]["id"], p["t1"]["id"])) for p in pools])
+
+    stats: Dict[str, int] = {}
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.jobs * 2)
+    workers = [asyncio.create_task(copy_worker(db, queue, stats)) for _ in range(args.jobs)]
+    buf: Dict[str, List[tuple]] = {t: [] for t in SERIES_TABLES}
+    cols = {"pool_day_data": DAY_COLS, "pool_hour_data": HOUR_COLS, "pool_price_hour": PRICE_COLS}
+
+    async def flush(table: str, force: bool = False):
+        if buf[table] and (force or len(buf[table]) >= args.batch_rows):
+            await queue.put((table, cols[table], buf[table]))
+            buf[table] = []
+
+    for i, p in enumerate(pools, 1):
+        hour_rows, day_rows, price_rows = pool_series(rng, p, end_hour, args)
+        buf["pool_hour_data"].extend(hour_rows)
+        buf["pool_day_data"].extend(day_rows)
+        if not args.skip_price:
+            buf["pool_price_hour"].extend(price_rows)
+        for t in SERIES_TABLES:
+            await flush(t)
+        if i % 100 == 0 or i == len(pools):
+            done = sum(stats.values())
+            print(f"[{i}/{len(pools)}] rows copied {done:,} ({done / (time.perf_counter() - t_start):,.0f}/s)", flush=True)
+    for t in SERIES_TABLES:
+        await flush(t, force=True)
+    for _ in workers:
+        await queue.put(None)
+    await asyncio.gather(*workers)
+
+    async with db.acquire() as conn:
+        for name, ddl in dropped:
+            print(f"recreating {name}", flush=True)
+            await conn.execute(ddl)
+        await conn.execute("analyze tokens, pools, pool_day_data, pool_hour_data, pool_price_hour")
+        # Let running APIs drop caches and reload the metadata index
+        for table in ("pools",) + SERIES_TABLES:
+            for payload in change_payloads(table, []):
+                await conn.execute("select pg_notify($1, $2)", CHANNEL, payload)
+    await db.close()
+
+    took = time.perf_counter() - t_start
+    print(f"tokens={len(tokens)} pools={len(pools)} " + " ".join(f"{t}={n:,}" for t, n in sorted(stats.items())) + f" in {took:.1f}s")
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Generate synthetic LP analytics data")
+    ap.add_argument("--pools", type=int, default=1000)
+    ap.add_argument("--tokens", type=int, default=200)
+    ap.add_argument("--years", type=float, default=2.0)
+    ap.add_argument("--end-hour", type=int, default=None, help="Last hour id (unix/3600), default now")
+    ap.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of pool volume by rank")
+    ap.add_argument("--activity", type=float, default=1.0, help="Share of hours with swaps for the busiest pool")
+    ap.add_argument("--top-hourly-usd", type=float, default=5e6, help="Mean hourly USD volume of the busiest pool")
+    ap.add_argument("--hourly-vol", type=float, default=0.006, help="Std dev of hourly log-price moves")
+    ap.add_argument("--v4-share", type=float, default=0.3)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--jobs", type=int, default=4, help="Parallel COPY connections")
+    ap.add_argument("--batch-rows", type=int, default=100000)
+    ap.add_argument("--skip-price", action="store_true", help="Do not generate pool_price_hour")
+    ap.add_argument("--truncate", action="store_true", help="Empty tokens/pools (and everything referencing them) first")
+    ap.add_argument("--defer-indexes", action="store_true", help="Drop secondary indexes on series tables during load")
+    return ap.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.tokens < len(MAJORS) or args.pools < 1:
+        print("ERROR: need at least 5 tokens and 1 pool", file=sys.stderr); sys.exit(2)
+    asyncio.run(main(args))